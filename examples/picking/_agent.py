@@ -109,68 +109,91 @@ class DqnAgent(Agent):
             q = q.numpy()
         assert q.shape[0] == 1
         assert q.shape[1] == A
-        actions_select = np.argsort(q[0].reshape(A * 2))[::-1]
+        q = q[0]
+
+        # feasibility of all the actions in a batch
+        mask, js = env.validate_actions()
+        is_last = env.i == env.episode_length - 1
 
         if deterministic:
-            for action in actions_select:
-                a = action // 2
-                if env.i == env.episode_length - 1:
-                    t = 1
-                else:
-                    t = action % 2
-                act_result = ActResult(action=(a, t))
-                j = env.validate_action(act_result)
-                if j is not None:
-                    act_result.j = j
-                    break
+            is_random = False
+        else:
+            self._epsilon = epsilon = self._get_epsilon(step)
+            is_random = np.random.random() < epsilon
+
+        if is_random:
+            if is_last:
+                t = 1
             else:
-                action = actions_select[0]
-                a = action // 2
-                if env.i == env.episode_length - 1:
-                    t = 1
-                else:
-                    t = action % 2
-                act_result = ActResult(action=(a, t))
+                t = np.random.choice(
+                    [0, 1],
+                    p=[
+                        1 - 1 / env.episode_length,
+                        1 / env.episode_length,
+                    ],
+                )
+            if mask.any():
+                a = np.random.choice(np.where(mask)[0])
+            else:
+                a = np.random.randint(A)
         else:
+            # masked argmax, or argmax if none of the actions is valid
+            if mask.any():
+                q = np.where(mask[:, None], q, -np.inf)
+            a, t = np.unravel_index(np.argmax(q), q.shape)
+            if is_last:
+                t = 1
+
+        act_result = ActResult(action=(int(a), int(t)))
+        act_result.j = js[a] if mask[a] else None
+        return act_result
+
+    def act_batch(self, step, observation, deterministic, env):
+        # ranked (action, terminate) candidates of each env of
+        # VecPickFromPileEnv, which executes the first valid one
+        device = next(self.q.parameters()).device
+        obs = {}
+        for key in observation:
+            obs[key] = torch.as_tensor(observation[key], device=device)
+
+        A = len(env.actions)
+
+        with torch.no_grad():
+            q = self.q(obs)
+            q = q.cpu().numpy()
+        assert q.shape[0] == env.num_envs
+        assert q.shape[1] == A
+        actions_select = np.argsort(q.reshape(-1, A * 2), axis=1)[:, ::-1]
+
+        if not deterministic:
             self._epsilon = epsilon = self._get_epsilon(step)
-            if np.random.random() < epsilon:
-                if env.i == env.episode_length - 1:
-                    t = 1
+
+        candidates = []
+        for i in range(env.num_envs):
+            is_last = env.i[i] == env.episode_length - 1
+            if deterministic or np.random.random() >= epsilon:
+                a = actions_select[i] // 2
+                if is_last:
+                    t = np.ones_like(a)
                 else:
-                    t = np.random.choice(
-                        [0, 1],
-                        p=[
-                            1 - 1 / env.episode_length,
-                            1 / env.episode_length,
-                        ],
-                    )
-                for a in np.random.permutation(A):
-                    act_result = ActResult(action=(a, t))
-                    j = env.validate_action(act_result)
-                    if j is not None:
-                        act_result.j = j
-                        break
+                    t = actions_select[i] % 2
             else:
-                for action in actions_select:
-                    a = action // 2
-                    if env.i == env.episode_length - 1:
-                        t = 1
-                    else:
-                        t = action % 2
-                    act_result = ActResult(action=(a, t))
-                    j = env.validate_action(act_result)
-                    if j is not None:
-                        act_result.j = j
-                        break
+                a = np.random.permutation(A)
+                if is_last:
+                    t = np.ones_like(a)
                 else:
-                    action = actions_select[0]
-                    a = action // 2
-                    if env.i == env.episode_length - 1:
-                        t = 1
-                    else:
-                        t = action % 2
-                    act_result = ActResult(action=(a, t))
-        return act_result
+                    t = np.full_like(
+                        a,
+                        np.random.choice(
+                            [0, 1],
+                            p=[
+                                1 - 1 / env.episode_length,
+                                1 / env.episode_length,
+                            ],
+                        ),
+                    )
+            candidates.append(np.stack([a, t], axis=1))
+        return candidates
 
     def _get_epsilon(self, step):
         epsilon_init = 1
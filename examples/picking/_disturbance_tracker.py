@@ -0,0 +1,57 @@
+import numpy as np
+import pybullet as p
+
+
+class DisturbanceTracker:
+    def __init__(self, object_ids, physicsClientId=0):
+        self.object_ids = list(object_ids)
+        self.physicsClientId = physicsClientId
+
+        num_objects = len(self.object_ids)
+        self.translations = np.zeros(num_objects)
+        self.max_velocities = np.zeros(num_objects)
+
+        # preallocated buffers, where the positions of the previous and
+        # current steps are swapped
+        self._positions = np.zeros((num_objects, 3))
+        self._positions_prev = np.zeros((num_objects, 3))
+        self._velocities = np.zeros((num_objects, 3))
+        self._deltas = np.zeros((num_objects, 3))
+        self._norms = np.zeros(num_objects)
+
+        self._read_states()
+
+    def _read_states(self):
+        for i, object_id in enumerate(self.object_ids):
+            self._positions[i] = p.getBasePositionAndOrientation(
+                object_id, physicsClientId=self.physicsClientId
+            )[0]
+            self._velocities[i] = p.getBaseVelocity(
+                object_id, physicsClientId=self.physicsClientId
+            )[0]
+
+    def _get_norms(self, vectors):
+        np.einsum("ij,ij->i", vectors, vectors, out=self._norms)
+        return np.sqrt(self._norms, out=self._norms)
+
+    def step(self):
+        # this function must be called after p.stepSimulation()
+        self._positions, self._positions_prev = (
+            self._positions_prev,
+            self._positions,
+        )
+        self._read_states()
+
+        np.subtract(self._positions, self._positions_prev, out=self._deltas)
+        self.translations += self._get_norms(self._deltas)
+        np.maximum(
+            self.max_velocities,
+            self._get_norms(self._velocities),
+            out=self.max_velocities,
+        )
+
+    def get_translations(self):
+        return dict(zip(self.object_ids, self.translations.tolist()))
+
+    def get_max_velocities(self):
+        return dict(zip(self.object_ids, self.max_velocities.tolist()))
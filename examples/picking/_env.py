@@ -3,6 +3,8 @@
 import collections
 import copy
 import itertools
+import json
+import os
 import pickle
 import time
 
@@ -11,6 +13,7 @@ from loguru import logger
 import numpy as np
 import path
 import pybullet as p
+import pybullet_data
 import pybullet_planning as pp
 import trimesh
 
@@ -20,8 +23,13 @@ from yarr.utils.transition import Transition
 
 import safepicking
 
+from safepicking.examples.picking._disturbance_tracker import (
+    DisturbanceTracker,
+)
 from safepicking.examples.picking._get_heightmap import get_heightmap
+from safepicking.examples.picking._reset_cache import ResetCache
 from safepicking.examples.picking import _utils
+from safepicking.utils import profiler
 
 
 home = path.Path("~").expanduser()
@@ -43,6 +51,8 @@ class PickFromPileEnv(Env):
     DP = 0.05
     DR = np.deg2rad(22.5)
 
+    PROFILE_SUMMARY_INTERVAL = 10
+
     def __init__(
         self,
         gui=True,
@@ -54,6 +64,12 @@ class PickFromPileEnv(Env):
         pose_noise=0,
         miss=0,
         raise_on_timeout=False,
+        reset_cache_dir=None,
+        incremental_reset=False,
+        profile=False,
+        trace_dir=None,
+        validate_obs=False,
+        action_ik_method="iterative",
     ):
         super().__init__()
 
@@ -66,9 +82,40 @@ class PickFromPileEnv(Env):
         self._pose_noise = pose_noise
         self._miss = miss
         self._raise_on_timeout = raise_on_timeout
+        self._incremental_reset = incremental_reset
+        self._validate_obs = validate_obs
+        # "iterative" (one skrobot solve per action, with which the models
+        # are trained and evaluated) or "batch" (solve_ik_batch() of all the
+        # actions, which is faster but finds different solutions)
+        if action_ik_method not in ["iterative", "batch"]:
+            raise ValueError(
+                f"unsupported action_ik_method: {action_ik_method}"
+            )
+        self._action_ik_method = action_ik_method
+        self._profile = profile or trace_dir is not None
+        self._trace_dir = None if trace_dir is None else path.Path(trace_dir)
+        self._num_episodes = 0
+
+        if self._profile:
+            profiler.enabled = True
+        if self._trace_dir is not None:
+            self._trace_dir.makedirs_p()
+            profiler.trace = True
+
+        if reset_cache_dir is None:
+            self._reset_cache = None
+        else:
+            self._reset_cache = ResetCache(reset_cache_dir)
 
+        # each env owns a physics client, so multiple envs can run
+        # independently in a process
+        self.physicsClientId = None
         self.plane = None
         self.ri = None
+        self._debug_items = []
+        self._grasps = {}
+        self._manifest = None
+        self._action_cache = None
 
         dxs = [-self.DP, 0, self.DP]
         dys = [-self.DP, 0, self.DP]
@@ -162,42 +209,280 @@ class PickFromPileEnv(Env):
     # -------------------------------------------------------------------------
 
     def shutdown(self):
-        pp.disconnect()
+        if self._profile:
+            logger.info(
+                f"Profile of {self._num_episodes} episodes:\n"
+                + profiler.summary()
+            )
+        if self.physicsClientId is not None:
+            p.disconnect(physicsClientId=self.physicsClientId)
+            self.physicsClientId = None
 
     def launch(self):
         pass
 
+    @profiler.profile
     def reset(self, random_state=None, pile_file=None):
         raise_on_failure = random_state is not None or pile_file is not None
 
         if random_state is None:
             random_state = np.random.RandomState()
+        random_state_init = random_state.get_state()
+        manifest = self._load_manifest()
         if pile_file is None:
-            if self.eval:
-                i = random_state.randint(9000, 10000)
+            if manifest:
+                piles = manifest["eval" if self.eval else "train"]
+                pile = piles[random_state.randint(len(piles))]
+                pile_file = self.PILES_DIR / f"{pile}.pkl"
+            else:
+                if self.eval:
+                    i = random_state.randint(9000, 10000)
+                else:
+                    i = random_state.randint(0, 9000)
+                pile_file = self.PILES_DIR / f"{i:08d}.pkl"
+
+        self._connect()
+
+        if self._incremental_reset and self.ri is not None:
+            self._remove_pile()
+        else:
+            self._init_world()
+
+        with open(pile_file, "rb") as f:
+            data = pickle.load(f)
+
+        pile = path.Path(pile_file).stem
+        if manifest and pile in manifest["piles"]:
+            target_indices = np.array(
+                manifest["piles"][pile]["valid_targets"], dtype=int
+            )
+            if target_indices.size == 0:
+                if raise_on_failure:
+                    raise RuntimeError("no valid target is found")
+                else:
+                    return self.reset()
+        else:
+            target_indices = self.get_target_indices(data)
+            if target_indices.size == 0:
+                if raise_on_failure:
+                    raise RuntimeError("no partially occluded object is found")
+                else:
+                    return self.reset()
+        target_index = random_state.choice(target_indices)
+
+        if self._reset_cache is None:
+            reset_cache_key = None
+        else:
+            reset_cache_key = self._reset_cache.get_key(
+                pile_file=pile_file,
+                random_state=random_state_init,
+                target_index=int(target_index),
+                pose_noise=self._pose_noise,
+                miss=self._miss,
+                pile_center=self.PILE_CENTER.tolist(),
+                heightmap_pixel_size=self.HEIGHTMAP_PIXEL_SIZE,
+                heightmap_image_size=self.HEIGHTMAP_IMAGE_SIZE,
+            )
+            cached = self._reset_cache.load(reset_cache_key)
+            if cached is not None:
+                self._reset_from_cache(data, cached)
+                random_state.set_state(cached["random_state"])
+                return self._init_episode()
+
+        lock_renderer = safepicking.pybullet.LockRenderer(
+            physicsClientId=self.physicsClientId
+        )
+
+        object_ids, collision_ids = self._load_pile(data, target_index)
+        target_object_id = object_ids[target_index]
+
+        if self._is_colliding_with_robot(object_ids):
+            lock_renderer.restore()
+            if raise_on_failure:
+                raise RuntimeError("object is colliding with robot")
             else:
-                i = random_state.randint(0, 9000)
-            pile_file = self.PILES_DIR / f"{i:08d}.pkl"
+                return self.reset()
 
-        if not pp.is_connected():
-            pp.connect(use_gui=self._gui, mp4=self._mp4)
-            pp.add_data_path()
+        capture = self._capture_target(
+            object_ids, collision_ids, target_object_id
+        )
 
-        p.resetSimulation()
-        p.setGravity(0, 0, -9.8)
+        lock_renderer.restore()
+
+        if capture is None:
+            if raise_on_failure:
+                raise RuntimeError("IK failed to capture object")
+            else:
+                return self.reset()
+        rgb = capture["rgb"]
+        pcd_in_world = capture["pcd_in_world"]
+        segm = capture["segm"]
+
+        # grasping
+        grasps = self._load_grasps(pile_file, target_index)
+        if grasps is None:
+            obstacles = [self.plane] + object_ids
+            obstacles.remove(target_object_id)
+            for index in random_state.permutation(
+                capture["grasp_poses"].shape[0]
+            )[:10]:
+                j = self._solve_grasp(
+                    capture["grasp_poses"][index], obstacles=obstacles
+                )
+                if j is not None:
+                    break
+            else:
+                j = None
+        elif grasps["js"].shape[0] > 0:
+            j = grasps["js"][random_state.randint(grasps["js"].shape[0])]
+        else:
+            j = None
+
+        if j is None:
+            if raise_on_failure:
+                raise RuntimeError("Unable to grasp the target object")
+            else:
+                return self.reset()
+        self.ri.setj(j)
+
+        with profiler.section("PickFromPileEnv.approach_grasp"):
+            time_step = safepicking.pybullet.get_time_step(
+                physicsClientId=self.physicsClientId
+            )
+            for _ in self.ri.movej(j):
+                p.stepSimulation(physicsClientId=self.physicsClientId)
+                time.sleep(time_step)
+
+            try:
+                for _ in self.ri.grasp(rotation_axis=True):
+                    p.stepSimulation(physicsClientId=self.physicsClientId)
+                    time.sleep(time_step)
+            except RuntimeError:
+                if raise_on_failure:
+                    raise
+                else:
+                    return self.reset()
+
+        if not self.ri.gripper.check_grasp():
+            if raise_on_failure:
+                raise RuntimeError("Unable to grasp the target object")
+            else:
+                return self.reset()
+
+        self.object_ids = object_ids
+        self.object_visibilities = data["visibility"]
+        self.target_object_id = target_object_id
+        self.target_object_class = data["class_id"][target_index]
+        self.target_object_visibility = data["visibility"][target_index]
+        self._set_object_labels(data["class_id"])
+
+        self.object_state = self.get_object_state(
+            pose_miss=self._miss,
+            pose_noise=self._pose_noise,
+            random_state=random_state,
+        )
+
+        self.ee_pose_init = np.hstack(self.ri.get_pose("tipLink")).astype(
+            np.float32
+        )
+        self.visual_state = self.get_visual_state(
+            rgb=rgb,
+            pcd_in_world=pcd_in_world,
+            segm=segm,
+        )
+
+        if reset_cache_key is not None:
+            constraint_info = p.getConstraintInfo(
+                self.ri.gripper.contact_constraint,
+                physicsClientId=self.physicsClientId,
+            )
+            self._reset_cache.save(
+                reset_cache_key,
+                dict(
+                    target_index=target_index,
+                    object_poses=[
+                        p.getBasePositionAndOrientation(
+                            o, physicsClientId=self.physicsClientId
+                        )
+                        for o in object_ids
+                    ],
+                    object_velocities=[
+                        p.getBaseVelocity(
+                            o, physicsClientId=self.physicsClientId
+                        )
+                        for o in object_ids
+                    ],
+                    robot_joint_states=[
+                        state[:2]
+                        for state in p.getJointStates(
+                            self.ri.robot,
+                            range(
+                                p.getNumJoints(
+                                    self.ri.robot,
+                                    physicsClientId=self.physicsClientId,
+                                )
+                            ),
+                            physicsClientId=self.physicsClientId,
+                        )
+                    ],
+                    object_state=self.object_state,
+                    visual_state=self.visual_state,
+                    ee_pose_init=self.ee_pose_init,
+                    grasp=dict(
+                        object_index=object_ids.index(constraint_info[2]),
+                        obj_link=constraint_info[3],
+                        obj_to_ee=(constraint_info[6], constraint_info[8]),
+                        grasp_point_on_obj=self.ri.gripper.grasp_point_on_obj,
+                        grasp_point_on_ee=self.ri.gripper.grasp_point_on_ee,
+                    ),
+                    random_state=random_state.get_state(),
+                ),
+            )
+
+        return self._init_episode()
+
+    def _connect(self):
+        if self.physicsClientId is not None and p.isConnected(
+            self.physicsClientId
+        ):
+            return
+        self.physicsClientId = pp.connect(use_gui=self._gui, mp4=self._mp4)
+        p.setAdditionalSearchPath(
+            pybullet_data.getDataPath(), physicsClientId=self.physicsClientId
+        )
+        self.ri = None
+
+    @staticmethod
+    def get_target_indices(data):
+        # partially occluded objects
+        is_partially_occluded = (0.2 < data["visibility"]) & (
+            data["visibility"] < 0.9
+        )
+        return np.where(is_partially_occluded)[0]
+
+    @profiler.profile
+    def _init_world(self):
+        safepicking.pybullet.reset_simulation(
+            physicsClientId=self.physicsClientId
+        )
+        p.setGravity(0, 0, -9.8, physicsClientId=self.physicsClientId)
         p.resetDebugVisualizerCamera(
             cameraDistance=1.5,
             cameraYaw=90,
             cameraPitch=-60,
             cameraTargetPosition=(0, 0, 0),
+            physicsClientId=self.physicsClientId,
+        )
+        self.plane = p.loadURDF(
+            "plane.urdf", physicsClientId=self.physicsClientId
         )
-        self.plane = p.loadURDF("plane.urdf")
 
         self.ri = safepicking.pybullet.PandaRobotInterface(
             suction_max_force=None,
             suction_surface_threshold=np.deg2rad(20),
             suction_surface_alignment=False,
             planner="RRTConnect",
+            physicsClientId=self.physicsClientId,
         )
         c_cam_to_ee = safepicking.geometry.Coordinate()
         c_cam_to_ee.translate([0, -0.05, -0.1])
@@ -207,85 +492,105 @@ class PickFromPileEnv(Env):
             width=320,
         )
 
-        with open(pile_file, "rb") as f:
-            data = pickle.load(f)
+        self._debug_items = []
 
-        is_partially_occluded = (0.2 < data["visibility"]) & (
-            data["visibility"] < 0.9
-        )
-        if is_partially_occluded.sum() == 0:
-            if raise_on_failure:
-                raise RuntimeError("no partially occluded object is found")
-            else:
-                return self.reset()
-        else:
-            target_index = random_state.choice(
-                np.where(is_partially_occluded)[0]
+    @profiler.profile
+    def _remove_pile(self):
+        # keep the plane, robot and camera, and remove everything else
+        if self.ri.gripper.activated:
+            self.ri.ungrasp()
+        for body in safepicking.pybullet.get_body_unique_ids(
+            physicsClientId=self.physicsClientId
+        ):
+            if body in [self.plane, self.ri.robot]:
+                continue
+            p.removeBody(body, physicsClientId=self.physicsClientId)
+        for debug_item in self._debug_items:
+            p.removeUserDebugItem(
+                debug_item, physicsClientId=self.physicsClientId
             )
+        self._debug_items = []
+
+        self.ri.setj(self.ri.homej)
+        p.setJointMotorControlArray(
+            bodyIndex=self.ri.robot,
+            jointIndices=self.ri.joints,
+            controlMode=p.POSITION_CONTROL,
+            targetPositions=self.ri.homej,
+            physicsClientId=self.physicsClientId,
+        )
 
-        lock_renderer = pp.LockRenderer()
-
-        num_instances = len(data["class_id"])
-        object_ids = []
-        collision_ids = []
-        for i in range(num_instances):
-            class_id = data["class_id"][i]
-            position = data["position"][i]
-            quaternion = data["quaternion"][i]
-
-            position += self.PILE_CENTER
+    def _create_object(self, data, index, is_target=False):
+        class_id = data["class_id"][index]
+        position = data["position"][index] + self.PILE_CENTER
+        quaternion = data["quaternion"][index]
 
-            visual_file = safepicking.datasets.ycb.get_visual_file(
-                class_id=class_id
-            )
-            collision_file = safepicking.pybullet.get_collision_file(
-                visual_file
+        visual_file = safepicking.datasets.ycb.get_visual_file(
+            class_id=class_id
+        )
+        collision_file = safepicking.pybullet.get_collision_file(visual_file)
+
+        object_id = safepicking.pybullet.create_mesh_body(
+            visual_file=visual_file,
+            # visual_file=collision_file,
+            collision_file=collision_file,
+            mass=safepicking.datasets.ycb.masses[class_id],
+            position=position,
+            quaternion=quaternion,
+            reuse_shapes=True,
+            physicsClientId=self.physicsClientId,
+        )
+        if is_target:
+            self._debug_items += safepicking.pybullet.draw_aabb(
+                trimesh.load(visual_file).bounds,
+                parent=object_id,
+                color=(0, 1, 0, 1),
+                width=2,
+                physicsClientId=self.physicsClientId,
             )
+        return object_id
 
-            object_id = safepicking.pybullet.create_mesh_body(
-                visual_file=visual_file,
-                # visual_file=collision_file,
-                collision_file=collision_file,
-                mass=safepicking.datasets.ycb.masses[class_id],
-                position=position,
-                quaternion=quaternion,
+    @profiler.profile
+    def _load_pile(self, data, target_index):
+        object_ids = []
+        collision_ids = []
+        for i in range(len(data["class_id"])):
+            object_id = self._create_object(
+                data, index=i, is_target=i == target_index
             )
+            collision_file = p.getUserData(
+                p.getUserDataId(
+                    object_id,
+                    "collision_file",
+                    physicsClientId=self.physicsClientId,
+                ),
+                physicsClientId=self.physicsClientId,
+            ).decode()
             collision_id = safepicking.pybullet.create_mesh_body(
                 visual_file=collision_file,
                 position=(0, 0, 10),
+                reuse_shapes=True,
+                physicsClientId=self.physicsClientId,
             )
-            if i == target_index:
-                pp.draw_aabb(
-                    trimesh.load(visual_file).bounds,
-                    parent=object_id,
-                    color=(0, 1, 0, 1),
-                    width=2,
-                )
 
             object_ids.append(object_id)
             collision_ids.append(collision_id)
-        target_object_id = object_ids[target_index]
+        return object_ids, collision_ids
 
+    @profiler.profile
+    def _is_colliding_with_robot(self, object_ids):
         for object_id in object_ids:
             if safepicking.pybullet.is_colliding(
-                object_id, ids2=[self.ri.robot]
+                object_id,
+                ids2=[self.ri.robot],
+                physicsClientId=self.physicsClientId,
             ):
-                if raise_on_failure:
-                    raise RuntimeError("object is colliding with robot")
-                else:
-                    return self.reset()
-
-        # for _ in range(240):
-        #     pp.step_simulation()
+                return True
+        return False
 
-        object_poses = []
-        for object_id, collision_id in zip(object_ids, collision_ids):
-            object_pose = pp.get_pose(object_id)
-            object_poses.append(object_pose)
-            pp.set_pose(collision_id, object_pose)
-            pp.set_pose(object_id, ((0, 0, 10), (0, 0, 0, 1)))
-
-        # get centroid of the target object's visible surface
+    @profiler.profile
+    def _get_visible_centroid(self, object_ids, target_object_id):
+        # z-buffer of the object surface points instead of a camera render
         fovy = np.deg2rad(60)
         height = 128
         width = 128
@@ -294,13 +599,41 @@ class PickFromPileEnv(Env):
         )
         c.rotate([0, np.pi, 0])
         c.rotate([0, 0, -np.pi / 2])
-        _, depth, segm_tmp = safepicking.pybullet.get_camera_image(
-            c.matrix, fovy=fovy, height=height, width=width
-        )
-        segm = segm_tmp.copy()
-        for object_id, collision_id in zip(object_ids, collision_ids):
-            segm[segm_tmp == collision_id] = object_id
+        T_world_to_camera = np.linalg.inv(c.matrix)
+
+        points = []
+        labels = []
+        for object_id in object_ids:
+            class_id = _utils.get_class_id(
+                object_id, physicsClientId=self.physicsClientId
+            )
+            T_obj_to_camera = (
+                T_world_to_camera
+                @ safepicking.geometry.transformation_matrix(
+                    *safepicking.pybullet.get_pose(
+                        object_id, physicsClientId=self.physicsClientId
+                    )
+                )
+            )
+            points_i = safepicking.geometry.transform_points(
+                _utils.get_points(class_id), T_obj_to_camera
+            )
+            points.append(points_i)
+            labels.append(np.full(points_i.shape[0], object_id))
+        points = np.concatenate(points)
+        labels = np.concatenate(labels)
+
         K = safepicking.geometry.opengl_intrinsic_matrix(fovy, height, width)
+        depth, segm = safepicking.geometry.depth_from_pointcloud(
+            points,
+            fx=K[0, 0],
+            fy=K[1, 1],
+            cx=K[0, 2],
+            cy=K[1, 2],
+            height=height,
+            width=width,
+            labels=labels,
+        )
         pcd_in_camera = safepicking.geometry.pointcloud_from_depth(
             depth, fx=K[0, 0], fy=K[1, 1], cx=K[0, 2], cy=K[1, 2]
         )
@@ -309,8 +642,32 @@ class PickFromPileEnv(Env):
         centroid_in_world = safepicking.geometry.transform_points(
             [centroid_in_camera], c.matrix
         )[0]
-        # pp.draw_pose((centroid_in_world, [0, 0, 0, 1]))
-        del depth, segm, pcd_in_camera, K, points_in_camera
+        return centroid_in_world
+
+    @profiler.profile
+    def _capture_target(self, object_ids, collision_ids, target_object_id):
+        # for _ in range(240):
+        #     pp.step_simulation()
+
+        # get centroid of the target object's visible surface
+        centroid_in_world = self._get_visible_centroid(
+            object_ids, target_object_id
+        )
+
+        object_poses = []
+        for object_id, collision_id in zip(object_ids, collision_ids):
+            object_pose = safepicking.pybullet.get_pose(
+                object_id, physicsClientId=self.physicsClientId
+            )
+            object_poses.append(object_pose)
+            safepicking.pybullet.set_pose(
+                collision_id, object_pose, physicsClientId=self.physicsClientId
+            )
+            safepicking.pybullet.set_pose(
+                object_id,
+                ((0, 0, 10), (0, 0, 0, 1)),
+                physicsClientId=self.physicsClientId,
+            )
 
         # capture target-centered image
         c = safepicking.geometry.Coordinate(*self.ri.get_pose("camera_link"))
@@ -318,28 +675,46 @@ class PickFromPileEnv(Env):
         j_capture = self.ri.solve_ik(
             c.pose, move_target=self.ri.robot_model.camera_link
         )
-        if j_capture is None:
-            if raise_on_failure:
-                raise RuntimeError("IK failed to capture object")
-            else:
-                return self.reset()
-        self.ri.setj(j_capture)
-        rgb, depth, segm_tmp = self.ri.get_camera_image()
-        segm = segm_tmp.copy()
-        for object_id, collision_id in zip(object_ids, collision_ids):
-            segm[segm_tmp == collision_id] = object_id
-        K = self.ri.get_opengl_intrinsic_matrix()
-        camera_to_world = self.ri.get_pose("camera_link")
+        if j_capture is not None:
+            self.ri.setj(j_capture)
+            rgb, depth, segm_tmp = self.ri.get_camera_image()
+            segm = segm_tmp.copy()
+            for object_id, collision_id in zip(object_ids, collision_ids):
+                segm[segm_tmp == collision_id] = object_id
+            K = self.ri.get_opengl_intrinsic_matrix()
+            camera_to_world = self.ri.get_pose("camera_link")
 
         for object_id, collision_id, object_pose in zip(
             object_ids, collision_ids, object_poses
         ):
-            pp.set_pose(object_id, object_pose)
-            pp.remove_body(collision_id)
+            safepicking.pybullet.set_pose(
+                object_id, object_pose, physicsClientId=self.physicsClientId
+            )
+            p.removeBody(collision_id, physicsClientId=self.physicsClientId)
 
-        lock_renderer.restore()
+        if j_capture is None:
+            return
 
-        # grasping
+        pcd_in_world, grasp_poses = self._get_grasp_poses(
+            depth=depth,
+            segm=segm,
+            K=K,
+            camera_to_world=camera_to_world,
+            target_object_id=target_object_id,
+        )
+
+        return dict(
+            rgb=rgb,
+            pcd_in_world=pcd_in_world,
+            segm=segm,
+            grasp_poses=grasp_poses,
+        )
+
+    @profiler.profile
+    def _get_grasp_poses(
+        self, depth, segm, K, camera_to_world, target_object_id
+    ):
+        # point cloud and normals in the world as grasp pose candidates
         pcd_in_camera = safepicking.geometry.pointcloud_from_depth(
             depth, fx=K[0, 0], fy=K[1, 1], cx=K[0, 2], cy=K[1, 2]
         )
@@ -362,72 +737,211 @@ class PickFromPileEnv(Env):
         quaternion_in_world = safepicking.geometry.quaternion_from_vec2vec(
             [0, 0, 1], normals_in_world.reshape(-1, 3)
         ).reshape(normals_in_world.shape[0], normals_in_world.shape[1], 4)
-        poses = np.concatenate((pcd_in_world, quaternion_in_world), axis=2)[
-            segm == target_object_id
+        grasp_poses = np.concatenate(
+            (pcd_in_world, quaternion_in_world), axis=2
+        )[segm == target_object_id]
+        return pcd_in_world, grasp_poses
+
+    @profiler.profile
+    def _solve_grasp(self, grasp_pose, obstacles):
+        ee_af_to_world = np.hsplit(grasp_pose, [3])
+        j = self.ri.solve_ik(ee_af_to_world, rotation_axis="z")
+        if j is None:
+            return
+        if not self.ri.validatej(j, obstacles=obstacles):
+            return
+        return j
+
+    @staticmethod
+    def get_grasps_file(pile_file):
+        pile_file = path.Path(pile_file)
+        return pile_file.parent / f"{pile_file.stem}.grasps.pkl"
+
+    def _load_grasps(self, pile_file, target_index):
+        grasps_file = self.get_grasps_file(pile_file)
+        if grasps_file not in self._grasps:
+            if grasps_file.exists():
+                with open(grasps_file, "rb") as f:
+                    self._grasps[grasps_file] = pickle.load(f)
+            else:
+                self._grasps[grasps_file] = None
+        grasps = self._grasps[grasps_file]
+        if grasps is None:
+            return
+        return grasps.get(target_index)
+
+    def _load_target(self, data, target_index):
+        self._connect()
+
+        if self._incremental_reset and self.ri is not None:
+            self._remove_pile()
+        else:
+            self._init_world()
+
+        with safepicking.pybullet.LockRenderer(
+            physicsClientId=self.physicsClientId
+        ):
+            object_ids, collision_ids = self._load_pile(data, target_index)
+            target_object_id = object_ids[target_index]
+
+            if self._is_colliding_with_robot(object_ids):
+                for collision_id in collision_ids:
+                    p.removeBody(
+                        collision_id, physicsClientId=self.physicsClientId
+                    )
+                raise RuntimeError("object is colliding with robot")
+            capture = self._capture_target(
+                object_ids, collision_ids, target_object_id
+            )
+            if capture is None:
+                raise RuntimeError("IK failed to capture object")
+        return object_ids, capture
+
+    def get_grasps(self, pile_file, target_index, num_trial=100, seed=0):
+        # IK-feasible and collision-free grasps, ranked as top-down first,
+        # which are empty with the error for invalid scenes or targets
+        with open(pile_file, "rb") as f:
+            data = pickle.load(f)
+
+        try:
+            return self._get_grasps(
+                data, target_index, num_trial=num_trial, seed=seed
+            )
+        except RuntimeError as e:
+            return dict(
+                grasp_poses=np.zeros((0, 7), dtype=float),
+                js=np.zeros((0, len(self.ri.joints)), dtype=float),
+                error=str(e),
+            )
+
+    def _get_grasps(self, data, target_index, num_trial, seed):
+        object_ids, capture = self._load_target(data, target_index)
+        target_object_id = object_ids[target_index]
+
+        obstacles = [self.plane] + object_ids
+        obstacles.remove(target_object_id)
+
+        random_state = np.random.RandomState(seed)
+        indices = random_state.permutation(capture["grasp_poses"].shape[0])[
+            :num_trial
         ]
+        grasp_poses = capture["grasp_poses"][indices].astype(float)
+        js = self.ri.solve_ik_batch(
+            grasp_poses, rotation_axis="z", validate=True, obstacles=obstacles
+        )
+        is_valid = ~np.isnan(js).any(axis=1)
+        grasp_poses = grasp_poses[is_valid]
+        js = js[is_valid]
+
+        # z-component of the ee's z-axis, which is -1 for top-down grasps
+        qx, qy = grasp_poses[:, 3], grasp_poses[:, 4]
+        keys = np.argsort(1 - 2 * (qx**2 + qy**2))
+        return dict(grasp_poses=grasp_poses[keys], js=js[keys])
 
-        for index in random_state.permutation(poses.shape[0])[:10]:
-            ee_af_to_world = np.hsplit(poses[index], [3])
-            j = self.ri.solve_ik(ee_af_to_world, rotation_axis="z")
-            if j is None:
+    def screen_pile(self, pile_file, num_trial=10):
+        # valid targets and the reasons why the others are rejected
+        with open(pile_file, "rb") as f:
+            data = pickle.load(f)
+
+        target_indices = self.get_target_indices(data)
+
+        valid_targets = []
+        rejected = {}
+        for target_index in range(len(data["class_id"])):
+            if target_index not in target_indices:
+                rejected[target_index] = "object is not partially occluded"
                 continue
 
-            obstacles = [self.plane] + object_ids
-            obstacles.remove(target_object_id)
-            if not self.ri.validatej(j, obstacles=obstacles):
+            grasps = self._load_grasps(pile_file, target_index)
+            if grasps is None:
+                try:
+                    grasps = self._get_grasps(
+                        data, target_index, num_trial=num_trial, seed=0
+                    )
+                except RuntimeError as e:
+                    rejected[target_index] = str(e)
+                    continue
+            if "error" in grasps:
+                rejected[target_index] = grasps["error"]
+                continue
+            if grasps["js"].shape[0] == 0:
+                rejected[target_index] = "Unable to grasp the target object"
                 continue
 
-            self.ri.setj(j)
-            break
-        else:
-            if raise_on_failure:
-                raise RuntimeError("Unable to grasp the target object")
-            else:
-                return self.reset()
+            valid_targets.append(target_index)
+        return valid_targets, rejected
 
-        for _ in self.ri.movej(j):
-            pp.step_simulation()
-            time.sleep(pp.get_time_step())
+    def get_manifest_file(self):
+        return self.PILES_DIR / "manifest.json"
 
-        try:
-            for _ in self.ri.grasp(rotation_axis=True):
-                pp.step_simulation()
-                time.sleep(pp.get_time_step())
-        except RuntimeError:
-            if raise_on_failure:
-                raise
+    def _load_manifest(self):
+        if self._manifest is None:
+            manifest_file = self.get_manifest_file()
+            if manifest_file.exists():
+                with open(manifest_file) as f:
+                    self._manifest = json.load(f)
             else:
-                return self.reset()
+                self._manifest = {}
+        return self._manifest
 
-        if not self.ri.gripper.check_grasp():
-            if raise_on_failure:
-                raise RuntimeError("Unable to grasp the target object")
-            else:
-                return self.reset()
+    @profiler.profile
+    def _reset_from_cache(self, data, cached):
+        target_index = cached["target_index"]
+
+        with safepicking.pybullet.LockRenderer(
+            physicsClientId=self.physicsClientId
+        ):
+            object_ids = []
+            for i in range(len(data["class_id"])):
+                object_id = self._create_object(
+                    data, index=i, is_target=i == target_index
+                )
+                object_ids.append(object_id)
+
+            for object_id, pose, velocity in zip(
+                object_ids,
+                cached["object_poses"],
+                cached["object_velocities"],
+            ):
+                safepicking.pybullet.set_pose(
+                    object_id, pose, physicsClientId=self.physicsClientId
+                )
+                p.resetBaseVelocity(
+                    object_id, *velocity, physicsClientId=self.physicsClientId
+                )
+            for joint, (position, velocity) in enumerate(
+                cached["robot_joint_states"]
+            ):
+                p.resetJointState(
+                    self.ri.robot,
+                    joint,
+                    targetValue=position,
+                    targetVelocity=velocity,
+                    physicsClientId=self.physicsClientId,
+                )
+
+        grasp = cached["grasp"]
+        self.ri.gripper.activated = True
+        self.ri.gripper.add_constraint(
+            obj=object_ids[grasp["object_index"]],
+            obj_to_ee=grasp["obj_to_ee"],
+            obj_link=grasp["obj_link"],
+            grasp_point_on_obj=grasp["grasp_point_on_obj"],
+            grasp_point_on_ee=grasp["grasp_point_on_ee"],
+        )
 
         self.object_ids = object_ids
         self.object_visibilities = data["visibility"]
-        self.target_object_id = target_object_id
+        self.target_object_id = object_ids[target_index]
         self.target_object_class = data["class_id"][target_index]
         self.target_object_visibility = data["visibility"][target_index]
+        self._set_object_labels(data["class_id"])
 
-        self.object_state = self.get_object_state(
-            pose_miss=self._miss,
-            pose_noise=self._pose_noise,
-            random_state=random_state,
-        )
-
-        self.ee_pose_init = np.hstack(self.ri.get_pose("tipLink")).astype(
-            np.float32
-        )
-        self.visual_state = self.get_visual_state(
-            rgb=rgb,
-            pcd_in_world=pcd_in_world,
-            segm=segm,
-        )
-
-        # ---------------------------------------------------------------------
+        self.object_state = cached["object_state"]
+        self.ee_pose_init = cached["ee_pose_init"]
+        self.visual_state = cached["visual_state"]
 
+    def _init_episode(self):
         self.ee_poses = np.zeros((self.episode_length, 7), dtype=np.float32)
         self.ee_poses = np.r_[self.ee_poses[1:], self.ee_pose_init[None]]
 
@@ -435,8 +949,29 @@ class PickFromPileEnv(Env):
         self.translations = collections.defaultdict(float)
         self.max_velocities = collections.defaultdict(float)
 
+        # static part of the observation in the episode
+        (
+            grasp_flags_init,
+            object_labels_init,
+            object_poses_init,
+        ) = copy.deepcopy(self.object_state)
+        object_poses_init[:, :3] -= [
+            self.ee_pose_init[0],
+            self.ee_pose_init[1],
+            0,
+        ]
+        heightmap, _, maskmap = self.visual_state
+        self._obs_init = dict(
+            grasp_flags_init=grasp_flags_init,
+            object_labels_init=object_labels_init,
+            object_poses_init=object_poses_init,
+            heightmap=heightmap,
+            maskmap=maskmap,
+        )
+
         return self.get_obs()
 
+    @profiler.profile
     def get_visual_state(self, rgb, pcd_in_world, segm):
         if 0:
             import imgviz
@@ -466,6 +1001,18 @@ class PickFromPileEnv(Env):
 
         return heightmap, colormap, maskmap
 
+    def _set_object_labels(self, class_ids):
+        # class ids are fixed in the episode, so labels are computed once
+        self._object_labels = np.zeros(
+            (len(class_ids), len(self.CLASS_IDS)), dtype=np.uint8
+        )
+        for i, class_id in enumerate(class_ids):
+            self._object_labels[i, self.CLASS_IDS.index(class_id)] = 1
+        self._grasp_flags = (
+            np.array(self.object_ids) == self.target_object_id
+        ).astype(np.uint8)
+
+    @profiler.profile
     def get_object_state(self, pose_miss=0, pose_noise=0, random_state=None):
         if pose_miss:
             random_state_miss = copy.deepcopy(random_state)
@@ -473,10 +1020,8 @@ class PickFromPileEnv(Env):
             random_state_noise = copy.deepcopy(random_state)
         del random_state
 
-        grasp_flags = np.zeros((len(self.object_ids),), dtype=np.uint8)
-        object_labels = np.zeros(
-            (len(self.object_ids), len(self.CLASS_IDS)), dtype=np.uint8
-        )
+        grasp_flags = self._grasp_flags.copy()
+        object_labels = self._object_labels.copy()
         object_poses = np.zeros((len(self.object_ids), 7), dtype=np.float32)
         for i, object_id in enumerate(self.object_ids):
             if pose_miss:
@@ -488,12 +1033,12 @@ class PickFromPileEnv(Env):
                 else:
                     miss = pose_miss
                 if self.object_visibilities[i] < miss:
+                    grasp_flags[i] = 0
+                    object_labels[i] = 0
                     continue
-            grasp_flags[i] = object_id == self.target_object_id
-            object_to_world = pp.get_pose(object_id)
-            class_id = _utils.get_class_id(object_id)
-            object_label = self.CLASS_IDS.index(class_id)
-            object_labels[i] = np.eye(len(self.CLASS_IDS))[object_label]
+            position, quaternion = p.getBasePositionAndOrientation(
+                object_id, physicsClientId=self.physicsClientId
+            )
             if pose_noise:
                 if isinstance(pose_noise, tuple):
                     assert len(pose_noise) == 2
@@ -502,30 +1047,20 @@ class PickFromPileEnv(Env):
                     )
                 else:
                     scale = pose_noise
-                object_to_world = (
-                    object_to_world[0]
-                    + random_state_noise.normal(0, 0.01 * scale, 3),
-                    object_to_world[1]
-                    + random_state_noise.normal(0, 0.03 * scale, 4),
+                position = position + random_state_noise.normal(
+                    0, 0.01 * scale, 3
                 )
-            object_poses[i] = np.hstack(object_to_world)
+                quaternion = quaternion + random_state_noise.normal(
+                    0, 0.03 * scale, 4
+                )
+            object_poses[i, :3] = position
+            object_poses[i, 3:] = quaternion
         return grasp_flags, object_labels, object_poses
 
     def get_obs(self):
         grasp_flags, object_labels, object_poses = self.get_object_state()
         object_poses[:, :3] -= [self.ee_pose_init[0], self.ee_pose_init[1], 0]
-        (
-            grasp_flags_init,
-            object_labels_init,
-            object_poses_init,
-        ) = copy.deepcopy(self.object_state)
-        object_poses_init[:, :3] -= [
-            self.ee_pose_init[0],
-            self.ee_pose_init[1],
-            0,
-        ]
-        heightmap, _, maskmap = self.visual_state
-        ee_poses = copy.deepcopy(self.ee_poses)
+        ee_poses = self.ee_poses.copy()
         ee_poses[:, :3] -= [
             self.ee_pose_init[0],
             self.ee_pose_init[1],
@@ -535,38 +1070,115 @@ class PickFromPileEnv(Env):
             grasp_flags=grasp_flags,
             object_labels=object_labels,
             object_poses=object_poses,
-            grasp_flags_init=grasp_flags_init,
-            object_labels_init=object_labels_init,
-            object_poses_init=object_poses_init,
-            heightmap=heightmap,
-            maskmap=maskmap,
+            grasp_flags_init=self._obs_init["grasp_flags_init"],
+            object_labels_init=self._obs_init["object_labels_init"],
+            object_poses_init=self._obs_init["object_poses_init"],
+            heightmap=self._obs_init["heightmap"],
+            maskmap=self._obs_init["maskmap"],
             ee_poses=ee_poses,
         )
 
-        for key, space in self.observation_space.spaces.items():
-            assert obs[key].shape == space.shape, (
-                key,
-                obs[key].shape,
-                space.shape,
-            )
-            assert obs[key].dtype == space.dtype, (
-                key,
-                obs[key].dtype,
-                space.dtype,
-            )
-
+        if self._validate_obs:
+            for key, space in self.observation_space.spaces.items():
+                assert obs[key].shape == space.shape, (
+                    key,
+                    obs[key].shape,
+                    space.shape,
+                )
+                assert obs[key].dtype == space.dtype, (
+                    key,
+                    obs[key].dtype,
+                    space.dtype,
+                )
         return obs
 
-    def validate_action(self, act_result):
-        dx, dy, dz, da, db, dg = self.actions[act_result.action[0]]
-        with pp.LockRenderer(), pp.WorldSaver():
-            c = safepicking.geometry.Coordinate(*self.ri.get_pose("tipLink"))
+    def _get_action_cache_key(self):
+        # IK of the actions only depends on the joint positions of the robot
+        return np.asarray(self.ri.getj(), dtype=float).tobytes()
+
+    def _get_action_poses(self, actions):
+        ee_to_world = self.ri.get_pose("tipLink")
+        poses = []
+        for a in actions:
+            dx, dy, dz, da, db, dg = self.actions[a]
+            c = safepicking.geometry.Coordinate(*ee_to_world)
             c.translate([dx, dy, dz], wrt="world")
             c.rotate([da, db, dg], wrt="world")
-            j = self.ri.solve_ik(c.pose, n_init=1)
-            return j
+            poses.append(np.hstack(c.pose))
+        return np.array(poses).reshape(-1, 7)
+
+    def _solve_action_ik(self, actions):
+        # joint positions (N, ndof) of the actions, which are NaN where IK
+        # fails
+        poses = self._get_action_poses(actions)
+        if self._action_ik_method == "batch":
+            return self.ri.solve_ik_batch(poses)
+
+        js = np.full((len(poses), len(self.ri.joints)), np.nan)
+        with safepicking.pybullet.LockRenderer(
+            physicsClientId=self.physicsClientId
+        ), safepicking.pybullet.WorldSaver(
+            physicsClientId=self.physicsClientId
+        ):
+            for i, pose in enumerate(poses):
+                j = self.ri.solve_ik((pose[:3], pose[3:]), n_init=1)
+                if j is not None:
+                    js[i] = j
+        return js
+
+    @profiler.profile
+    def validate_action(self, act_result):
+        a = act_result.action[0]
+        if (
+            self._action_cache is not None
+            and self._action_cache[0] == self._get_action_cache_key()
+        ):
+            mask, js = self._action_cache[1]
+            return js[a] if mask[a] else None
+
+        j = self._solve_action_ik([a])[0]
+        if np.isnan(j).any():
+            return
+        return j
+
+    @profiler.profile
+    def validate_actions(self):
+        # feasibility mask and joint positions of all the actions, which are
+        # cached until the robot moves
+        key = self._get_action_cache_key()
+        if self._action_cache is not None and self._action_cache[0] == key:
+            return self._action_cache[1]
+
+        js = self._solve_action_ik(range(len(self.actions)))
+        mask = ~np.isnan(js).any(axis=1)
+
+        self._action_cache = (key, (mask, js))
+        return mask, js
 
     def step(self, act_result):
+        with profiler.section("PickFromPileEnv.step"):
+            transition = self._step(act_result)
+        if transition.terminal:
+            self._on_episode_end()
+        return transition
+
+    def _on_episode_end(self):
+        self._num_episodes += 1
+        if not self._profile:
+            return
+
+        if self._trace_dir is not None:
+            profiler.save_trace(
+                self._trace_dir
+                / f"{os.getpid()}-{self._num_episodes:08d}.json"
+            )
+        if self._num_episodes % self.PROFILE_SUMMARY_INTERVAL == 0:
+            logger.info(
+                f"Profile of {self._num_episodes} episodes:\n"
+                + profiler.summary()
+            )
+
+    def _step(self, act_result):
         if not hasattr(act_result, "j"):
             act_result.j = self.validate_action(act_result)
         j = act_result.j
@@ -593,42 +1205,29 @@ class PickFromPileEnv(Env):
                 f"terminate={act_result.action[1]}"
             )
 
-        poses = {}
-        for object_id in self.object_ids:
-            if object_id == self.target_object_id:
-                continue
-            poses[object_id] = pp.get_pose(object_id)
-        translations = collections.defaultdict(float)
-        max_velocities = collections.defaultdict(float)
-
-        def step_callback():
-            for object_id in self.object_ids:
-                if object_id == self.target_object_id:
-                    continue
-
-                pose = pp.get_pose(object_id)
-
-                translations[object_id] += np.linalg.norm(
-                    np.array(poses[object_id][0]) - np.array(pose[0])
-                )
-
-                poses[object_id] = pose
-
-                max_velocities[object_id] = max(
-                    max_velocities[object_id],
-                    np.linalg.norm(pp.get_velocity(object_id)[0]),
-                )
+        tracker = DisturbanceTracker(
+            [
+                object_id
+                for object_id in self.object_ids
+                if object_id != self.target_object_id
+            ],
+            physicsClientId=self.physicsClientId,
+        )
+        time_step = safepicking.pybullet.get_time_step(
+            physicsClientId=self.physicsClientId
+        )
 
-        for _ in self.ri.movej(
-            j,
-            speed=self._speed,
-            timeout=2 * (0.01 / self._speed),
-            raise_on_timeout=self._raise_on_timeout,
-        ):
-            pp.step_simulation()
-            step_callback()
-            if self._gui:
-                time.sleep(pp.get_time_step())
+        with profiler.section("PickFromPileEnv.movej"):
+            for _ in self.ri.movej(
+                j,
+                speed=self._speed,
+                timeout=2 * (0.01 / self._speed),
+                raise_on_timeout=self._raise_on_timeout,
+            ):
+                p.stepSimulation(physicsClientId=self.physicsClientId)
+                tracker.step()
+                if self._gui:
+                    time.sleep(time_step)
 
         if terminate:
             c = safepicking.geometry.Coordinate(*self.ri.get_pose("tipLink"))
@@ -643,19 +1242,23 @@ class PickFromPileEnv(Env):
             js.append(self.ri.homej)
 
             for j in js:
-                for _ in self.ri.movej(
-                    j,
-                    speed=self._speed,
-                    timeout=3 * (0.01 / self._speed),
-                    raise_on_timeout=self._raise_on_timeout,
-                ):
-                    pp.step_simulation()
-                    step_callback()
-                    if self._gui:
-                        time.sleep(pp.get_time_step())
+                with profiler.section("PickFromPileEnv.movej"):
+                    for _ in self.ri.movej(
+                        j,
+                        speed=self._speed,
+                        timeout=3 * (0.01 / self._speed),
+                        raise_on_timeout=self._raise_on_timeout,
+                    ):
+                        p.stepSimulation(physicsClientId=self.physicsClientId)
+                        tracker.step()
+                        if self._gui:
+                            time.sleep(time_step)
 
         # ---------------------------------------------------------------------
 
+        translations = tracker.get_translations()
+        max_velocities = tracker.get_max_velocities()
+
         self.i += 1
 
         for object_id in self.object_ids:
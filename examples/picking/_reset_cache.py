@@ -0,0 +1,42 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+import path
+
+
+class ResetCache:
+    def __init__(self, cache_dir):
+        self.cache_dir = path.Path(cache_dir).expanduser()
+        self.cache_dir.makedirs_p()
+
+    def get_key(self, pile_file, random_state, **params):
+        # random_state is the state of np.random.RandomState.get_state()
+        # at the beginning of the reset
+        hash = hashlib.sha1()
+        hash.update(str(path.Path(pile_file).abspath()).encode())
+        hash.update(random_state[1].tobytes())
+        hash.update(str(random_state[2:]).encode())
+        hash.update(repr(sorted(params.items())).encode())
+        return hash.hexdigest()
+
+    def _get_file(self, key):
+        return self.cache_dir / f"{key}.pkl"
+
+    def load(self, key):
+        pkl_file = self._get_file(key)
+        if not pkl_file.exists():
+            return
+        with open(pkl_file, "rb") as f:
+            return pickle.load(f)
+
+    def save(self, key, data):
+        pkl_file = self._get_file(key)
+
+        # write to a temporary file and rename it, as multiple envs can share
+        # the same cache directory
+        fd, tmp_file = tempfile.mkstemp(dir=self.cache_dir, suffix=".pkl")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(data, f)
+        os.replace(tmp_file, pkl_file)
@@ -1,10 +1,24 @@
+import functools
+
+import numpy as np
 import pybullet as p
 
 import safepicking
 
 
-def get_class_id(object_id):
-    visual_shape_data = p.getVisualShapeData(object_id)
+def get_class_id(object_id, physicsClientId=0):
+    visual_shape_data = p.getVisualShapeData(
+        object_id, physicsClientId=physicsClientId
+    )
     class_name = visual_shape_data[0][4].decode().split("/")[-2]
     class_id = safepicking.datasets.ycb.class_names.tolist().index(class_name)
     return class_id
+
+
+@functools.lru_cache(maxsize=None)
+def get_points(class_id):
+    # surface points of the object model in the object coordinates
+    pcd_file = safepicking.datasets.ycb.get_pcd_file(class_id=class_id)
+    points = np.loadtxt(pcd_file, dtype=np.float32)
+    points.setflags(write=0)
+    return points
@@ -0,0 +1,187 @@
+import multiprocessing
+import traceback
+
+import numpy as np
+
+from yarr.agents.agent import ActResult
+
+from safepicking.examples.picking._env import PickFromPileEnv
+
+
+def _select_action(env, candidates):
+    # the first candidate with a valid joint positions, as DqnAgent.act
+    mask, js = env.validate_actions()
+    for a, t in candidates:
+        if mask[a]:
+            act_result = ActResult(action=(int(a), int(t)))
+            act_result.j = js[a]
+            return act_result
+    a, t = candidates[0]
+    act_result = ActResult(action=(int(a), int(t)))
+    act_result.j = None
+    return act_result
+
+
+def _worker(remote, parent_remote, index, env_kwargs, eval, obs_buffers):
+    parent_remote.close()
+
+    env = PickFromPileEnv(gui=False, **env_kwargs)
+    env.eval = eval
+
+    obs_arrays = {}
+    for key, (buffer, shape, dtype) in obs_buffers.items():
+        obs_arrays[key] = np.frombuffer(buffer, dtype=dtype).reshape(shape)
+
+    def write_obs(obs):
+        for key, array in obs_arrays.items():
+            array[index] = obs[key]
+
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == "close":
+                break
+            try:
+                if cmd == "reset":
+                    write_obs(env.reset())
+                    result = dict(i=env.i)
+                elif cmd == "step":
+                    act_result = _select_action(env, data)
+                    transition = env.step(act_result)
+                    info = dict(transition.info)
+                    if transition.terminal:
+                        info["final_observation"] = transition.observation
+                        write_obs(env.reset())
+                    else:
+                        write_obs(transition.observation)
+                    result = dict(
+                        action=act_result.action,
+                        reward=transition.reward,
+                        terminal=transition.terminal,
+                        info=info,
+                        i=env.i,
+                    )
+                else:
+                    raise ValueError(f"unknown command: {cmd}")
+            except Exception:
+                # re-raised in the parent, which is waiting for the result
+                result = dict(error=traceback.format_exc())
+            remote.send(result)
+    finally:
+        env.shutdown()
+        remote.close()
+
+
+class VecPickFromPileEnv:
+    def __init__(self, num_envs, eval=False, **env_kwargs):
+        self.num_envs = num_envs
+
+        # only for the spaces and actions, and not connected to pybullet
+        env = PickFromPileEnv(gui=False, **env_kwargs)
+        self.observation_space = env.observation_space
+        self.observation_elements = env.observation_elements
+        self.actions = env.actions
+        self.action_shape = env.action_shape
+        self.episode_length = env.episode_length
+
+        ctx = multiprocessing.get_context("spawn")
+
+        # workers write observations to shared memory of (num_envs, ...)
+        obs_buffers = {}
+        self._obs = {}
+        for key, space in self.observation_space.spaces.items():
+            shape = (num_envs,) + space.shape
+            dtype = np.dtype(space.dtype)
+            buffer = ctx.RawArray("b", int(np.prod(shape)) * dtype.itemsize)
+            obs_buffers[key] = (buffer, shape, dtype)
+            self._obs[key] = np.frombuffer(buffer, dtype=dtype).reshape(shape)
+
+        self._remotes = []
+        self._processes = []
+        for index in range(num_envs):
+            remote, work_remote = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                args=(
+                    work_remote,
+                    remote,
+                    index,
+                    env_kwargs,
+                    eval,
+                    obs_buffers,
+                ),
+                daemon=True,
+            )
+            process.start()
+            work_remote.close()
+            self._remotes.append(remote)
+            self._processes.append(process)
+
+        self.i = np.zeros((num_envs,), dtype=int)
+        self._waiting = False
+        self._closed = False
+
+    def _recv_all(self):
+        # results of all the workers, where the first error of them is
+        # raised after all the results are received
+        results = []
+        for remote in self._remotes:
+            try:
+                results.append(remote.recv())
+            except EOFError:
+                results.append(dict(error="worker exited unexpectedly"))
+        for index, result in enumerate(results):
+            if "error" in result:
+                raise RuntimeError(
+                    f"error in worker {index}:\n{result['error']}"
+                )
+        return results
+
+    def reset(self):
+        for remote in self._remotes:
+            remote.send(("reset", None))
+        results = self._recv_all()
+        self.i[:] = [result["i"] for result in results]
+        return self._obs
+
+    def step_async(self, candidates):
+        # candidates: (action, terminate) pairs of each env in the order of
+        # preference, and the first valid one is executed in the worker
+        assert len(candidates) == self.num_envs
+        for remote, candidates_i in zip(self._remotes, candidates):
+            remote.send(("step", np.asarray(candidates_i, dtype=int)))
+        self._waiting = True
+
+    def step_wait(self):
+        self._waiting = False
+        results = self._recv_all()
+
+        actions = np.array([result["action"] for result in results])
+        rewards = np.array([result["reward"] for result in results])
+        terminals = np.array([result["terminal"] for result in results])
+        infos = [result["info"] for result in results]
+        self.i[:] = [result["i"] for result in results]
+
+        # the observations are views of the shared memory, which are valid
+        # until the next step or reset, and the ones of the terminated envs
+        # are from the next episode (see infos[i]["final_observation"])
+        return self._obs, actions, rewards, terminals, infos
+
+    def step(self, candidates):
+        self.step_async(candidates)
+        return self.step_wait()
+
+    def close(self):
+        if self._closed:
+            return
+        for remote in self._remotes:
+            try:
+                if self._waiting:
+                    remote.recv()
+                remote.send(("close", None))
+            except (EOFError, BrokenPipeError):
+                # the worker already exited
+                pass
+        for process in self._processes:
+            process.join()
+        self._closed = True
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+
+import argparse
+import time
+
+from loguru import logger
+import numpy as np
+import path
+
+from safepicking.examples.picking._agent import DqnAgent
+from safepicking.examples.picking._vec_env import VecPickFromPileEnv
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--num-envs", type=int, default=5, help="number of envs"
+    )
+    parser.add_argument(
+        "--num-steps", type=int, default=50, help="number of steps"
+    )
+    parser.add_argument(
+        "--model",
+        choices=[
+            "closedloop_pose_net",
+            "openloop_pose_net",
+            "conv_net",
+            "fusion_net",
+        ],
+        help="model (default: random actions)",
+    )
+    parser.add_argument("--weight-dir", type=path.Path, help="weight dir")
+    args = parser.parse_args()
+
+    env = VecPickFromPileEnv(num_envs=args.num_envs, incremental_reset=True)
+
+    if args.model is None:
+        agent = None
+    else:
+        agent = DqnAgent(env=env, model=args.model)
+        agent.build(training=False)
+        if args.weight_dir is not None:
+            agent.load_weights(args.weight_dir)
+
+    t_start = time.time()
+    obs = env.reset()
+    logger.info(f"reset: {time.time() - t_start:.2f} [s]")
+
+    num_episodes = 0
+    t_start = time.time()
+    for step in range(args.num_steps):
+        if agent is None:
+            candidates = []
+            for i in range(env.num_envs):
+                a = np.random.permutation(len(env.actions))
+                t = np.full_like(a, env.i[i] == env.episode_length - 1)
+                candidates.append(np.stack([a, t], axis=1))
+        else:
+            candidates = agent.act_batch(
+                step=step, observation=obs, deterministic=False, env=env
+            )
+        obs, actions, rewards, terminals, infos = env.step(candidates)
+        num_episodes += terminals.sum()
+        logger.info(
+            f"[{step + 1}/{args.num_steps}] actions={actions.tolist()}, "
+            f"rewards={np.round(rewards, 2).tolist()}, "
+            f"terminals={terminals.astype(int).tolist()}"
+        )
+    elapsed = time.time() - t_start
+
+    num_transitions = args.num_steps * env.num_envs
+    logger.info(
+        f"{num_transitions} transitions and {num_episodes} episodes in "
+        f"{elapsed:.1f} [s]: {num_transitions / elapsed:.2f} [transitions/s]"
+    )
+
+    env.close()
+
+
+if __name__ == "__main__":
+    main()
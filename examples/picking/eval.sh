@@ -4,8 +4,15 @@ waitforjobs() {
     while test $(jobs -p | wc -w) -ge "$1"; do wait -n; done
 }
 
-for scene_id in $(seq 9000 9999); do
-  scene_id=$(printf "%08d" $scene_id)
+manifest_file=data/pile_generation/manifest.json
+if [ -e $manifest_file ]; then
+  # solvable scenes screened by make_pile_manifest.py
+  scene_ids=$(python -c "import json, sys; print(' '.join(json.load(open(sys.argv[1]))['eval']))" $manifest_file)
+else
+  scene_ids=$(seq -f "%08g" 9000 9999)
+fi
+
+for scene_id in $scene_ids; do
   pile_file=data/pile_generation/${scene_id}.pkl
 
   set -x
@@ -14,9 +21,16 @@ for scene_id in $(seq 9000 9999); do
   weight_dir_openloop_pose_net=logs/20210709_005731-openloop_pose_net-noise/weights/90500
   weight_dir_fusion_net=logs/20210709_005731-fusion_net-noise/weights/84500
 
-  ./planned.py $pile_file --nogui --planner Heuristic &
-  ./planned.py $pile_file --nogui --planner Naive &
-  ./learned.py $pile_file --nogui --weight-dir $weight_dir_conv_net &
+  reset_cache_dir=data/reset_cache
+
+  # the first one resets the scene and saves it to the reset cache, which
+  # the others load after it
+  {
+    ./planned.py $pile_file --nogui --planner Heuristic --reset-cache-dir $reset_cache_dir
+    ./planned.py $pile_file --nogui --planner Naive --reset-cache-dir $reset_cache_dir &
+    ./learned.py $pile_file --nogui --weight-dir $weight_dir_conv_net --reset-cache-dir $reset_cache_dir &
+    wait
+  } &
 
   # for miss in 0.5 0.4 0.3 0.2 0.0; do
   #   ./planned.py --noise 0.3 --miss $miss $pile_file --nogui --planner RRTConnect &
@@ -26,6 +40,6 @@ for scene_id in $(seq 9000 9999); do
 
   { set +x; } 2>/dev/null
 
-  waitforjobs 12
+  waitforjobs 4
 done
 wait
@@ -30,6 +30,9 @@ def main():
     parser.add_argument("--mp4", help="mp4")
     parser.add_argument("--noise", type=float, default=0.0, help="pose noise")
     parser.add_argument("--miss", type=float, default=0.0, help="pose miss")
+    parser.add_argument(
+        "--reset-cache-dir", type=path.Path, help="reset cache dir"
+    )
     args = parser.parse_args()
 
     log_dir = args.weight_dir.parent.parent
@@ -49,6 +52,7 @@ def main():
         pose_noise=args.noise,
         miss=args.miss,
         raise_on_timeout=True,
+        reset_cache_dir=args.reset_cache_dir,
     )
     env.eval = True
     try:
@@ -93,7 +97,9 @@ def main():
     for object_id in env.object_ids:
         if object_id == env.target_object_id:
             continue
-        class_id = _utils.get_class_id(object_id)
+        class_id = _utils.get_class_id(
+            object_id, physicsClientId=env.physicsClientId
+        )
         class_name = safepicking.datasets.ycb.class_names[class_id]
         logger.info(
             f"[{object_id:2d}] {class_name:20s}: "
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+import argparse
+import pickle
+
+from loguru import logger
+import path
+
+from safepicking.examples.picking._env import PickFromPileEnv
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "pile_files",
+        type=path.Path,
+        nargs="*",
+        help="pile files (default: all piles in PILES_DIR)",
+    )
+    parser.add_argument(
+        "--num-trial", type=int, default=100, help="number of trial"
+    )
+    parser.add_argument("--force", action="store_true", help="force")
+    args = parser.parse_args()
+
+    env = PickFromPileEnv(gui=False, incremental_reset=True)
+
+    pile_files = args.pile_files
+    if not pile_files:
+        pile_files = sorted(
+            pile_file
+            for pile_file in env.PILES_DIR.glob("*.pkl")
+            if not pile_file.endswith(".grasps.pkl")
+        )
+
+    for pile_file in pile_files:
+        grasps_file = env.get_grasps_file(pile_file)
+        if grasps_file.exists() and not args.force:
+            logger.info(f"Grasps file already exists: {grasps_file}")
+            continue
+
+        with open(pile_file, "rb") as f:
+            data = pickle.load(f)
+
+        grasps = {}
+        for target_index in env.get_target_indices(data):
+            target_index = int(target_index)
+            grasps_i = env.get_grasps(
+                pile_file, target_index, num_trial=args.num_trial
+            )
+            grasps[target_index] = grasps_i
+            logger.info(
+                f"{pile_file.stem}: target_index={target_index}, "
+                f"num_grasps={grasps_i['js'].shape[0]}"
+            )
+
+        with open(grasps_file, "wb") as f:
+            pickle.dump(grasps, f)
+        logger.info(f"Saved to: {grasps_file}")
+
+    env.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+import argparse
+import json
+import os
+import tempfile
+
+from loguru import logger
+
+from safepicking.examples.picking._env import PickFromPileEnv
+
+
+def save_manifest(manifest, manifest_file):
+    for split in ["train", "eval"]:
+        manifest[split] = sorted(
+            pile
+            for pile, pile_info in manifest["piles"].items()
+            if pile_info["split"] == split and pile_info["valid_targets"]
+        )
+
+    fd, tmp_file = tempfile.mkstemp(dir=manifest_file.parent, suffix=".json")
+    with os.fdopen(fd, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_file, manifest_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--num-trial",
+        type=int,
+        default=10,
+        help="number of grasp trial without grasps file",
+    )
+    parser.add_argument(
+        "--save-interval", type=int, default=100, help="save interval"
+    )
+    parser.add_argument("--force", action="store_true", help="force")
+    args = parser.parse_args()
+
+    env = PickFromPileEnv(gui=False, incremental_reset=True)
+
+    manifest_file = env.get_manifest_file()
+    if manifest_file.exists() and not args.force:
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    else:
+        manifest = dict(train=[], eval=[], piles={})
+
+    pile_files = sorted(
+        pile_file
+        for pile_file in env.PILES_DIR.glob("*.pkl")
+        if not pile_file.endswith(".grasps.pkl")
+    )
+    for i, pile_file in enumerate(pile_files):
+        pile = pile_file.stem
+        if pile in manifest["piles"]:
+            continue
+
+        valid_targets, rejected = env.screen_pile(
+            pile_file, num_trial=args.num_trial
+        )
+        manifest["piles"][pile] = dict(
+            # same split as PickFromPileEnv.reset
+            split="eval" if int(pile) >= 9000 else "train",
+            valid_targets=valid_targets,
+            rejected={
+                str(target_index): reason
+                for target_index, reason in rejected.items()
+            },
+        )
+        logger.info(
+            f"[{i + 1}/{len(pile_files)}] {pile}: "
+            f"valid_targets={valid_targets}, rejected={rejected}"
+        )
+
+        if (i + 1) % args.save_interval == 0:
+            save_manifest(manifest, manifest_file)
+
+    save_manifest(manifest, manifest_file)
+    logger.info(
+        f"Saved to: {manifest_file} "
+        f"(train={len(manifest['train'])}, eval={len(manifest['eval'])})"
+    )
+
+    env.shutdown()
+
+
+if __name__ == "__main__":
+    main()
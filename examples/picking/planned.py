@@ -1,7 +1,6 @@
 #!/usr/bin/env python
 
 import argparse
-import collections
 import itertools
 import json
 import time
@@ -14,6 +13,9 @@ import pybullet_planning as pp
 
 import safepicking
 
+from safepicking.examples.picking._disturbance_tracker import (
+    DisturbanceTracker,
+)
 from safepicking.examples.picking._env import PickFromPileEnv
 from safepicking.examples.picking import _utils
 
@@ -36,6 +38,18 @@ def main():
     parser.add_argument("--mp4", help="mp4")
     parser.add_argument("--noise", type=float, default=0.0, help="pose noise")
     parser.add_argument("--miss", type=float, default=0.0, help="pose miss")
+    parser.add_argument(
+        "--reset-cache-dir", type=path.Path, help="reset cache dir"
+    )
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=0,
+        help="workers to plan with the relaxed min_distances in parallel, "
+        "which returns the first path of any of them (0: in turn), where "
+        "starting each worker takes seconds, so it only pays off on "
+        "multi-core machines",
+    )
     args = parser.parse_args()
 
     log_dir = here / f"logs/{args.planner}"
@@ -55,6 +69,7 @@ def main():
         pose_noise=args.noise,
         miss=args.miss,
         raise_on_timeout=True,
+        reset_cache_dir=args.reset_cache_dir,
     )
     env.eval = True
     try:
@@ -68,28 +83,45 @@ def main():
         return
 
     ri = env.ri
+    physicsClientId = env.physicsClientId
     plane = env.plane
     object_ids = env.object_ids
     target_object_id = env.target_object_id
 
     ri.planner = args.planner
 
-    with pp.WorldSaver():
+    with safepicking.pybullet.WorldSaver(physicsClientId=physicsClientId):
         # prepare for planning
         is_missing_target_object = False
         for object_id, object_pose in zip(object_ids, env.object_state[2]):
             if (object_pose == 0).all():
                 if object_id == target_object_id:
                     is_missing_target_object = True
-                pp.set_pose(object_id, ([1, 1, 1], [0, 0, 0, 1]))
+                safepicking.pybullet.set_pose(
+                    object_id,
+                    ([1, 1, 1], [0, 0, 0, 1]),
+                    physicsClientId=physicsClientId,
+                )
             else:
-                pp.set_pose(object_id, (object_pose[:3], object_pose[3:]))
+                safepicking.pybullet.set_pose(
+                    object_id,
+                    (object_pose[:3], object_pose[3:]),
+                    physicsClientId=physicsClientId,
+                )
         if not is_missing_target_object:
             ee_to_world = ri.get_pose("tipLink")
-            obj_to_world = pp.get_pose(target_object_id)
+            obj_to_world = safepicking.pybullet.get_pose(
+                target_object_id, physicsClientId=physicsClientId
+            )
             obj_to_ee = pp.multiply(pp.invert(ee_to_world), obj_to_world)
             ri.attachments = [
-                pp.Attachment(ri.robot, ri.ee, obj_to_ee, target_object_id)
+                safepicking.pybullet.Attachment(
+                    ri.robot,
+                    ri.ee,
+                    obj_to_ee,
+                    target_object_id,
+                    physicsClientId=physicsClientId,
+                )
             ]
 
         if ri.planner == "Heuristic":
@@ -113,63 +145,77 @@ def main():
             if ri.attachments:
                 obstacles.remove(ri.attachments[0].child)
 
+            min_distances = []
             for min_distance in np.linspace(0, -0.05, num=6):
                 if ri.attachments:
-                    min_distances = {
-                        (ri.attachments[0].child, -1): min_distance
-                    }
+                    min_distances.append(
+                        {(ri.attachments[0].child, -1): min_distance}
+                    )
                 else:
-                    min_distances = None
-                js = ri.planj(
+                    min_distances.append(None)
+
+            if args.num_workers > 0 and ri.planner == "RRTConnect":
+                # the startup of the workers, which is amortized over the
+                # queries of long-lived callers, is paid for the single one
+                # here, so this is faster only with enough cores
+                service = safepicking.pybullet.PlanningService(
+                    ri, planners=[ri.planner] * args.num_workers
+                )
+                js = service.planj(
                     ri.homej,
                     obstacles=obstacles,
                     min_distances=min_distances,
                 )
-                if js is not None:
-                    break
-                logger.warning(f"js is None w/ min_distance={min_distance}")
+                service.close()
+                if js is None:
+                    js = [ri.homej]
             else:
-                js = [ri.homej]
+                for min_distance, min_distances_i in zip(
+                    np.linspace(0, -0.05, num=6), min_distances
+                ):
+                    js = ri.planj(
+                        ri.homej,
+                        obstacles=obstacles,
+                        min_distances=min_distances_i,
+                    )
+                    if js is not None:
+                        break
+                    logger.warning(
+                        f"js is None w/ min_distance={min_distance}"
+                    )
+                else:
+                    js = [ri.homej]
 
             steps = []
             for j in js:
                 steps.append(ri.movej(j, speed=0.005, raise_on_timeout=True))
             steps = itertools.chain(*steps)
 
-    poses = {}
-    for object_id in object_ids:
-        if object_id == target_object_id:
-            continue
-        poses[object_id] = pp.get_pose(object_id)
-    translations = collections.defaultdict(int)
-    max_velocities = collections.defaultdict(int)
-
-    def step_callback():
-        for object_id in object_ids:
-            if object_id == target_object_id:
-                continue
-
-            pose = pp.get_pose(object_id)
-            translations[object_id] += np.linalg.norm(
-                np.array(poses[object_id][0]) - np.array(pose[0])
-            )
-            poses[object_id] = pose
-
-            max_velocities[object_id] = max(
-                max_velocities[object_id],
-                np.linalg.norm(pp.get_velocity(object_id)[0]),
-            )
-
+    tracker = DisturbanceTracker(
+        [
+            object_id
+            for object_id in object_ids
+            if object_id != target_object_id
+        ],
+        physicsClientId=physicsClientId,
+    )
+    time_step = safepicking.pybullet.get_time_step(
+        physicsClientId=physicsClientId
+    )
     for _ in steps:
-        p.stepSimulation()
-        step_callback()
+        p.stepSimulation(physicsClientId=physicsClientId)
+        tracker.step()
         if not args.nogui:
-            time.sleep(pp.get_time_step())
+            time.sleep(time_step)
+    translations = tracker.get_translations()
+    max_velocities = tracker.get_max_velocities()
 
     for object_id in object_ids:
         if object_id == target_object_id:
             continue
-        class_id = _utils.get_class_id(object_id)
+        class_id = _utils.get_class_id(
+            object_id, physicsClientId=physicsClientId
+        )
         class_name = safepicking.datasets.ycb.class_names[class_id]
         logger.info(
             f"[{object_id}] {class_name:20s}: "
@@ -82,6 +82,23 @@ def main():
         "--episode-length", type=int, default=5, help="episode length"
     )
     parser.add_argument("--noise", action="store_true", help="noise")
+    parser.add_argument(
+        "--incremental-reset",
+        type=int,
+        default=0,
+        choices=[0, 1],
+        help="keep plane and robot loaded across resets",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="log time spent in each phase of reset and step",
+    )
+    parser.add_argument(
+        "--trace",
+        action="store_true",
+        help="save chrome trace of each episode to log_dir/trace",
+    )
     args = parser.parse_args()
 
     hparams = args.__dict__.copy()
@@ -129,6 +146,9 @@ def main():
         episode_length=hparams["episode_length"],
         pose_noise=pose_noise,
         miss=miss,
+        incremental_reset=hparams["incremental_reset"],
+        profile=hparams["profile"],
+        trace_dir=log_dir / "trace" if hparams["trace"] else None,
     )
 
     # Setup replay buffer
@@ -6,6 +6,7 @@ import time
 import imgviz
 import IPython
 import numpy as np
+import path
 import pybullet as p
 import pybullet_planning as pp
 
@@ -289,6 +290,25 @@ class BaseTaskInterface:
         pp.set_pose(obj, ([0, 0, 0.25 + 1.05], [0, 0, 0, 1]))
         self._env.bg_objects.append(obj)
 
+        # the walls and ceiling are checked with the signed distance field
+        # of the spheres backend in the batched validity checks
+        self.pi.static_obstacles = list(self._env.bg_objects)
+        self.pi.collision_backend = "spheres"
+
+        # roadmap of the workspace, which is rebuilt when the robot, walls or
+        # ceiling are changed
+        self.roadmap = safepicking.pybullet.Roadmap(
+            self.pi, obstacles=self._env.bg_objects
+        )
+        roadmap_file = path.Path(
+            "~/.cache/safepicking/roadmap.npz"
+        ).expanduser()
+        if not (roadmap_file.exists() and self.roadmap.load(roadmap_file)):
+            with pp.WorldSaver():
+                self.roadmap.grow(1000)
+            roadmap_file.parent.makedirs_p()
+            self.roadmap.save(roadmap_file)
+
         self._workspace_initialized = True
 
         # safepicking.pybullet.annotate_pose(obj)
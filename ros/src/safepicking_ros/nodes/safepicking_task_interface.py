@@ -328,6 +328,8 @@ class SafepickingTaskInterface:
         p = np.random.permutation(len(grasp_poses))
 
         for grasp_pose in grasp_poses[p]:
+            # the ones of the grasp pose are planned in a single search
+            candidates = []
             for gamma in np.random.uniform(-np.pi, np.pi, size=6):
                 c = safepicking.geometry.Coordinate(
                     grasp_pose[:3], grasp_pose[3:]
@@ -362,20 +364,29 @@ class SafepickingTaskInterface:
                     print("js_grasp is not found")
                     continue
 
-                self.base.pi.setj(j_init)
-                js_pre_grasp = self.base.pi.planj(
-                    j_pre_grasp, obstacles=self.base._env.bg_objects
+                candidates.append(
+                    dict(
+                        j_pre_grasp=j_pre_grasp,
+                        j_grasp=j_grasp,
+                        js_grasp=js_grasp,
+                    )
                 )
-                if js_pre_grasp is None:
-                    print("js_pre_grasp is not found")
-                    continue
+            if not candidates:
+                continue
 
-                return dict(
-                    j_pre_grasp=j_pre_grasp,
-                    js_pre_grasp=js_pre_grasp,
-                    j_grasp=j_grasp,
-                    js_grasp=js_grasp,
-                )
+            self.base.pi.setj(j_init)
+            js_pre_grasp = self.base.pi.planj_any(
+                [candidate["j_pre_grasp"] for candidate in candidates],
+                obstacles=self.base._env.bg_objects,
+                roadmap=self.base.roadmap,
+            )
+            if js_pre_grasp is None:
+                print("js_pre_grasp is not found")
+                continue
+
+            for candidate in candidates:
+                if np.allclose(candidate["j_pre_grasp"], js_pre_grasp[-1]):
+                    return dict(js_pre_grasp=js_pre_grasp, **candidate)
         raise RuntimeError("grasp planning has failed")
 
     def run(self, target_class_id):
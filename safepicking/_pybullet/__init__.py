@@ -2,4 +2,6 @@
 
 from .creation import *
 from .panda_robot_interface import PandaRobotInterface
+from .planning_service import PlanningService
+from .roadmap import Roadmap
 from .utils import *
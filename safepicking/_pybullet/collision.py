@@ -0,0 +1,116 @@
+import itertools
+
+import numpy as np
+import pybullet as p
+
+from . import utils as pybullet_utils
+
+
+def compute_allowed_collision_matrix(
+    body,
+    joints,
+    lower,
+    upper,
+    num_samples=2000,
+    allowed_link_names=None,
+    random_state=None,
+    physicsClientId=0,
+):
+    # link pairs of the body which don't need self-collision checks, as a
+    # symmetric boolean matrix (num_links, num_links): adjacent ones, ones in
+    # allowed_link_names, and ones which never or always collide in the
+    # configurations sampled within [lower, upper]
+    if random_state is None:
+        random_state = np.random.RandomState(0)
+    allowed_link_names = allowed_link_names or []
+
+    links = pybullet_utils.get_links(body, physicsClientId=physicsClientId)
+    num_links = len(links)
+    allowed = np.zeros((num_links, num_links), dtype=bool)
+
+    link_names = [
+        pybullet_utils.get_link_name(
+            body, link, physicsClientId=physicsClientId
+        )
+        for link in links
+    ]
+    parents = [
+        p.getJointInfo(body, link, physicsClientId=physicsClientId)[16]
+        for link in links
+    ]
+    for link_a, link_b in itertools.combinations(links, 2):
+        if (
+            link_b - link_a == 1
+            or parents[link_a] == link_b
+            or parents[link_b] == link_a
+            or (link_names[link_a], link_names[link_b]) in allowed_link_names
+            or (link_names[link_b], link_names[link_a]) in allowed_link_names
+        ):
+            allowed[link_a, link_b] = True
+
+    pairs = [
+        (link_a, link_b)
+        for link_a, link_b in itertools.combinations(links, 2)
+        if not allowed[link_a, link_b]
+    ]
+    num_collisions = np.zeros((len(pairs),), dtype=int)
+    with pybullet_utils.WorldSaver(physicsClientId=physicsClientId):
+        for _ in range(num_samples):
+            j = lower + random_state.uniform(size=len(joints)) * (
+                upper - lower
+            )
+            for joint, joint_position in zip(joints, j):
+                p.resetJointState(
+                    body,
+                    joint,
+                    joint_position,
+                    physicsClientId=physicsClientId,
+                )
+            for i, (link_a, link_b) in enumerate(pairs):
+                num_collisions[i] += (
+                    len(
+                        p.getClosestPoints(
+                            bodyA=body,
+                            linkIndexA=link_a,
+                            bodyB=body,
+                            linkIndexB=link_b,
+                            distance=0,
+                            physicsClientId=physicsClientId,
+                        )
+                    )
+                    > 0
+                )
+
+    for (link_a, link_b), num_collisions_i in zip(pairs, num_collisions):
+        if num_collisions_i == 0 or num_collisions_i == num_samples:
+            allowed[link_a, link_b] = True
+
+    return allowed | allowed.T
+
+
+def is_colliding_links(
+    links, obstacles, min_distances=None, physicsClientId=0
+):
+    # whether any of the links (body, link) is closer to the obstacles than
+    # min_distances[(body, link)] (0 by default), where the narrowphase runs
+    # only on the obstacles overlapping with the link in the broadphase
+    min_distances = min_distances or {}
+    obstacles = set(obstacles)
+    if not obstacles:
+        return False
+
+    for body, link in links:
+        min_distance = min_distances.get((body, link), 0)
+        candidates = obstacles & pybullet_utils.get_overlapping_bodies(
+            body, link, margin=min_distance, physicsClientId=physicsClientId
+        )
+        for obstacle in sorted(candidates):
+            if p.getClosestPoints(
+                bodyA=body,
+                linkIndexA=link,
+                bodyB=obstacle,
+                distance=min_distance,
+                physicsClientId=physicsClientId,
+            ):
+                return True
+    return False
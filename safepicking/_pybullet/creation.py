@@ -2,7 +2,9 @@ import numpy as np
 import pybullet as p
 
 
-def create_bin(X, Y, Z, color=(0.59, 0.44, 0.2, 1), create=None):
+def create_bin(
+    X, Y, Z, color=(0.59, 0.44, 0.2, 1), create=None, physicsClientId=0
+):
     origin = [0, 0, 0]
 
     if create is None:
@@ -40,11 +42,13 @@ def create_bin(X, Y, Z, color=(0.59, 0.44, 0.2, 1), create=None):
         halfExtents=halfExtents,
         visualFramePositions=positions,
         rgbaColors=rgbaColors,
+        physicsClientId=physicsClientId,
     )
     collision_shape_id = p.createCollisionShapeArray(
         shapeTypes=shapeTypes,
         halfExtents=halfExtents,
         collisionFramePositions=positions,
+        physicsClientId=physicsClientId,
     )
 
     position = [0, 0, Z / 2]
@@ -57,5 +61,6 @@ def create_bin(X, Y, Z, color=(0.59, 0.44, 0.2, 1), create=None):
         baseCollisionShapeIndex=collision_shape_id,
         baseInertialFramePosition=[0, 0, 0],
         baseInertialFrameOrientation=[0, 0, 0, 1],
+        physicsClientId=physicsClientId,
     )
     return unique_id
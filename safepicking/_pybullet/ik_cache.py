@@ -0,0 +1,130 @@
+import collections
+
+import numpy as np
+import sklearn.neighbors
+
+from .. import geometry
+
+
+class IkCache:
+    def __init__(
+        self,
+        max_size=10000,
+        resolution=0.0001,
+        rotation_scale=0.1,
+        max_seed_distance=0.05,
+        max_joint_distance=0.5,
+        rebuild_size=64,
+    ):
+        # resolution: quantization of the pose features for the keys, where
+        # rotations are scaled by rotation_scale [m/rad] to be comparable
+        # with translations
+        # max_seed_distance: max distance in the feature space of the
+        # nearest solution to warm start IK
+        # max_joint_distance: max difference [rad] of each joint between the
+        # cached solutions and the current joint positions, beyond which
+        # they are on other branches and not reused
+        self.max_size = max_size
+        self.resolution = resolution
+        self.rotation_scale = rotation_scale
+        self.max_seed_distance = max_seed_distance
+        self.max_joint_distance = max_joint_distance
+        self.rebuild_size = rebuild_size
+
+        self._groups = {}
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def clear(self):
+        self._groups = {}
+
+    def _get_features(self, pose, rotation_axis):
+        position, quaternion = pose
+        features = [np.asarray(position, dtype=float)]
+        R = geometry.quaternion_matrix(quaternion)[:3, :3]
+        if rotation_axis is True:
+            features.append(self.rotation_scale * R.flatten())
+        elif rotation_axis in ["x", "y", "z"]:
+            axis_index = "xyz".index(rotation_axis)
+            features.append(self.rotation_scale * R[:, axis_index])
+        return np.hstack(features)
+
+    def _get_group(self, move_target, rotation_axis, kwargs):
+        key = (move_target, rotation_axis, repr(sorted(kwargs.items())))
+        if key not in self._groups:
+            self._groups[key] = dict(
+                entries=collections.OrderedDict(),
+                kdtree=None,
+                kdtree_keys=[],
+                recent=[],
+            )
+        return self._groups[key]
+
+    def _is_near(self, j, j_current):
+        return j_current is None or (
+            np.abs(j - j_current).max() <= self.max_joint_distance
+        )
+
+    def get(
+        self, pose, move_target, j_current=None, rotation_axis=True, **kwargs
+    ):
+        # cached solution of the quantized pose, and the nearest one to warm
+        # start IK on a miss (None if there's no one close enough), where
+        # only the ones near j_current are used to keep IK continuous
+        if j_current is not None:
+            j_current = np.asarray(j_current, dtype=float)
+        if rotation_axis is False:
+            rotation_axis = None
+        group = self._get_group(move_target, rotation_axis, kwargs)
+        features = self._get_features(pose, rotation_axis)
+        key = tuple(np.round(features / self.resolution).astype(int))
+
+        entries = group["entries"]
+        if key in entries and self._is_near(entries[key][1], j_current):
+            entries.move_to_end(key)
+            self.num_hits += 1
+            return entries[key][1], None
+        self.num_misses += 1
+
+        seed = None
+        min_distance = self.max_seed_distance
+        candidates = list(group["recent"])
+        if group["kdtree"] is not None:
+            k = min(8, len(group["kdtree_keys"]))
+            _, indices = group["kdtree"].query(features[None], k=k)
+            candidates += [group["kdtree_keys"][i] for i in indices[0]]
+        for candidate in candidates:
+            # evicted ones are still in the tree until the next rebuild
+            if candidate not in entries:
+                continue
+            features_i, j_i = entries[candidate]
+            if not self._is_near(j_i, j_current):
+                continue
+            distance = np.linalg.norm(features_i - features)
+            if distance < min_distance:
+                min_distance = distance
+                seed = j_i
+        return None, seed
+
+    def put(self, pose, move_target, j, rotation_axis=True, **kwargs):
+        if rotation_axis is False:
+            rotation_axis = None
+        group = self._get_group(move_target, rotation_axis, kwargs)
+        features = self._get_features(pose, rotation_axis)
+        key = tuple(np.round(features / self.resolution).astype(int))
+
+        entries = group["entries"]
+        entries[key] = (features, np.array(j, dtype=float))
+        entries.move_to_end(key)
+        while len(entries) > self.max_size:
+            entries.popitem(last=False)
+
+        # new entries are searched linearly until the tree is rebuilt
+        group["recent"].append(key)
+        if len(group["recent"]) >= self.rebuild_size:
+            keys = list(entries.keys())
+            group["kdtree"] = sklearn.neighbors.KDTree(
+                np.array([entries[k][0] for k in keys])
+            )
+            group["kdtree_keys"] = keys
+            group["recent"] = []
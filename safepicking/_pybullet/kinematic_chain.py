@@ -0,0 +1,305 @@
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import trimesh.transformations as ttf
+
+
+def _get_origin(element):
+    origin = element.find("origin")
+    if origin is None:
+        return np.eye(4)
+    xyz = [float(x) for x in origin.get("xyz", "0 0 0").split()]
+    rpy = [float(x) for x in origin.get("rpy", "0 0 0").split()]
+    # roll, pitch and yaw around the fixed axes
+    T = ttf.euler_matrix(*rpy, axes="sxyz")
+    T[:3, 3] = xyz
+    return T
+
+
+def _rotation_matrices(axis, angles):
+    # rodrigues' formula for rotations of angles around a unit axis
+    K = np.array(
+        [
+            [0, -axis[2], axis[1]],
+            [axis[2], 0, -axis[0]],
+            [-axis[1], axis[0], 0],
+        ]
+    )
+    sin = np.sin(angles)[:, None, None]
+    cos = np.cos(angles)[:, None, None]
+    R = np.eye(3) + sin * K + (1 - cos) * (K @ K)
+    T = np.zeros((len(angles), 4, 4))
+    T[:, :3, :3] = R
+    T[:, 3, 3] = 1
+    return T
+
+
+def _rotation_vectors(R):
+    # log map of rotation matrices to axis-angle vectors
+    s = 0.5 * np.stack(
+        [
+            R[:, 2, 1] - R[:, 1, 2],
+            R[:, 0, 2] - R[:, 2, 0],
+            R[:, 1, 0] - R[:, 0, 1],
+        ],
+        axis=1,
+    )
+    sin = np.linalg.norm(s, axis=1)
+    cos = np.clip((np.trace(R, axis1=1, axis2=2) - 1) / 2, -1, 1)
+    angle = np.arctan2(sin, cos)
+
+    rotvec = np.zeros_like(s)
+    is_small = sin < 1e-8
+    rotvec[~is_small] = (
+        s[~is_small] * (angle[~is_small] / sin[~is_small])[:, None]
+    )
+    # rotation of pi, where the skew-symmetric part vanishes
+    is_pi = is_small & (cos < 0)
+    if is_pi.any():
+        diagonal = np.diagonal(R[is_pi], axis1=1, axis2=2)
+        axis = np.sqrt(np.clip((diagonal + 1) / 2, 0, 1))
+        k = np.argmax(axis, axis=1)
+        sign = np.sign(R[is_pi][np.arange(len(k)), k, :])
+        sign[np.arange(len(k)), k] = 1
+        sign[sign == 0] = 1
+        rotvec[is_pi] = np.pi * axis * sign
+    return rotvec
+
+
+class KinematicChain:
+    def __init__(self, urdf_file, joint_names):
+        # joint_names: names of the movable joints, which are the columns of
+        # the joint positions given to fk() and inverse_kinematics()
+        self.joint_names = list(joint_names)
+
+        root = ET.parse(urdf_file).getroot()
+        self._joints = {}
+        for joint in root.findall("joint"):
+            axis = joint.find("axis")
+            if axis is None:
+                axis = np.array([1, 0, 0], dtype=float)
+            else:
+                axis = np.array(
+                    [float(x) for x in axis.get("xyz").split()], dtype=float
+                )
+            self._joints[joint.find("child").get("link")] = dict(
+                name=joint.get("name"),
+                type=joint.get("type"),
+                parent=joint.find("parent").get("link"),
+                origin=_get_origin(joint),
+                axis=axis,
+            )
+        self.links = [link.get("name") for link in root.findall("link")]
+
+        self._segments = {}
+
+    def _get_segments(self, link):
+        # fixed transforms and joint index, axis of each movable joint from
+        # the root to the link, and the fixed transform to the link
+        if link in self._segments:
+            return self._segments[link]
+
+        if link not in self.links:
+            raise ValueError(f"unknown link: {link}")
+
+        joints = []
+        child = link
+        while child in self._joints:
+            joint = self._joints[child]
+            joints.append(joint)
+            child = joint["parent"]
+        joints = joints[::-1]
+
+        segments = []
+        T_fixed = np.eye(4)
+        for joint in joints:
+            T_fixed = T_fixed @ joint["origin"]
+            if joint["type"] == "fixed":
+                continue
+            if joint["type"] not in ["revolute", "continuous"]:
+                raise ValueError(f"unsupported joint type: {joint['type']}")
+            segments.append(
+                (
+                    T_fixed,
+                    self.joint_names.index(joint["name"]),
+                    joint["axis"] / np.linalg.norm(joint["axis"]),
+                )
+            )
+            T_fixed = np.eye(4)
+
+        self._segments[link] = segments, T_fixed
+        return self._segments[link]
+
+    def get_fixed_transform(self, parent, child):
+        # transformation matrix of the child link in the parent link, which
+        # are connected with only fixed joints
+        T = np.eye(4)
+        link = child
+        while link != parent:
+            if link not in self._joints:
+                raise ValueError(f"{child} is not a descendant of {parent}")
+            joint = self._joints[link]
+            if joint["type"] != "fixed":
+                raise ValueError(
+                    f"{child} is not fixed to {parent}: {joint['name']}"
+                )
+            T = joint["origin"] @ T
+            link = joint["parent"]
+        return T
+
+    def _forward(self, js, link):
+        segments, T_end = self._get_segments(link)
+
+        T = np.broadcast_to(np.eye(4), (js.shape[0], 4, 4))
+        origins = []
+        axes = []
+        indices = []
+        for T_fixed, index, axis in segments:
+            T = T @ T_fixed
+            origins.append(T[:, :3, 3])
+            axes.append(T[:, :3, :3] @ axis)
+            indices.append(index)
+            T = T @ _rotation_matrices(axis, js[:, index])
+        T = T @ T_end
+        return T, origins, axes, indices
+
+    def fk(self, js, link, offset=None):
+        # transformation matrices of the link (and the offset from it) in
+        # the root frame, (N, 4, 4) for joint positions of (N, ndof)
+        js = np.asarray(js, dtype=float)
+        T, _, _, _ = self._forward(js.reshape(-1, len(self.joint_names)), link)
+        if offset is not None:
+            T = T @ offset
+        return T.reshape(js.shape[:-1] + (4, 4))
+
+    def fk_links(self, js, links):
+        # transformation matrices (len(links), N, 4, 4) of the links in the
+        # root frame, where the shared joints are computed only once
+        js = np.asarray(js, dtype=float).reshape(-1, len(self.joint_names))
+
+        Ts = {}
+
+        def get_transform(link):
+            if link in Ts:
+                return Ts[link]
+            if link not in self._joints:
+                if link not in self.links:
+                    raise ValueError(f"unknown link: {link}")
+                T = np.broadcast_to(np.eye(4), (js.shape[0], 4, 4))
+            else:
+                joint = self._joints[link]
+                T = get_transform(joint["parent"]) @ joint["origin"]
+                if joint["type"] in ["revolute", "continuous"]:
+                    index = self.joint_names.index(joint["name"])
+                    axis = joint["axis"] / np.linalg.norm(joint["axis"])
+                    T = T @ _rotation_matrices(axis, js[:, index])
+                elif joint["type"] != "fixed":
+                    raise ValueError(
+                        f"unsupported joint type: {joint['type']}"
+                    )
+            Ts[link] = T
+            return T
+
+        return np.stack([get_transform(link) for link in links])
+
+    def jacobian(self, js, link, offset=None):
+        # geometric jacobians (N, 6, ndof) of the link (and the offset from
+        # it) in the root frame
+        js = np.asarray(js, dtype=float).reshape(-1, len(self.joint_names))
+        T, origins, axes, indices = self._forward(js, link)
+        if offset is not None:
+            T = T @ offset
+        J = np.zeros((js.shape[0], 6, len(self.joint_names)))
+        for origin, axis, index in zip(origins, axes, indices):
+            J[:, :3, index] += np.cross(axis, T[:, :3, 3] - origin)
+            J[:, 3:, index] += axis
+        return T, J
+
+    def inverse_kinematics(
+        self,
+        Ts,
+        seeds,
+        link,
+        lower,
+        upper,
+        offset=None,
+        rotation_axis=True,
+        max_iterations=50,
+        position_threshold=0.001,
+        rotation_threshold=np.deg2rad(1),
+        damping=0.01,
+        max_step=0.2,
+    ):
+        # damped least squares IK of target transformations (N, 4, 4) from
+        # the seeds (N, ndof) solved all at once, which returns the joint
+        # positions and whether they reach the targets
+        # rotation_axis: True (all), False (none) or "x", "y", "z" (the axis
+        # aligned to the one of the target, and free around it)
+        Ts = np.asarray(Ts, dtype=float).reshape(-1, 4, 4)
+        js = np.array(seeds, dtype=float).reshape(
+            Ts.shape[0], len(self.joint_names)
+        )
+        js = np.clip(js, lower, upper)
+
+        if rotation_axis is True:
+            rows = slice(0, 6)
+        elif rotation_axis is False or rotation_axis is None:
+            rows = slice(0, 3)
+        elif rotation_axis in ["x", "y", "z"]:
+            rows = slice(0, 6)
+            axis_index = "xyz".index(rotation_axis)
+        else:
+            raise ValueError(f"unsupported rotation_axis: {rotation_axis}")
+
+        success = np.zeros((js.shape[0],), dtype=bool)
+        active = np.arange(js.shape[0])
+        for _ in range(max_iterations + 1):
+            T, J = self.jacobian(js[active], link, offset=offset)
+            T_target = Ts[active]
+
+            error = np.zeros((len(active), 6))
+            error[:, :3] = T_target[:, :3, 3] - T[:, :3, 3]
+            if rotation_axis is True:
+                error[:, 3:] = _rotation_vectors(
+                    T_target[:, :3, :3] @ T[:, :3, :3].transpose(0, 2, 1)
+                )
+            elif rows.stop == 6:
+                a = T[:, :3, axis_index]
+                a_target = T_target[:, :3, axis_index]
+                cross = np.cross(a, a_target)
+                sin = np.linalg.norm(cross, axis=1)
+                cos = np.sum(a * a_target, axis=1)
+                angle = np.arctan2(sin, cos)
+                # around any axis orthogonal to a if they are opposite
+                cross[sin < 1e-8] = np.cross(
+                    a[sin < 1e-8], np.roll(a[sin < 1e-8], 1, axis=1)
+                )
+                cross /= np.linalg.norm(cross, axis=1, keepdims=True)
+                error[:, 3:] = cross * angle[:, None]
+                # rotation around a is free
+                P = np.eye(3) - a[:, :, None] * a[:, None, :]
+                J[:, 3:] = P @ J[:, 3:]
+
+            is_reached = (
+                np.linalg.norm(error[:, :3], axis=1) < position_threshold
+            )
+            if rows.stop == 6:
+                is_reached &= (
+                    np.linalg.norm(error[:, 3:], axis=1) < rotation_threshold
+                )
+            success[active[is_reached]] = True
+            active = active[~is_reached]
+            if active.size == 0:
+                break
+            J = J[~is_reached][:, rows]
+            error = error[~is_reached][:, rows]
+
+            JJt = J @ J.transpose(0, 2, 1)
+            JJt += damping**2 * np.eye(JJt.shape[1])
+            dq = (
+                J.transpose(0, 2, 1) @ np.linalg.solve(JJt, error[:, :, None])
+            )[:, :, 0]
+            norm = np.linalg.norm(dq, axis=1, keepdims=True)
+            dq *= np.minimum(1, max_step / np.maximum(norm, 1e-12))
+            js[active] = np.clip(js[active] + dq, lower, upper)
+        return js, success
@@ -1,24 +1,35 @@
-import itertools
+import time
 
 import numpy as np
 from ompl import base as ob
 from ompl import geometric as og
 from ompl import util as ou
 import pybullet as p
-import pybullet_planning as pp
 
+from .. import utils
+from . import utils as pybullet_utils
+from .collision import is_colliding_links
+from .sdf import get_signed_distance_field
+from .sphere_collision import SphereCollisionModel
 
-class pbValidityChecker(ob.StateValidityChecker):
+
+class ValidityChecker:
+    # validity of joint positions bound to the robot, obstacles and
+    # min_distances, which can be reused for many checks and updated
+    # collision_backend: "pybullet" to check all with pybullet, or "spheres"
+    # to check batches of are_valid() with SphereCollisionModel first and
+    # confirm only the ones in collision of the spheres with pybullet, where
+    # ri.static_obstacles are checked with a cached SignedDistanceField
     def __init__(
         self,
-        si,
         ri,
         obstacles=None,
         min_distances=None,
         min_distances_start_goal=None,
+        collision_backend="pybullet",
     ):
-        super().__init__(si)
         self.ri = ri
+        self.physicsClientId = ri.physicsClientId
         self.ndof = len(self.ri.joints)
         self.obstacles = obstacles or []
         self.min_distances = min_distances or {}
@@ -27,157 +38,236 @@ class pbValidityChecker(ob.StateValidityChecker):
         self.lower = np.asarray(self.lower)
         self.upper = np.asarray(self.upper)
 
+        if collision_backend == "pybullet":
+            self.sphere_model = None
+        elif collision_backend == "spheres":
+            self.sphere_model = SphereCollisionModel(ri)
+        else:
+            raise ValueError(
+                f"unsupported collision_backend: {collision_backend}"
+            )
+        self.collision_backend = collision_backend
+
         self.start = None
         self.goal = None
 
+    def update(
+        self, obstacles=None, min_distances=None, min_distances_start_goal=None
+    ):
+        # only the given ones are updated
+        if obstacles is not None:
+            self.obstacles = obstacles
+        if min_distances is not None:
+            self.min_distances = min_distances
+        if min_distances_start_goal is not None:
+            self.min_distances_start_goal = min_distances_start_goal
+
     def isValid(self, state):
         if not self.check_joint_limits(state):
             return False
 
         j = [state[i] for i in range(self.ndof)]
 
-        if self.min_distances_start_goal:
-            if self.start is not None and np.allclose(j, self.start):
-                min_distances = self.min_distances_start_goal
-            elif self.goal is not None and np.allclose(j, self.goal):
-                min_distances = self.min_distances_start_goal
-            else:
-                min_distances = self.min_distances
-        else:
-            min_distances = self.min_distances
-
-        with pp.WorldSaver():
-            self.ri.setj(j)
-
-            is_valid = self.check_self_collision(
-                min_distances=min_distances
-            ) and self.check_collision(
-                self.obstacles, min_distances=min_distances
+        with pybullet_utils.WorldSaver(physicsClientId=self.physicsClientId):
+            return self._is_valid(j)
+
+    def are_valid(self, js):
+        # validity (N,) of joint positions (N, ndof) in a single call
+        js = np.asarray(js, dtype=float).reshape(-1, self.ndof)
+        is_valid = ((js >= self.lower) & (js <= self.upper)).all(axis=1)
+
+        indices = np.where(is_valid)[0]
+        indices_free = indices[:0]
+        if self.sphere_model is not None and indices.size > 0:
+            # the spheres are conservative, so the ones in collision of them
+            # are checked with pybullet, and the others only on the pairs
+            # which are not checked with the spheres
+            obstacles, sdf = self._get_sphere_obstacles()
+            is_free = ~self.sphere_model.check_collision(
+                js[indices],
+                obstacles,
+                min_distances=self.min_distances,
+                sdf=sdf,
             )
+            if self.min_distances_start_goal:
+                # start and goal are checked with the other min_distances
+                is_free &= [
+                    self._get_min_distances(j) is self.min_distances
+                    for j in js[indices]
+                ]
+            indices_free = indices[is_free]
+            indices = indices[~is_free]
+
+        if indices.size > 0 or indices_free.size > 0:
+            with pybullet_utils.WorldSaver(
+                physicsClientId=self.physicsClientId
+            ):
+                for i in indices:
+                    is_valid[i] = self._is_valid(js[i])
+                exact_pairs = (
+                    self.sphere_model.get_exact_pairs()
+                    if indices_free.size > 0
+                    else []
+                )
+                if exact_pairs:
+                    for i in indices_free:
+                        self.ri.setj(js[i])
+                        is_valid[i] = not self._is_colliding_pairs(
+                            exact_pairs, min_distances=self.min_distances
+                        )
+        return is_valid
 
+    def are_valid_motions(self, js_a, js_b, resolution=0.01):
+        # validity (N,) of the motions between joint positions (N, ndof),
+        # where the states between them are checked at the resolution
+        # (fraction of the max extent of the joint space) in a single call
+        # of are_valid()
+        js_a = np.asarray(js_a, dtype=float).reshape(-1, self.ndof)
+        js_b = np.asarray(js_b, dtype=float).reshape(-1, self.ndof)
+        max_segment = resolution * np.linalg.norm(self.upper - self.lower)
+        num_segments = np.ceil(
+            np.linalg.norm(js_b - js_a, axis=1) / max_segment
+        ).astype(int)
+        num_states = np.maximum(num_segments - 1, 0)
+
+        motions = np.repeat(np.arange(len(js_a)), num_states)
+        steps = np.arange(len(motions)) - np.repeat(
+            np.cumsum(num_states) - num_states, num_states
+        )
+        ratios = (steps + 1) / num_segments[motions]
+        js = js_a[motions] + ratios[:, None] * (js_b - js_a)[motions]
+
+        is_valid = np.ones((len(js_a),), dtype=bool)
+        np.logical_and.at(is_valid, motions, self.are_valid(js))
         return is_valid
 
-    def check_self_collision(self, min_distances=None):
+    def shortcut(self, js, resolution=0.01):
+        # greedy shortcuts of the path (N, ndof) from each state to the
+        # farthest one which is reachable, where the motions between the
+        # consecutive states are assumed to be valid
+        js = np.asarray(js, dtype=float)
+        indices = [0]
+        while indices[-1] < len(js) - 1:
+            for index in range(len(js) - 1, indices[-1], -1):
+                if (
+                    index == indices[-1] + 1
+                    or self.are_valid_motions(
+                        js[indices[-1]], js[index], resolution=resolution
+                    )[0]
+                ):
+                    indices.append(index)
+                    break
+        return js[indices]
+
+    def _get_sphere_obstacles(self):
+        # obstacles to check with the spheres and the field of the static
+        # ones, which is used only when all of them are in the obstacles
+        static_obstacles = self.ri.static_obstacles
+        if not static_obstacles or not set(static_obstacles) <= set(
+            self.obstacles
+        ):
+            return self.obstacles, None
+        sdf = get_signed_distance_field(
+            static_obstacles,
+            *self.sphere_model.workspace,
+            physicsClientId=self.physicsClientId,
+        )
+        obstacles = [
+            obstacle
+            for obstacle in self.obstacles
+            if obstacle not in static_obstacles
+        ]
+        return obstacles, sdf
+
+    def _is_colliding_pairs(self, pairs, min_distances=None):
+        # whether any of (body_a, link_a, body_b, link_b) is in collision,
+        # where min_distances are of (body_a, link_a)
         min_distances = min_distances or {}
+        for body_a, link_a, body_b, link_b in pairs:
+            if body_a == self.ri.robot:
+                min_distance = 0
+            else:
+                min_distance = min_distances.get((body_a, link_a), 0)
+            if p.getClosestPoints(
+                bodyA=body_a,
+                linkIndexA=link_a,
+                bodyB=body_b,
+                linkIndexB=link_b,
+                distance=min_distance,
+                physicsClientId=self.physicsClientId,
+            ):
+                return True
+        return False
 
-        is_colliding = False
+    def _get_min_distances(self, j):
+        if self.min_distances_start_goal:
+            if self.start is not None and np.allclose(j, self.start):
+                return self.min_distances_start_goal
+            elif (
+                self.goal is not None
+                and np.isclose(j, self.goal).all(axis=-1).any()
+            ):
+                # goal can be many of (M, ndof) for plan_any()
+                return self.min_distances_start_goal
+        return self.min_distances
 
-        links = pp.get_links(self.ri.robot)
-        for link_a, link_b in itertools.combinations(links, 2):
-            link_name_a = pp.get_link_name(self.ri.robot, link_a)
-            link_name_b = pp.get_link_name(self.ri.robot, link_b)
+    def _is_valid(self, j):
+        min_distances = self._get_min_distances(j)
 
-            assert link_b > link_a
-            if link_b - link_a == 1:
-                continue
+        self.ri.setj(j)
+        return self.check_self_collision(
+            min_distances=min_distances
+        ) and self.check_collision(self.obstacles, min_distances=min_distances)
 
-            distance = 0
+    def check_self_collision(self, min_distances=None):
+        min_distances = min_distances or {}
 
-            # XXX: specific configurations for panda_drl.urdf
-            # panda_link5: front arm
-            # panda_link6: arm head
-            # panda_link7: wrist
-            # panda_link8: palm tip
-            if (
-                link_name_a == "panda_link7"
-                and link_name_b == "panda_suction_gripper"
+        for link_a, link_b in self.ri.get_self_collision_pairs():
+            if p.getClosestPoints(
+                bodyA=self.ri.robot,
+                linkIndexA=link_a,
+                bodyB=self.ri.robot,
+                linkIndexB=link_b,
+                distance=0,
+                physicsClientId=self.physicsClientId,
             ):
-                continue
-            if (
-                link_name_a == "panda_link5"
-                and link_name_b == "panda_suction_gripper"
-            ):
-                continue
-
-            # XXX: specific configurations for panda_suction.urdf
-            # panda_link7: wrist
-            if link_name_a == "panda_link7" and link_name_b == "baseLink":
-                continue
-
-            is_colliding_i = (
-                len(
-                    p.getClosestPoints(
-                        bodyA=self.ri.robot,
-                        linkIndexA=link_a,
-                        bodyB=self.ri.robot,
-                        linkIndexB=link_b,
-                        distance=distance,
-                    )
-                )
-                > 0
-            )
-            # if is_colliding_i:
-            #     from loguru import logger
-            #
-            #     logger.warning(
-            #         f"{link_a}:{link_name_a} and {link_b}:{link_name_b} "
-            #         f"is self-colliding with distance of {distance}"
-            #     )
-            is_colliding |= is_colliding_i
+                return False
 
+        links = pybullet_utils.get_links(
+            self.ri.robot, physicsClientId=self.physicsClientId
+        )
         for attachment in self.ri.attachments:
             assert attachment.parent == self.ri.robot
             min_distance = min_distances.get((attachment.child, -1), 0)
             for link in links:
                 if link == attachment.parent_link:
                     continue
-                is_colliding |= (
-                    len(
-                        p.getClosestPoints(
-                            bodyA=attachment.child,
-                            linkIndexA=-1,
-                            bodyB=self.ri.robot,
-                            linkIndexB=link,
-                            distance=min_distance,
-                        )
-                    )
-                    > 0
-                )
+                if p.getClosestPoints(
+                    bodyA=attachment.child,
+                    linkIndexA=-1,
+                    bodyB=self.ri.robot,
+                    linkIndexB=link,
+                    distance=min_distance,
+                    physicsClientId=self.physicsClientId,
+                ):
+                    return False
 
-        return not is_colliding
+        return True
 
     def check_collision(self, ids_to_check, min_distances=None):
-        min_distances = min_distances or {}
-
-        if len(ids_to_check) == 0:
-            return True
-
-        is_colliding = False
-
-        for link in pp.get_links(self.ri.robot):
-            min_distance = min_distances.get((self.ri.robot, link), 0)
-            is_colliding |= (
-                len(
-                    p.getClosestPoints(
-                        bodyA=self.ri.robot,
-                        linkIndexA=link,
-                        bodyB=ids_to_check[-1],
-                        linkIndexB=-1,
-                        distance=min_distance,
-                    )
-                )
-                > 0
-            )
-
-        for attachment in self.ri.attachments:
-            min_distance = min_distances.get((attachment.child, -1), 0)
-            is_colliding |= (
-                len(
-                    p.getClosestPoints(
-                        attachment.child,
-                        ids_to_check[-1],
-                        distance=min_distance,
-                    )
-                )
-                > 0
-            )
-
-        if is_colliding:
-            return False
-        else:
-            return self.check_collision(
-                ids_to_check[0:-1], min_distances=min_distances
+        links = [
+            (self.ri.robot, link)
+            for link in pybullet_utils.get_links(
+                self.ri.robot, physicsClientId=self.physicsClientId
             )
+        ]
+        links += [(attachment.child, -1) for attachment in self.ri.attachments]
+        return not is_colliding_links(
+            links,
+            ids_to_check,
+            min_distances=min_distances,
+            physicsClientId=self.physicsClientId,
+        )
 
     def check_joint_limits(self, state):
         for i in range(self.ndof):
@@ -196,7 +286,17 @@ class pbValidityChecker(ob.StateValidityChecker):
             return self.sample_state()
 
 
+class pbValidityChecker(ob.StateValidityChecker):
+    def __init__(self, si, validity_checker):
+        super().__init__(si)
+        self.validity_checker = validity_checker
+
+    def isValid(self, state):
+        return self.validity_checker.isValid(state)
+
+
 class PbPlanner:
+    @utils.profiler.profile
     def __init__(
         self,
         ri,
@@ -205,7 +305,21 @@ class PbPlanner:
         min_distances_start_goal=None,
         planner="RRTConnect",
         planner_range=0,
+        validity_checker=None,
+        collision_backend="pybullet",
+        validity_checking_resolution=0.01,
+        solve_time=1,
+        is_cancelled=None,
     ):
+        # planner: name of the planner in ompl.geometric, where the lazy ones
+        # (e.g., LazyPRM, LazyRRT) check the motions only along candidate
+        # solutions, and their solution is shortcut with batches of
+        # are_valid() instead of PathSimplifier
+        # validity_checking_resolution: fraction of the max extent of the
+        # joint space between the states checked along the motions
+        # is_cancelled: function which returns True to stop solving before
+        # solve_time, which is checked between short slices of solving, and
+        # the first exact solution is returned with it
         ndof = len(ri.joints)
 
         lower, upper = ri.get_bounds()
@@ -218,49 +332,95 @@ class PbPlanner:
         self.space.setBounds(bounds)
 
         self.si = ob.SpaceInformation(self.space)
-
-        self.validityChecker = pbValidityChecker(
-            self.si,
-            ri=ri,
-            obstacles=obstacles,
-            min_distances=min_distances,
-            min_distances_start_goal=min_distances_start_goal,
+        self.si.setStateValidityCheckingResolution(
+            validity_checking_resolution
         )
-        self.si.setStateValidityChecker(self.validityChecker)
+        self.validity_checking_resolution = validity_checking_resolution
+        self.lower = np.asarray(lower)
+        self.upper = np.asarray(upper)
+
+        # validity_checker: ValidityChecker to reuse, which is updated with
+        # the given obstacles and min_distances
+        if validity_checker is None:
+            self.validityChecker = ValidityChecker(
+                ri,
+                obstacles=obstacles,
+                min_distances=min_distances,
+                min_distances_start_goal=min_distances_start_goal,
+                collision_backend=collision_backend,
+            )
+        else:
+            validity_checker.update(
+                obstacles=obstacles,
+                min_distances=min_distances,
+                min_distances_start_goal=min_distances_start_goal,
+            )
+            self.validityChecker = validity_checker
+        self._pbValidityChecker = pbValidityChecker(
+            self.si, self.validityChecker
+        )
+        self.si.setStateValidityChecker(self._pbValidityChecker)
         self.si.setup()
 
         self.planner = planner
         self.planner_range = planner_range
+        self.solve_time = solve_time
+        self.is_cancelled = is_cancelled
 
+    @utils.profiler.profile
     def plan(self, start_q, goal_q):
-        log_level = ou.getLogLevel()
-        ou.setLogLevel(ou.LOG_WARN)
-
-        # start and goal configs
-        start = ob.State(self.space)
-        for i in range(len(start_q)):
-            start[i] = start_q[i]
+        pdef = ob.ProblemDefinition(self.si)
+        pdef.setStartAndGoalStates(
+            self._get_state(start_q), self._get_state(goal_q)
+        )
+        return self._solve(pdef)
 
-        goal = ob.State(self.space)
-        for i in range(len(start_q)):
-            goal[i] = goal_q[i]
+    @utils.profiler.profile
+    def plan_any(self, start_q, goals_q):
+        # path to any of the goals (M, ndof) in a single problem, where the
+        # planner samples the goals of GoalStates
+        goal = ob.GoalStates(self.si)
+        for goal_q in goals_q:
+            goal.addState(self._get_state(goal_q))
 
-        # setup and solve
         pdef = ob.ProblemDefinition(self.si)
-        pdef.setStartAndGoalStates(start, goal)
-        pdef.setOptimizationObjective(
-            ob.PathLengthOptimizationObjective(self.si)
-        )
+        pdef.addStartState(self._get_state(start_q))
+        pdef.setGoal(goal)
+        return self._solve(pdef)
+
+    def _get_state(self, j):
+        state = ob.State(self.space)
+        for i in range(len(j)):
+            state[i] = j[i]
+        return state
+
+    def _solve(self, pdef):
+        log_level = ou.getLogLevel()
+        ou.setLogLevel(ou.LOG_WARN)
+
+        objective = ob.PathLengthOptimizationObjective(self.si)
+        if self.planner.startswith("Lazy"):
+            # the first solution is enough, which is shortcut afterwards,
+            # where the default threshold (0) makes them optimize until
+            # solve_time
+            objective.setCostThreshold(objective.infiniteCost())
+        pdef.setOptimizationObjective(objective)
         optimizingPlanner = getattr(og, self.planner)(self.si)
         optimizingPlanner.setProblemDefinition(pdef)
         optimizingPlanner.setRange(self.planner_range)
         optimizingPlanner.setup()
-        solved = optimizingPlanner.solve(solveTime=1)
+        if self.is_cancelled is None:
+            solved = optimizingPlanner.solve(solveTime=self.solve_time)
+        else:
+            solved = self._solve_until_cancelled(optimizingPlanner, pdef)
 
         if solved:
             path = pdef.getSolutionPath()
-            simplifier = og.PathSimplifier(self.si)
-            simplifier.simplifyMax(path)
+            if self.planner.startswith("Lazy"):
+                path = self._shortcut(path)
+            else:
+                simplifier = og.PathSimplifier(self.si)
+                simplifier.simplifyMax(path)
         else:
             # logger.warning("No solution found")
             path = None
@@ -268,3 +428,41 @@ class PbPlanner:
         ou.setLogLevel(log_level)
 
         return path
+
+    def _solve_until_cancelled(self, planner, pdef, slice_time=0.05):
+        # solves in slices, between which is_cancelled is checked in this
+        # thread, as some planners (e.g., PRM) evaluate the termination
+        # condition in their own threads, where python can't be called
+        # the planners resume from their data in the next slice until the
+        # first exact solution, which is enough as the others are cancelled
+        # by it, and the cancelled ones return None without simplifying the
+        # solution
+        t_end = time.time() + self.solve_time
+        while True:
+            solved = planner.solve(
+                solveTime=min(slice_time, t_end - time.time())
+            )
+            if self.is_cancelled():
+                return
+            if pdef.hasExactSolution() or time.time() >= t_end:
+                return solved
+
+    def _shortcut(self, path):
+        # greedy shortcuts from each state of the path to the farthest one
+        # which is reachable, where the motions of the path are already
+        # checked by the lazy planner
+        ndof = self.space.getDimension()
+        js = np.array(
+            [
+                [path.getState(i)[k] for k in range(ndof)]
+                for i in range(path.getStateCount())
+            ]
+        )
+        js = self.validityChecker.shortcut(
+            js, resolution=self.validity_checking_resolution
+        )
+
+        path = og.PathGeometric(self.si)
+        for j in js:
+            path.append(self._get_state(j)())
+        return path
@@ -0,0 +1,190 @@
+import numpy as np
+
+
+# modified DH parameters of the panda arm
+_D1 = 0.333
+_D3 = 0.316
+_D5 = 0.384
+_A4 = 0.0825
+_A7 = 0.088
+
+_LL24 = _A4**2 + _D3**2
+_LL46 = _A4**2 + _D5**2
+_L24 = np.sqrt(_LL24)
+_L46 = np.sqrt(_LL46)
+_THETA_H46 = np.arctan2(_D5, _A4)
+_THETA_342 = np.arctan2(_D3, _A4)
+_THETA_46H = np.arctan2(_A4, _D5)
+
+
+def _normalize(v):
+    return v / np.linalg.norm(v, axis=-1, keepdims=True)
+
+
+def _panda_ik(Ts, q7, q1_singular, flip):
+    # closed-form IK of the panda (He and Liu, 2021) for the panda_link7
+    # frames Ts (N, 4, 4) and the redundant joint 7 angles q7 (N,), which
+    # returns the 4 solutions (N, 4, 7) of the elbow with NaN where there's
+    # none, and the ones of the other elbow if flip=True
+    # q1_singular: joint 1 angle when the wrist is above the shoulder
+    Ts = np.asarray(Ts, dtype=float).reshape(-1, 4, 4)
+    q7 = np.broadcast_to(np.asarray(q7, dtype=float), (Ts.shape[0],))
+    N = Ts.shape[0]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        R_7 = Ts[:, :3, :3]
+        p_7 = Ts[:, :3, 3]
+        z_7 = R_7[:, :, 2]
+
+        x_6 = (
+            R_7
+            @ np.stack([np.cos(q7), -np.sin(q7), np.zeros(N)], axis=1)[
+                :, :, None
+            ]
+        )[:, :, 0]
+        x_6 = _normalize(x_6)
+        p_6 = p_7 - _A7 * x_6
+
+        # q4 from the triangle of the shoulder, elbow and wrist
+        p_2 = np.array([0, 0, _D1])
+        V_26 = p_6 - p_2
+        LL_26 = np.sum(V_26**2, axis=1)
+        L_26 = np.sqrt(LL_26)
+        is_valid = (
+            (L_26 <= _L24 + _L46)
+            & (_L46 <= _L24 + L_26)
+            & (_L24 <= L_26 + _L46)
+        )
+        theta_246 = np.arccos(
+            np.clip((_LL24 + _LL46 - LL_26) / (2 * _L24 * _L46), -1, 1)
+        )
+        if flip:
+            # the other elbow of the same triangle, which is only within the
+            # joint limits close to the straight arm (q4 < 0)
+            theta_246 = 2 * np.pi - theta_246
+        q4 = theta_246 + _THETA_H46 + _THETA_342 - 2 * np.pi
+        if flip:
+            is_valid &= q4 < 0
+
+        # q6
+        theta_462 = np.arccos(
+            np.clip((LL_26 + _LL46 - _LL24) / (2 * L_26 * _L46), -1, 1)
+        )
+        if flip:
+            theta_462 = -theta_462
+        theta_26H = _THETA_46H + theta_462
+        D_26 = -L_26 * np.cos(theta_26H)
+
+        Z_6 = _normalize(np.cross(z_7, x_6))
+        Y_6 = _normalize(np.cross(Z_6, x_6))
+        R_6 = np.stack([x_6, Y_6, Z_6], axis=2)
+        V_6_62 = (R_6.transpose(0, 2, 1) @ -V_26[:, :, None])[:, :, 0]
+
+        phi_6 = np.arctan2(V_6_62[:, 1], V_6_62[:, 0])
+        ratio = D_26 / np.hypot(V_6_62[:, 0], V_6_62[:, 1])
+        is_valid &= np.abs(ratio) <= 1
+        theta_6 = np.arcsin(np.clip(ratio, -1, 1))
+        q6 = np.stack([np.pi - theta_6 - phi_6, theta_6 - phi_6], axis=1)
+        q6 = (q6 + np.pi) % (2 * np.pi) - np.pi
+
+        # q1 and q2 from the direction of the upper arm
+        theta_P26 = 3 * np.pi / 2 - theta_462 - theta_246 - _THETA_342
+        theta_P = np.pi - theta_P26 - theta_26H
+        L_P6 = L_26 * np.sin(theta_P26) / np.sin(theta_P)
+
+        z_5 = (
+            R_6[:, None]
+            @ np.stack([np.sin(q6), np.cos(q6), np.zeros((N, 2))], axis=2)[
+                :, :, :, None
+            ]
+        )[:, :, :, 0]
+        V_2P = p_6[:, None] - L_P6[:, None, None] * z_5 - p_2
+        L_2P = np.linalg.norm(V_2P, axis=2)
+
+        q1 = np.arctan2(V_2P[:, :, 1], V_2P[:, :, 0])
+        q2 = np.arccos(np.clip(V_2P[:, :, 2] / L_2P, -1, 1))
+        is_singular = np.hypot(V_2P[:, :, 0], V_2P[:, :, 1]) < 1e-9
+        q1[is_singular] = np.broadcast_to(q1_singular, (N, 2))[is_singular]
+        q2[is_singular] = 0
+        q1 = np.stack([q1, np.where(q1 < 0, q1 + np.pi, q1 - np.pi)], axis=2)
+        q2 = np.stack([q2, -q2], axis=2)
+        q1[is_singular, 1] = q1[is_singular, 0]
+        q2[is_singular, 1] = 0
+
+        # (N, 2, 2) -> (N, 4) as [q6_0 + q1_0, q6_0 + q1_1, q6_1 + ...]
+        q1 = q1.reshape(N, 4)
+        q2 = q2.reshape(N, 4)
+        q6 = np.repeat(q6, 2, axis=1)
+        z_5 = np.repeat(z_5, 2, axis=1)
+        V_2P = np.repeat(V_2P, 2, axis=1)
+
+        # q3
+        z_3 = _normalize(V_2P)
+        y_3 = _normalize(-np.cross(V_26[:, None], V_2P))
+        x_3 = np.cross(y_3, z_3)
+        c1, s1 = np.cos(q1), np.sin(q1)
+        c2, s2 = np.cos(q2), np.sin(q2)
+        zeros = np.zeros_like(q1)
+        ones = np.ones_like(q1)
+        R_1 = np.stack(
+            [
+                np.stack([c1, -s1, zeros], axis=-1),
+                np.stack([s1, c1, zeros], axis=-1),
+                np.stack([zeros, zeros, ones], axis=-1),
+            ],
+            axis=-2,
+        )
+        R_12 = np.stack(
+            [
+                np.stack([c2, -s2, zeros], axis=-1),
+                np.stack([zeros, zeros, ones], axis=-1),
+                np.stack([-s2, -c2, zeros], axis=-1),
+            ],
+            axis=-2,
+        )
+        R_2 = R_1 @ R_12
+        x_23 = (R_2.transpose(0, 1, 3, 2) @ x_3[:, :, :, None])[:, :, :, 0]
+        q3 = np.arctan2(x_23[:, :, 2], x_23[:, :, 0])
+
+        # q5
+        V_H4 = p_2 + _D3 * z_3 + _A4 * x_3 - p_6[:, None] + _D5 * z_5
+        c6, s6 = np.cos(q6), np.sin(q6)
+        R_56 = np.stack(
+            [
+                np.stack([c6, -s6, zeros], axis=-1),
+                np.stack([zeros, zeros, -ones], axis=-1),
+                np.stack([s6, c6, zeros], axis=-1),
+            ],
+            axis=-2,
+        )
+        R_5 = R_6[:, None] @ R_56.transpose(0, 1, 3, 2)
+        V_5_H4 = (R_5.transpose(0, 1, 3, 2) @ V_H4[:, :, :, None])[:, :, :, 0]
+        q5 = -np.arctan2(V_5_H4[:, :, 1], V_5_H4[:, :, 0])
+
+    qs = np.stack(
+        [
+            q1,
+            q2,
+            q3,
+            np.repeat(q4[:, None], 4, axis=1),
+            q5,
+            q6,
+            np.repeat(q7[:, None], 4, axis=1),
+        ],
+        axis=2,
+    )
+    qs[~is_valid] = np.nan
+    return qs
+
+
+def panda_ik(Ts, q7, q1_singular=0):
+    # all the 8 solutions (N, 8, 7) of the panda_link7 frames Ts (N, 4, 4)
+    # and the joint 7 angles q7 (N,), with NaN where there's none, and the
+    # other joints are in [-pi, pi) and not checked with the joint limits
+    return np.concatenate(
+        [
+            _panda_ik(Ts, q7, q1_singular, flip=False),
+            _panda_ik(Ts, q7, q1_singular, flip=True),
+        ],
+        axis=1,
+    )
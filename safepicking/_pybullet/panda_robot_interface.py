@@ -10,7 +10,12 @@ import pybullet_planning
 from .. import geometry
 from .. import utils
 from . import utils as pybullet_utils
+from .collision import compute_allowed_collision_matrix
+from .ik_cache import IkCache
+from .kinematic_chain import KinematicChain
+from .panda_ik import panda_ik
 from .ompl_planning import PbPlanner
+from .ompl_planning import ValidityChecker
 from .suction_gripper import SuctionGripper
 
 import skrobot
@@ -20,6 +25,24 @@ here = path.Path(__file__).abspath().parent
 
 
 class PandaRobotInterface:
+    # link pairs which are not checked for self-collision in addition to the
+    # ones found by compute_allowed_collision_matrix()
+    # XXX: specific configurations for panda_drl.urdf
+    # panda_link5: front arm
+    # panda_link6: arm head
+    # panda_link7: wrist
+    # panda_link8: palm tip
+    # XXX: specific configurations for panda_suction.urdf
+    # panda_link7: wrist
+    ALLOWED_COLLISION_LINKS = [
+        ("panda_link7", "panda_suction_gripper"),
+        ("panda_link5", "panda_suction_gripper"),
+        ("panda_link7", "baseLink"),
+    ]
+
+    # computed once per robot model
+    _self_collision_pairs = {}
+
     def __init__(
         self,
         pose=None,
@@ -28,17 +51,28 @@ class PandaRobotInterface:
         suction_surface_alignment=True,
         planner="RRTConnect",
         robot_model="franka_panda/panda_suction",
+        collision_backend="pybullet",
+        validity_checking_resolution=0.01,
+        physicsClientId=0,
     ):
+        # collision_backend: "pybullet" or "spheres" of ValidityChecker
+        # validity_checking_resolution: the one of PbPlanner
         self.pose = pose
+        self.physicsClientId = physicsClientId
 
         urdf_file = here / f"data/{robot_model}.urdf"
+        self.urdf_file = urdf_file
+        self.robot_model_name = robot_model
         self.robot_model = skrobot.models.urdf.RobotModelFromURDF(
             urdf_file=urdf_file
         )
-        self.robot = pybullet_planning.load_pybullet(
-            urdf_file, fixed_base=True
+        with pybullet_utils.LockRenderer(physicsClientId=physicsClientId):
+            self.robot = p.loadURDF(
+                urdf_file, useFixedBase=True, physicsClientId=physicsClientId
+            )
+        self.ee = pybullet_utils.link_from_name(
+            self.robot, "tipLink", physicsClientId=physicsClientId
         )
-        self.ee = pybullet_planning.link_from_name(self.robot, "tipLink")
 
         self.gripper = SuctionGripper(
             self.robot,
@@ -46,9 +80,14 @@ class PandaRobotInterface:
             max_force=suction_max_force,
             surface_threshold=suction_surface_threshold,
             surface_alignment=suction_surface_alignment,
+            physicsClientId=physicsClientId,
         )
 
         self.attachments = []
+        # bodies which don't move in the workspace (e.g., the plane and
+        # walls), which the spheres backend checks with a signed distance
+        # field built once for them (opt-in with collision_backend="spheres")
+        self.static_obstacles = []
 
         if self.pose is not None:
             self.robot_model.translate(pose[0])
@@ -56,25 +95,45 @@ class PandaRobotInterface:
                 geometry.quaternion_matrix(pose[1])[:3, :3]
             )
 
-            pybullet_planning.set_pose(self.robot, self.pose)
+            pybullet_utils.set_pose(
+                self.robot, self.pose, physicsClientId=physicsClientId
+            )
 
         # Get revolute joint indices of robot (skip fixed joints).
-        n_joints = p.getNumJoints(self.robot)
-        joints = [p.getJointInfo(self.robot, i) for i in range(n_joints)]
+        n_joints = p.getNumJoints(self.robot, physicsClientId=physicsClientId)
+        joints = [
+            p.getJointInfo(self.robot, i, physicsClientId=physicsClientId)
+            for i in range(n_joints)
+        ]
         self.joints = [j[0] for j in joints if j[2] == p.JOINT_REVOLUTE]
+        self.joint_names = [
+            j[1].decode() for j in joints if j[2] == p.JOINT_REVOLUTE
+        ]
+
+        self.kinematic_chain = KinematicChain(
+            urdf_file, joint_names=self.joint_names
+        )
+        self._kinematic_links = {}
+        self._link_indices = {}
+        self._fk_cache = (None, {})
+        self.ik_cache = IkCache()
+        self._validity_checker = None
 
         self.homej = [0, -np.pi / 4, 0, -np.pi / 2, 0, np.pi / 4, np.pi / 4]
         for joint, joint_angle in zip(self.joints, self.homej):
-            p.resetJointState(self.robot, joint, joint_angle)
+            p.resetJointState(
+                self.robot, joint, joint_angle, physicsClientId=physicsClientId
+            )
         self.update_robot_model()
 
         self.planner = planner
+        self.collision_backend = collision_backend
+        self.validity_checking_resolution = validity_checking_resolution
 
         lower, upper = self.get_bounds()
-        for joint, min_angle, max_angle in zip(self.joints, lower, upper):
-            joint_name = pybullet_planning.get_joint_name(
-                self.robot, joint
-            ).decode()
+        for joint_name, min_angle, max_angle in zip(
+            self.joint_names, lower, upper
+        ):
             getattr(self.robot_model, joint_name).min_angle = min_angle
             getattr(self.robot_model, joint_name).max_angle = max_angle
 
@@ -82,7 +141,9 @@ class PandaRobotInterface:
         lower_bounds = []
         upper_bounds = []
         for joint in self.joints:
-            lower, upper = p.getJointInfo(self.robot, joint)[8:10]
+            lower, upper = p.getJointInfo(
+                self.robot, joint, physicsClientId=self.physicsClientId
+            )[8:10]
             center = (upper + lower) / 2
             width = upper - lower
             width = width * 0.96
@@ -94,34 +155,66 @@ class PandaRobotInterface:
         upper_bounds = np.array(upper_bounds)
         return lower_bounds, upper_bounds
 
+    def get_self_collision_pairs(self):
+        # link pairs to check self-collision, which exclude the ones of the
+        # allowed collision matrix
+        if self.urdf_file not in self._self_collision_pairs:
+            lower, upper = self.get_bounds()
+            allowed = compute_allowed_collision_matrix(
+                self.robot,
+                self.joints,
+                lower,
+                upper,
+                allowed_link_names=self.ALLOWED_COLLISION_LINKS,
+                physicsClientId=self.physicsClientId,
+            )
+            self._self_collision_pairs[self.urdf_file] = [
+                (link_a, link_b)
+                for link_a, link_b in itertools.combinations(
+                    range(allowed.shape[0]), 2
+                )
+                if not allowed[link_a, link_b]
+            ]
+        return self._self_collision_pairs[self.urdf_file]
+
     def step_simulation(self):
         self.gripper.step_simulation()
 
     def update_robot_model(self, j=None):
         if j is None:
             j = self.getj()
-        for joint, joint_angle in zip(self.joints, j):
-            joint_name = pybullet_planning.get_joint_name(
-                self.robot, joint
-            ).decode()
+        for joint_name, joint_angle in zip(self.joint_names, j):
             getattr(self.robot_model, joint_name).joint_angle(joint_angle)
 
     def setj(self, joint_positions):
         for joint, joint_position in zip(self.joints, joint_positions):
-            p.resetJointState(self.robot, joint, joint_position)
+            p.resetJointState(
+                self.robot,
+                joint,
+                joint_position,
+                physicsClientId=self.physicsClientId,
+            )
         for attachment in self.attachments:
             attachment.assign()
 
     def getj(self):
-        joint_positions = []
-        for joint in self.joints:
-            joint_positions.append(p.getJointState(self.robot, joint)[0])
-        return joint_positions
+        joint_states = p.getJointStates(
+            self.robot, self.joints, physicsClientId=self.physicsClientId
+        )
+        return [joint_state[0] for joint_state in joint_states]
 
     def movej(self, targj, speed=0.01, timeout=5, raise_on_timeout=False):
         assert len(targj) == len(self.joints)
+        time_step = pybullet_utils.get_time_step(
+            physicsClientId=self.physicsClientId
+        )
         for i in itertools.count():
-            currj = [p.getJointState(self.robot, i)[0] for i in self.joints]
+            currj = [
+                p.getJointState(
+                    self.robot, i, physicsClientId=self.physicsClientId
+                )[0]
+                for i in self.joints
+            ]
             currj = np.array(currj)
             diffj = targj - currj
             if all(np.abs(diffj) < 1e-2):
@@ -138,16 +231,18 @@ class PandaRobotInterface:
                 controlMode=p.POSITION_CONTROL,
                 targetPositions=stepj,
                 positionGains=gains,
+                physicsClientId=self.physicsClientId,
             )
             yield i
 
-            if i >= (timeout / pybullet_planning.get_time_step()):
+            if i >= (timeout / time_step):
                 if raise_on_timeout:
                     raise RuntimeError("timeout in joint motor control")
                 else:
                     logger.error("timeout in joint motor control")
                     return
 
+    @utils.profiler.profile
     def solve_ik(
         self,
         pose,
@@ -156,8 +251,19 @@ class PandaRobotInterface:
         random_state=None,
         validate=False,
         obstacles=None,
+        method="iterative",
         **kwargs,
     ):
+        if method == "analytic":
+            for j in self.solve_ik_analytic(
+                pose, move_target=move_target, **kwargs
+            ):
+                if not validate or self.validatej(j, obstacles=obstacles):
+                    return j.tolist()
+            return
+        elif method != "iterative":
+            raise ValueError(f"unsupported method: {method}")
+
         if move_target is None:
             move_target = self.robot_model.tipLink
         if random_state is None:
@@ -169,7 +275,20 @@ class PandaRobotInterface:
             scale = random_state.uniform(size=len(lower))
             return lower + scale * extents
 
-        self.update_robot_model()
+        # solutions of the nearby poses are reused as is or to warm start,
+        # where only the ones near the current joint positions are used
+        if self.ik_cache is not None:
+            j, j_seed = self.ik_cache.get(
+                pose, move_target.name, j_current=self.getj(), **kwargs
+            )
+            if j is not None and (
+                not validate or self.validatej(j, obstacles=obstacles)
+            ):
+                return j.tolist()
+        else:
+            j_seed = None
+
+        self.update_robot_model(j_seed)
         c = geometry.Coordinate(*pose)
         for _ in range(n_init):
             result = self.robot_model.inverse_kinematics(
@@ -186,14 +305,163 @@ class PandaRobotInterface:
         else:
             # logger.warning("Failed to solve IK")
             return
-        j = []
-        for joint in self.joints:
-            joint_name = pybullet_planning.get_joint_name(
-                self.robot, joint
-            ).decode()
-            j.append(getattr(self.robot_model, joint_name).joint_angle())
+        j = [
+            getattr(self.robot_model, joint_name).joint_angle()
+            for joint_name in self.joint_names
+        ]
+        if self.ik_cache is not None:
+            self.ik_cache.put(pose, move_target.name, j, **kwargs)
         return j
 
+    def _get_kinematic_link(self, move_target):
+        # the link of the kinematic chain which move_target is fixed to, and
+        # the offset from it
+        cached = self._kinematic_links.get(move_target.name)
+        if cached is not None and cached[0] is move_target:
+            return cached[1]
+
+        link = move_target
+        while link.name not in self.kinematic_chain.links:
+            link = link.parent
+        if link is move_target:
+            offset = None
+        else:
+            offset = (
+                np.linalg.inv(link.worldcoords().T())
+                @ move_target.worldcoords().T()
+            )
+        self._kinematic_links[move_target.name] = (
+            move_target,
+            (link.name, offset),
+        )
+        return link.name, offset
+
+    def fk(self, js, name="tipLink"):
+        # poses (N, 7) of the link in the world for joint positions (N, ndof)
+        # computed all at once, or (7,) for (ndof,)
+        js = np.asarray(js, dtype=float)
+        link, offset = self._get_kinematic_link(
+            getattr(self.robot_model, name)
+        )
+        Ts = self.kinematic_chain.fk(
+            js.reshape(-1, len(self.joints)), link, offset=offset
+        )
+        if self.pose is not None:
+            Ts = geometry.transformation_matrix(*self.pose) @ Ts
+        poses = np.array(
+            [
+                np.hstack([T[:3, 3], geometry.quaternion_from_matrix(T)])
+                for T in Ts
+            ]
+        )
+        return poses.reshape(js.shape[:-1] + (7,))
+
+    def _get_transformation_matrices(self, poses):
+        # (N, 7) poses in the world to (N, 4, 4) in the robot base
+        Ts = np.array(
+            [
+                geometry.transformation_matrix(pose[:3], pose[3:])
+                for pose in np.asarray(poses, dtype=float).reshape(-1, 7)
+            ]
+        ).reshape(-1, 4, 4)
+        if self.pose is not None:
+            Ts = np.linalg.inv(geometry.transformation_matrix(*self.pose)) @ Ts
+        return Ts
+
+    @utils.profiler.profile
+    def solve_ik_analytic(
+        self,
+        pose,
+        move_target=None,
+        rotation_axis=True,
+        num_q7=64,
+        num_rotations=36,
+    ):
+        # all the closed-form IK solutions (N, ndof) within the bounds found
+        # by sweeping joint 7 (and rotation around rotation_axis), sorted by
+        # the distance from the current joint positions
+        if move_target is None:
+            move_target = self.robot_model.tipLink
+        link, offset = self._get_kinematic_link(move_target)
+
+        T_link_to_7 = self.kinematic_chain.get_fixed_transform(
+            "panda_link7", link
+        )
+        if offset is not None:
+            T_link_to_7 = T_link_to_7 @ offset
+
+        T = self._get_transformation_matrices(np.hstack(pose))
+        if rotation_axis is True:
+            Ts = T
+        elif rotation_axis in ["x", "y", "z"]:
+            axis = np.eye(3)[:, "xyz".index(rotation_axis)]
+            angles = np.linspace(-np.pi, np.pi, num_rotations, endpoint=False)
+            Ts = T @ np.array(
+                [geometry.euler_matrix(angle * axis) for angle in angles]
+            )
+        else:
+            raise ValueError(f"unsupported rotation_axis: {rotation_axis}")
+        Ts = Ts @ np.linalg.inv(T_link_to_7)
+
+        lower, upper = self.get_bounds()
+        q7 = np.linspace(lower[6], upper[6], num_q7)
+
+        j_current = np.array(self.getj())
+        js = panda_ik(
+            np.repeat(Ts, num_q7, axis=0),
+            np.tile(q7, Ts.shape[0]),
+            q1_singular=j_current[0],
+        ).reshape(-1, 7)
+        js = js[~np.isnan(js).any(axis=1)]
+
+        js = np.where(js < lower, js + 2 * np.pi, js)
+        js = np.where(js > upper, js - 2 * np.pi, js)
+        js = js[((lower <= js) & (js <= upper)).all(axis=1)]
+
+        return js[np.argsort(np.abs(js - j_current).max(axis=1))]
+
+    @utils.profiler.profile
+    def solve_ik_batch(
+        self,
+        poses,
+        move_target=None,
+        seeds=None,
+        rotation_axis=True,
+        validate=False,
+        obstacles=None,
+        **kwargs,
+    ):
+        # IK of poses (N, 7) solved all at once with the kinematic chain,
+        # which returns joint positions (N, ndof) with NaN where IK failed
+        if move_target is None:
+            move_target = self.robot_model.tipLink
+        link, offset = self._get_kinematic_link(move_target)
+
+        poses = np.asarray(poses, dtype=float).reshape(-1, 7)
+        Ts = self._get_transformation_matrices(poses)
+
+        if seeds is None:
+            seeds = self.getj()
+        seeds = np.broadcast_to(seeds, (poses.shape[0], len(self.joints)))
+
+        lower, upper = self.get_bounds()
+        js, success = self.kinematic_chain.inverse_kinematics(
+            Ts,
+            seeds=seeds,
+            link=link,
+            lower=lower,
+            upper=upper,
+            offset=offset,
+            rotation_axis=rotation_axis,
+            **kwargs,
+        )
+        if validate:
+            success[success] = self.validatej_batch(
+                js[success], obstacles=obstacles
+            )
+        js[~success] = np.nan
+        return js
+
     # def _solve_ik_pybullet(self, pose):
     #     n_joints = p.getNumJoints(self.robot)
     #     lower_limits = []
@@ -263,15 +531,38 @@ class PandaRobotInterface:
             # root_link=self.robot_model.root_link,
         )
 
+    def _get_validity_checker(self, obstacles=None, min_distances=None):
+        # reused for all the validatej() calls until collision_backend is
+        # changed
+        if (
+            self._validity_checker is None
+            or self._validity_checker.collision_backend
+            != self.collision_backend
+        ):
+            self._validity_checker = ValidityChecker(
+                self, collision_backend=self.collision_backend
+            )
+        self._validity_checker.update(
+            obstacles=obstacles or [], min_distances=min_distances or {}
+        )
+        return self._validity_checker
+
+    @utils.profiler.profile
     def validatej(self, j, obstacles=None, min_distances=None):
-        planner = PbPlanner(
-            self,
-            obstacles=obstacles,
-            min_distances=min_distances,
-            planner=self.planner,
+        validity_checker = self._get_validity_checker(
+            obstacles=obstacles, min_distances=min_distances
         )
-        return planner.validityChecker.isValid(j)
+        return validity_checker.isValid(j)
 
+    @utils.profiler.profile
+    def validatej_batch(self, js, obstacles=None, min_distances=None):
+        # validity (N,) of joint positions (N, ndof)
+        validity_checker = self._get_validity_checker(
+            obstacles=obstacles, min_distances=min_distances
+        )
+        return validity_checker.are_valid(js)
+
+    @utils.profiler.profile
     def planj(
         self,
         j,
@@ -279,7 +570,10 @@ class PandaRobotInterface:
         min_distances=None,
         min_distances_start_goal=None,
         planner_range=0,
+        roadmap=None,
     ):
+        # roadmap: Roadmap which is tried first to connect the start and
+        # goal, where the planner is used if it fails
         if self.planner == "Naive":
             return [j]
 
@@ -290,6 +584,8 @@ class PandaRobotInterface:
             min_distances_start_goal=min_distances_start_goal,
             planner=self.planner,
             planner_range=planner_range,
+            collision_backend=self.collision_backend,
+            validity_checking_resolution=self.validity_checking_resolution,
         )
 
         planner.validityChecker.start = self.getj()
@@ -303,12 +599,93 @@ class PandaRobotInterface:
             logger.warning("Goal state is invalid")
             return
 
+        if roadmap is not None:
+            path = roadmap.plan(
+                self.getj(), j, validity_checker=planner.validityChecker
+            )
+            if path is not None:
+                return path
+
         result = planner.plan(self.getj(), j)
 
         if result is None:
             logger.warning("No solution found")
             return
 
+        path = self._get_joint_path(result)
+
+        if not np.allclose(j, path[-1]):
+            # the goal is not reached
+            return
+
+        return path
+
+    @utils.profiler.profile
+    def planj_any(
+        self,
+        js,
+        obstacles=None,
+        min_distances=None,
+        min_distances_start_goal=None,
+        planner_range=0,
+        roadmap=None,
+    ):
+        # path to any of the goals (M, ndof) in a single search, whose last
+        # one is the reached goal, where the invalid goals are skipped
+        # it's the first one found by the planner, or the cheapest one for
+        # optimizing planners (e.g., RRTstar)
+        # roadmap: the one of planj(), which is tried for the goals in order
+        js = np.asarray(js, dtype=float).reshape(-1, len(self.joints))
+        if self.planner == "Naive":
+            return [js[0]]
+
+        planner = PbPlanner(
+            self,
+            obstacles=obstacles,
+            min_distances=min_distances,
+            min_distances_start_goal=min_distances_start_goal,
+            planner=self.planner,
+            planner_range=planner_range,
+            collision_backend=self.collision_backend,
+            validity_checking_resolution=self.validity_checking_resolution,
+        )
+
+        planner.validityChecker.start = self.getj()
+        planner.validityChecker.goal = js
+
+        if not planner.validityChecker.isValid(self.getj()):
+            logger.warning("Start state is invalid")
+            return
+
+        js = js[[planner.validityChecker.isValid(j) for j in js]]
+        if js.size == 0:
+            logger.warning("Goal states are invalid")
+            return
+
+        if roadmap is not None:
+            for j in js:
+                path = roadmap.plan(
+                    self.getj(), j, validity_checker=planner.validityChecker
+                )
+                if path is not None:
+                    return path
+
+        result = planner.plan_any(self.getj(), js)
+
+        if result is None:
+            logger.warning("No solution found")
+            return
+
+        path = self._get_joint_path(result)
+
+        if not np.isclose(path[-1], js).all(axis=1).any():
+            # none of the goals is reached
+            return
+
+        return path
+
+    def _get_joint_path(self, result):
+        # joint positions (N, ndof) of the path of ompl
         ndof = len(self.joints)
         state_count = result.getStateCount()
         path = np.zeros((state_count, ndof), dtype=float)
@@ -318,16 +695,13 @@ class PandaRobotInterface:
             for i_dof in range(ndof):
                 path_i[i_dof] = state[i_dof]
             path[i_state] = path_i
-
-        if not np.allclose(j, path[-1]):
-            # the goal is not reached
-            return
-
         return path
 
     def grasp(self, min_dz=None, max_dz=None, rotation_axis="z", speed=0.01):
         c = geometry.Coordinate(
-            *pybullet_planning.get_link_pose(self.robot, self.ee)
+            *pybullet_utils.get_link_pose(
+                self.robot, self.ee, physicsClientId=self.physicsClientId
+            )
         )
         dz_done = 0
         while True:
@@ -360,7 +734,9 @@ class PandaRobotInterface:
     def add_link(self, name, pose, parent=None):
         if parent is None:
             parent = self.ee
-        parent_name = pybullet_planning.get_link_name(self.robot, parent)
+        parent_name = pybullet_utils.get_link_name(
+            self.robot, parent, physicsClientId=self.physicsClientId
+        )
 
         link_list = self.robot_model.link_list.copy()
         joint_list = self.robot_model.joint_list.copy()
@@ -386,10 +762,32 @@ class PandaRobotInterface:
         )
 
     def get_pose(self, name):
-        self.update_robot_model()
-        T_a_to_world = getattr(self.robot_model, name).worldcoords().T()
-        a_to_world = geometry.Coordinate.from_matrix(T_a_to_world).pose
-        return a_to_world
+        # poses are cached until the joint positions change
+        j = np.array(self.getj())
+        key, poses = self._fk_cache
+        if key != j.tobytes():
+            poses = {}
+            self._fk_cache = (j.tobytes(), poses)
+        if name not in poses:
+            link, offset = self._get_kinematic_link(
+                getattr(self.robot_model, name)
+            )
+            if link not in self._link_indices:
+                self._link_indices[link] = pybullet_utils.link_from_name(
+                    self.robot, link, physicsClientId=self.physicsClientId
+                )
+            pose = pybullet_utils.get_link_pose(
+                self.robot,
+                self._link_indices[link],
+                physicsClientId=self.physicsClientId,
+            )
+            if offset is not None:
+                pose = geometry.pose_from_matrix(
+                    geometry.transformation_matrix(*pose) @ offset
+                )
+            poses[name] = np.hstack(pose)
+        pose = poses[name]
+        return pose[:3].copy(), pose[3:].copy()
 
     def add_camera(
         self,
@@ -413,20 +811,24 @@ class PandaRobotInterface:
             pose=pose,
             parent=self.robot,
             parent_link=parent,
+            physicsClientId=self.physicsClientId,
         )
 
         self.camera = dict(fovy=fovy, height=height, width=width)
 
+    @utils.profiler.profile
     def get_camera_image(self):
         if not hasattr(self.robot_model, "camera_link"):
             raise ValueError
 
-        self.update_robot_model()
         return pybullet_utils.get_camera_image(
-            T_cam2world=self.robot_model.camera_link.worldcoords().T(),
+            T_cam2world=geometry.transformation_matrix(
+                *self.get_pose("camera_link")
+            ),
             fovy=self.camera["fovy"],
             height=self.camera["height"],
             width=self.camera["width"],
+            physicsClientId=self.physicsClientId,
         )
 
     def get_opengl_intrinsic_matrix(self):
@@ -496,7 +898,9 @@ class PandaRobotInterface:
             )
 
             T_ee_to_world = geometry.transformation_matrix(
-                *pybullet_utils.get_pose(self.robot, self.ee)
+                *pybullet_utils.get_pose(
+                    self.robot, self.ee, physicsClientId=self.physicsClientId
+                )
             )
             T_ee_to_ee = np.eye(4)
             T_ee_af_to_ee = T_ee_to_ee_af_in_ee @ T_ee_to_ee
@@ -509,7 +913,12 @@ class PandaRobotInterface:
 
             vec = geometry.transform_points([[0, 0, 0], [0, 0, 1]], c.matrix)
             if 0:
-                pybullet_planning.add_line(vec[0], vec[1], width=3)
+                pybullet_utils.add_line(
+                    vec[0],
+                    vec[1],
+                    width=3,
+                    physicsClientId=self.physicsClientId,
+                )
             v0 = [0, 0, -1]
             v1 = vec[1] - vec[0]
             v1 /= np.linalg.norm(v1)
@@ -557,7 +966,9 @@ class PandaRobotInterface:
             yield
 
         # XXX: getting ground truth object pose
-        obj_to_world = pybullet_planning.get_pose(object_id)
+        obj_to_world = pybullet_utils.get_pose(
+            object_id, physicsClientId=self.physicsClientId
+        )
         if noise:
             pos, qua = obj_to_world
             pos += random_state.normal(0, [0.003, 0.003, 0.003], 3)
@@ -575,8 +986,12 @@ class PandaRobotInterface:
                 pybullet_planning.invert(ee_to_world), obj_to_world
             )
             self.attachments = [
-                pybullet_planning.Attachment(
-                    self.robot, self.ee, obj_to_ee, object_id
+                pybullet_utils.Attachment(
+                    self.robot,
+                    self.ee,
+                    obj_to_ee,
+                    object_id,
+                    physicsClientId=self.physicsClientId,
                 )
             ]
 
@@ -631,13 +1046,14 @@ class PandaRobotInterface:
             for _ in self.movej(j, speed=speed, timeout=timeout / len(js)):
                 yield
 
+    @utils.profiler.profile
     def get_cartesian_path(self, j=None, pose=None, rotation_axis=True):
         if not (j is None) ^ (pose is None):
             raise ValueError("Either j or coords must be given")
 
         p_start = self.get_pose("tipLink")
 
-        with pybullet_planning.WorldSaver():
+        with pybullet_utils.WorldSaver(physicsClientId=self.physicsClientId):
             if j is None:
                 j = self.solve_ik(pose, rotation_axis=rotation_axis)
                 if j is None:
@@ -0,0 +1,358 @@
+import multiprocessing
+import multiprocessing.connection
+
+from loguru import logger
+import numpy as np
+from ompl import util as ou
+import pybullet as p
+
+from .. import geometry
+from . import utils as pybullet_utils
+from .ompl_planning import PbPlanner
+from .panda_robot_interface import PandaRobotInterface
+from .sphere_collision import get_body_shapes
+
+
+def _get_world(ri, obstacles):
+    # description of the obstacles and attachments to mirror them in the
+    # workers, where each body is a rigid body of the shapes of all the
+    # links in its base frame
+    bodies = list(obstacles) + [
+        attachment.child
+        for attachment in ri.attachments
+        if attachment.child not in obstacles
+    ]
+    world = dict(
+        j=ri.getj(),
+        obstacles=list(obstacles),
+        bodies={},
+        attachments=[
+            (attachment.parent_link, attachment.grasp_pose, attachment.child)
+            for attachment in ri.attachments
+        ],
+    )
+    for body in bodies:
+        pose = pybullet_utils.get_pose(
+            body, physicsClientId=ri.physicsClientId
+        )
+        T_base = np.linalg.inv(geometry.transformation_matrix(*pose))
+        shapes = []
+        for link in [-1] + pybullet_utils.get_links(
+            body, physicsClientId=ri.physicsClientId
+        ):
+            T_link = T_base @ geometry.transformation_matrix(
+                *pybullet_utils.get_link_pose(
+                    body, link, physicsClientId=ri.physicsClientId
+                )
+            )
+            for shape_type, dimensions, filename, T in get_body_shapes(
+                body, link, physicsClientId=ri.physicsClientId
+            ):
+                shapes.append((shape_type, dimensions, filename, T_link @ T))
+        world["bodies"][body] = (pose, shapes)
+    return world
+
+
+def _is_same_shapes(shapes_a, shapes_b):
+    return len(shapes_a) == len(shapes_b) and all(
+        shape_a[:3] == shape_b[:3] and np.allclose(shape_a[3], shape_b[3])
+        for shape_a, shape_b in zip(shapes_a, shapes_b)
+    )
+
+
+def _create_body(shapes, pose, physicsClientId=0):
+    kwargs = dict(
+        shapeTypes=[],
+        radii=[],
+        halfExtents=[],
+        lengths=[],
+        fileNames=[],
+        meshScales=[],
+        collisionFramePositions=[],
+        collisionFrameOrientations=[],
+    )
+    for shape_type, dimensions, filename, T in shapes:
+        kwargs["shapeTypes"].append(shape_type)
+        if shape_type == p.GEOM_BOX:
+            kwargs["halfExtents"].append(np.array(dimensions[:3]) / 2)
+        else:
+            kwargs["halfExtents"].append([0, 0, 0])
+        if shape_type == p.GEOM_SPHERE:
+            kwargs["radii"].append(dimensions[0])
+        elif shape_type in [p.GEOM_CYLINDER, p.GEOM_CAPSULE]:
+            kwargs["radii"].append(dimensions[1])
+        else:
+            kwargs["radii"].append(0)
+        if shape_type in [p.GEOM_CYLINDER, p.GEOM_CAPSULE]:
+            kwargs["lengths"].append(dimensions[0])
+        else:
+            kwargs["lengths"].append(0)
+        if shape_type == p.GEOM_MESH:
+            kwargs["fileNames"].append(filename)
+            kwargs["meshScales"].append(dimensions[:3])
+        else:
+            kwargs["fileNames"].append("")
+            kwargs["meshScales"].append([1, 1, 1])
+        kwargs["collisionFramePositions"].append(T[:3, 3])
+        kwargs["collisionFrameOrientations"].append(
+            geometry.quaternion_from_matrix(T)
+        )
+    collision_shape_id = p.createCollisionShapeArray(
+        physicsClientId=physicsClientId, **kwargs
+    )
+    return p.createMultiBody(
+        baseCollisionShapeIndex=collision_shape_id,
+        basePosition=pose[0],
+        baseOrientation=pose[1],
+        physicsClientId=physicsClientId,
+    )
+
+
+def _update_bodies(bodies, world, physicsClientId=0):
+    # mirrored bodies (id, shapes) of the ones of the world, where the ones
+    # of the same shapes are only moved
+    for body in list(bodies):
+        if body not in world["bodies"] or not _is_same_shapes(
+            bodies[body][1], world["bodies"][body][1]
+        ):
+            p.removeBody(bodies.pop(body)[0], physicsClientId=physicsClientId)
+    for body, (pose, shapes) in world["bodies"].items():
+        if body not in bodies:
+            bodies[body] = (
+                _create_body(shapes, pose, physicsClientId=physicsClientId),
+                shapes,
+            )
+        pybullet_utils.set_pose(
+            bodies[body][0], pose, physicsClientId=physicsClientId
+        )
+
+
+def _plan(ri, bodies, planner, data, is_cancelled):
+    # path of PandaRobotInterface.planj() in the mirrored world
+    world = data["world"]
+    _update_bodies(bodies, world, physicsClientId=ri.physicsClientId)
+    ri.attachments = [
+        pybullet_utils.Attachment(
+            ri.robot,
+            parent_link,
+            grasp_pose,
+            bodies[child][0],
+            physicsClientId=ri.physicsClientId,
+        )
+        for parent_link, grasp_pose, child in world["attachments"]
+    ]
+    ri.setj(world["j"])
+
+    def get_min_distances(min_distances):
+        # of the bodies and links in the mirrored world
+        mirrored = {}
+        for (body, link), min_distance in min_distances.items():
+            if body == data["robot"]:
+                mirrored[(ri.robot, link)] = min_distance
+            elif body in bodies:
+                mirrored[(bodies[body][0], link)] = min_distance
+        return mirrored
+
+    pb_planner = PbPlanner(
+        ri,
+        obstacles=[bodies[body][0] for body in world["obstacles"]],
+        min_distances=get_min_distances(data["min_distances"]),
+        min_distances_start_goal=get_min_distances(
+            data["min_distances_start_goal"]
+        ),
+        planner=planner,
+        planner_range=data["planner_range"],
+        collision_backend=ri.collision_backend,
+        validity_checking_resolution=ri.validity_checking_resolution,
+        solve_time=data["solve_time"],
+        is_cancelled=is_cancelled,
+    )
+    pb_planner.validityChecker.start = world["j"]
+    pb_planner.validityChecker.goal = data["j"]
+    if not pb_planner.validityChecker.isValid(world["j"]):
+        return
+    if not pb_planner.validityChecker.isValid(data["j"]):
+        return
+
+    result = pb_planner.plan(world["j"], data["j"])
+    if result is None:
+        return
+    path = ri._get_joint_path(result)
+    if not np.allclose(data["j"], path[-1]):
+        return
+    return path
+
+
+def _worker(remote, parent_remote, ri_kwargs, planner, seed, cancelled):
+    parent_remote.close()
+
+    ou.RNG.setSeed(seed)
+    physicsClientId = p.connect(p.DIRECT)
+    ri = PandaRobotInterface(physicsClientId=physicsClientId, **ri_kwargs)
+    bodies = {}
+
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == "plan":
+                request = data["request"]
+                if cancelled.value >= request:
+                    # the service already returned a path of it
+                    remote.send(dict(request=request, path=None))
+                    continue
+                try:
+                    path = _plan(
+                        ri,
+                        bodies,
+                        planner,
+                        data,
+                        is_cancelled=lambda: cancelled.value >= request,
+                    )
+                except Exception:
+                    # the others of the portfolio can still find one
+                    logger.exception(f"{planner} failed")
+                    path = None
+                remote.send(dict(request=request, path=path))
+            elif cmd == "close":
+                break
+            else:
+                raise ValueError(f"unknown command: {cmd}")
+    finally:
+        p.disconnect(physicsClientId=physicsClientId)
+        remote.close()
+
+
+class PlanningService:
+    # portfolio of planners in worker processes, each of which holds a
+    # mirrored copy of the robot and the obstacles and plans the same query
+    # in parallel, where the first valid path is returned and the others
+    # are cancelled
+    # planners: ompl planner of each worker, where the same ones are run
+    # with the different seeds
+    # solve_time: max time of each query, which is the same as PbPlanner
+
+    def __init__(self, ri, planners=("RRTConnect",) * 4, solve_time=1):
+        self.ri = ri
+        self.planners = list(planners)
+        self.solve_time = solve_time
+
+        ri_kwargs = dict(
+            pose=ri.pose,
+            robot_model=ri.robot_model_name,
+            collision_backend=ri.collision_backend,
+            validity_checking_resolution=ri.validity_checking_resolution,
+        )
+
+        ctx = multiprocessing.get_context("spawn")
+
+        # id of the latest cancelled request
+        self._cancelled = ctx.Value("i", 0)
+        self._request = 0
+
+        self._remotes = []
+        self._processes = []
+        # seeds from 1, as ompl replaces 0 with 1
+        for seed, planner in enumerate(self.planners, start=1):
+            remote, work_remote = ctx.Pipe()
+            process = ctx.Process(
+                target=_worker,
+                args=(
+                    work_remote,
+                    remote,
+                    ri_kwargs,
+                    planner,
+                    seed,
+                    self._cancelled,
+                ),
+                daemon=True,
+            )
+            process.start()
+            work_remote.close()
+            self._remotes.append(remote)
+            self._processes.append(process)
+        self._closed = False
+
+    def planj(
+        self,
+        j,
+        obstacles=None,
+        min_distances=None,
+        min_distances_start_goal=None,
+        planner_range=0,
+    ):
+        # the same as PandaRobotInterface.planj() from the current joint
+        # positions, where min_distances can be a list of the ones to try
+        # (e.g., relaxed clearances), which are planned by the workers in
+        # turn, and the remaining ones are sent to the workers which failed
+        obstacles = obstacles or []
+        if not isinstance(min_distances, (list, tuple)):
+            min_distances = [min_distances]
+        min_distances = [
+            min_distances_i or {} for min_distances_i in min_distances
+        ]
+
+        self._request += 1
+        world = _get_world(self.ri, obstacles)
+
+        def send(remote, min_distances_i):
+            remote.send(
+                (
+                    "plan",
+                    dict(
+                        request=self._request,
+                        world=world,
+                        robot=self.ri.robot,
+                        j=np.asarray(j, dtype=float),
+                        min_distances=min_distances_i,
+                        min_distances_start_goal=min_distances_start_goal
+                        or {},
+                        planner_range=planner_range,
+                        solve_time=self.solve_time,
+                    ),
+                )
+            )
+
+        # the extra workers plan the same ones with the different seeds
+        for index, remote in enumerate(self._remotes):
+            send(remote, min_distances[index % len(min_distances)])
+        pending = min_distances[len(self._remotes) :]
+
+        # the replies of the previous requests are dropped, which are
+        # received before the ones of this request in each pipe
+        remotes = list(self._remotes)
+        while remotes:
+            for remote in multiprocessing.connection.wait(remotes):
+                try:
+                    result = remote.recv()
+                except EOFError:
+                    logger.error("planning worker is dead")
+                    remotes.remove(remote)
+                    continue
+                if result["request"] != self._request:
+                    continue
+                if result["path"] is not None:
+                    # the others stop at the next check of the planners
+                    self._cancelled.value = self._request
+                    return result["path"]
+                if pending:
+                    send(remote, pending.pop(0))
+                else:
+                    remotes.remove(remote)
+        logger.warning("No solution found")
+
+    def close(self):
+        if self._closed:
+            return
+        self._cancelled.value = self._request
+        for remote in self._remotes:
+            remote.send(("close", None))
+        # the remaining replies are read to not block the workers
+        for remote in self._remotes:
+            try:
+                while True:
+                    remote.recv()
+            except EOFError:
+                pass
+        for process in self._processes:
+            process.join()
+        self._closed = True
@@ -0,0 +1,315 @@
+import hashlib
+import heapq
+
+from loguru import logger
+import numpy as np
+import sklearn.neighbors
+
+from . import utils as pybullet_utils
+from .ompl_planning import ValidityChecker
+from .sphere_collision import get_body_shapes
+
+
+def _round(x):
+    # + 0.0 for the same bytes of -0.0 and 0.0
+    return np.round(np.asarray(x, dtype=float), 4) + 0.0
+
+
+class Roadmap:
+    # probabilistic roadmap of the robot for static obstacles, which is
+    # reused for many planning queries and saved to a file, where the start
+    # and goal are only connected to it
+    # the vertices and edges are valid for the obstacles and min_distances
+    # without attachments, and the paths are checked lazily with the
+    # validity checker of the query if it's of others
+    # num_neighbors: nearest vertices to connect with each vertex
+    # resolution: the one of ValidityChecker.are_valid_motions()
+
+    def __init__(
+        self,
+        ri,
+        obstacles=None,
+        min_distances=None,
+        num_neighbors=10,
+        resolution=0.01,
+    ):
+        self.ri = ri
+        self.num_neighbors = num_neighbors
+        self.resolution = resolution
+        self.validity_checker = ValidityChecker(
+            ri,
+            obstacles=obstacles,
+            min_distances=min_distances,
+            collision_backend=ri.collision_backend,
+        )
+
+        self.vertices = np.zeros((0, len(ri.joints)))
+        self.edges = np.zeros((0, 2), dtype=int)
+        self._neighbors = []
+        self._kdtree = None
+
+    def _add_edges(self, edges):
+        edges = np.asarray(edges, dtype=int).reshape(-1, 2)
+        self.edges = np.vstack([self.edges, edges])
+        for a, b in edges:
+            self._neighbors[a].add(b)
+            self._neighbors[b].add(a)
+
+    def _query(self, js, k):
+        # indices (N, k) of the nearest vertices of the joint positions
+        k = min(k, len(self.vertices))
+        if k == 0:
+            return np.zeros((len(js), 0), dtype=int)
+        _, indices = self._kdtree.query(js, k=k)
+        return indices
+
+    def grow(self, num_samples, random_state=None):
+        # adds the valid ones of the sampled joint positions and connects
+        # them with their nearest vertices, which are checked in batches
+        if self.ri.attachments:
+            raise ValueError("roadmap must be built without attachments")
+        if random_state is None:
+            random_state = np.random.RandomState()
+
+        lower = self.validity_checker.lower
+        upper = self.validity_checker.upper
+        js = lower + random_state.uniform(size=(num_samples, len(lower))) * (
+            upper - lower
+        )
+        js = js[self.validity_checker.are_valid(js)]
+
+        offset = len(self.vertices)
+        self.vertices = np.vstack([self.vertices, js])
+        self._neighbors += [set() for _ in js]
+        self._kdtree = sklearn.neighbors.KDTree(self.vertices)
+
+        # k + 1 for the vertex itself
+        indices = self._query(js, self.num_neighbors + 1)
+        candidates = set()
+        for i, indices_i in enumerate(indices, start=offset):
+            for j in indices_i:
+                if j != i and j not in self._neighbors[i]:
+                    candidates.add((min(i, j), max(i, j)))
+        candidates = np.array(sorted(candidates), dtype=int).reshape(-1, 2)
+        is_valid = self.validity_checker.are_valid_motions(
+            self.vertices[candidates[:, 0]],
+            self.vertices[candidates[:, 1]],
+            resolution=self.resolution,
+        )
+        self._add_edges(candidates[is_valid])
+        logger.info(
+            f"roadmap: {len(self.vertices)} vertices, "
+            f"{len(self.edges)} edges"
+        )
+
+    def _is_trusted(self, validity_checker):
+        # whether the vertices and edges are valid for the validity checker
+        return (
+            not self.ri.attachments
+            and set(validity_checker.obstacles)
+            == set(self.validity_checker.obstacles)
+            and validity_checker.min_distances
+            == self.validity_checker.min_distances
+        )
+
+    def _search(
+        self,
+        start,
+        goal,
+        edges_start,
+        edges_goal,
+        excluded_vertices,
+        excluded_edges,
+    ):
+        # shortest path of the vertex indices from start to goal (-1 and -2)
+        # with A*, or None if there's no one
+        def get_vertex(index):
+            return {-1: start, -2: goal}.get(index, self.vertices[index])
+
+        def get_neighbors(index):
+            if index == -1:
+                neighbors = set(edges_start)
+            else:
+                neighbors = set(self._neighbors[index])
+                if index in edges_goal:
+                    neighbors.add(-2)
+                if index in edges_start:
+                    neighbors.add(-1)
+            return [
+                neighbor
+                for neighbor in neighbors
+                if neighbor not in excluded_vertices
+                and (min(index, neighbor), max(index, neighbor))
+                not in excluded_edges
+            ]
+
+        costs = {-1: 0}
+        parents = {-1: None}
+        queue = [(np.linalg.norm(goal - start), -1)]
+        while queue:
+            _, index = heapq.heappop(queue)
+            if index == -2:
+                path = []
+                while index is not None:
+                    path.append(index)
+                    index = parents[index]
+                return path[::-1]
+            for neighbor in get_neighbors(index):
+                cost = costs[index] + np.linalg.norm(
+                    get_vertex(neighbor) - get_vertex(index)
+                )
+                if cost < costs.get(neighbor, np.inf):
+                    costs[neighbor] = cost
+                    parents[neighbor] = index
+                    heapq.heappush(
+                        queue,
+                        (
+                            cost + np.linalg.norm(goal - get_vertex(neighbor)),
+                            neighbor,
+                        ),
+                    )
+
+    def plan(self, start, goal, validity_checker=None, max_iterations=10):
+        # path (N, ndof) from the start to the goal, which is the direct
+        # motion if it's valid and otherwise shortcut from the one through
+        # the roadmap, or None if there's no one, where the start and goal
+        # are assumed to be valid
+        # validity_checker: the one of the query (the one of the roadmap by
+        # default), with which the path is checked lazily and its invalid
+        # vertices and edges are excluded until max_iterations
+        if validity_checker is None:
+            validity_checker = self.validity_checker
+        start = np.asarray(start, dtype=float)
+        goal = np.asarray(goal, dtype=float)
+
+        if validity_checker.are_valid_motions(
+            start, goal, resolution=self.resolution
+        )[0]:
+            return np.array([start, goal])
+        if self._kdtree is None:
+            return
+
+        edges = []
+        for j in [start, goal]:
+            indices = self._query(j[None], self.num_neighbors)[0]
+            is_valid = validity_checker.are_valid_motions(
+                np.repeat(j[None], len(indices), axis=0),
+                self.vertices[indices],
+                resolution=self.resolution,
+            )
+            edges.append(set(indices[is_valid]))
+        edges_start, edges_goal = edges
+
+        is_trusted = self._is_trusted(validity_checker)
+        excluded_vertices = set()
+        excluded_edges = set()
+        for _ in range(max_iterations):
+            path = self._search(
+                start,
+                goal,
+                edges_start - excluded_vertices,
+                edges_goal - excluded_vertices,
+                excluded_vertices,
+                excluded_edges,
+            )
+            if path is None:
+                return
+            js = np.array(
+                [
+                    {-1: start, -2: goal}.get(index, self.vertices[index])
+                    for index in path
+                ]
+            )
+            if is_trusted:
+                return validity_checker.shortcut(
+                    js, resolution=self.resolution
+                )
+
+            # the vertices first, and the edges between them, where the ones
+            # of the start and goal are already checked
+            vertices = np.array(path[1:-1])
+            is_valid = validity_checker.are_valid(js[1:-1])
+            if not is_valid.all():
+                excluded_vertices.update(vertices[~is_valid])
+                continue
+            is_valid = validity_checker.are_valid_motions(
+                js[1:-2], js[2:-1], resolution=self.resolution
+            )
+            if is_valid.all():
+                return validity_checker.shortcut(
+                    js, resolution=self.resolution
+                )
+            for index_a, index_b in zip(
+                vertices[:-1][~is_valid], vertices[1:][~is_valid]
+            ):
+                excluded_edges.add(
+                    (min(index_a, index_b), max(index_a, index_b))
+                )
+        logger.warning("roadmap: max_iterations is reached")
+
+    def get_key(self):
+        # digest of the robot, obstacles, min_distances and resolution which
+        # the vertices and edges are valid for, where the poses are rounded
+        # as restoring them (e.g., WorldSaver) slightly changes them
+        physicsClientId = self.ri.physicsClientId
+        hash = hashlib.sha1()
+        with open(self.ri.urdf_file, "rb") as f:
+            hash.update(f.read())
+        hash.update(
+            _round(
+                np.hstack(
+                    pybullet_utils.get_pose(
+                        self.ri.robot, physicsClientId=physicsClientId
+                    )
+                )
+            ).tobytes()
+        )
+        for body in self.validity_checker.obstacles:
+            for link in [-1] + pybullet_utils.get_links(
+                body, physicsClientId=physicsClientId
+            ):
+                hash.update(
+                    _round(
+                        np.hstack(
+                            pybullet_utils.get_link_pose(
+                                body, link, physicsClientId=physicsClientId
+                            )
+                        )
+                    ).tobytes()
+                )
+                for shape_type, dimensions, filename, T in get_body_shapes(
+                    body, link, physicsClientId=physicsClientId
+                ):
+                    hash.update(
+                        repr(
+                            (shape_type, _round(dimensions).tolist(), filename)
+                        ).encode()
+                    )
+                    hash.update(_round(T).tobytes())
+        hash.update(
+            repr(sorted(self.validity_checker.min_distances.items())).encode()
+        )
+        hash.update(repr((self.resolution, self.num_neighbors)).encode())
+        return hash.hexdigest()
+
+    def save(self, filename):
+        np.savez_compressed(
+            filename,
+            vertices=self.vertices,
+            edges=self.edges,
+            key=self.get_key(),
+        )
+
+    def load(self, filename):
+        # the roadmap saved for the same robot, obstacles, min_distances and
+        # resolution, which returns False without loading it otherwise
+        data = np.load(filename)
+        if "key" not in data.files or str(data["key"]) != self.get_key():
+            logger.warning(f"roadmap: {filename} is stale")
+            return False
+        self.vertices = data["vertices"]
+        self.edges = np.zeros((0, 2), dtype=int)
+        self._neighbors = [set() for _ in self.vertices]
+        self._add_edges(data["edges"])
+        self._kdtree = sklearn.neighbors.KDTree(self.vertices)
+        return True
@@ -0,0 +1,180 @@
+import itertools
+
+import numpy as np
+import pybullet as p
+
+from .. import geometry
+from . import utils as pybullet_utils
+from .sphere_collision import _get_convex_hull
+from .sphere_collision import get_body_shapes
+
+
+# the latest field of each workspace, which is rebuilt when the bodies are
+# added, removed or moved
+_sdf_registry = {}
+
+
+def _get_box_distance(points, T_inv, half_extents):
+    # signed distances (...) of the points (..., 3) to a box given as the
+    # inverse transformation and half extents
+    q = np.abs(points @ T_inv[:3, :3].T + T_inv[:3, 3]) - half_extents
+    return np.linalg.norm(np.maximum(q, 0), axis=-1) + np.minimum(
+        q.max(axis=-1), 0
+    )
+
+
+def _get_hull_distance(points, normals, offsets):
+    # lower bounds of the signed distances (...) of the points (..., 3) to a
+    # convex hull of the face planes, which are exact inside it
+    return (points @ normals.T - offsets).max(axis=-1)
+
+
+class SignedDistanceField:
+    # signed distances of the bodies sampled on a voxel grid in [lower,
+    # upper], where the shapes are approximated with their convex hulls
+    # and queried with trilinear interpolation
+    # resolution: size of the voxels
+
+    def __init__(
+        self,
+        bodies,
+        lower,
+        upper,
+        resolution=0.02,
+        max_distance=1.0,
+        physicsClientId=0,
+    ):
+        self.bodies = list(bodies)
+        self.resolution = resolution
+        self.lower = np.asarray(lower, dtype=float)
+        self.shape = (
+            np.ceil((np.asarray(upper) - self.lower) / resolution).astype(int)
+            + 1
+        )
+        self.upper = self.lower + (self.shape - 1) * resolution
+
+        boxes = []
+        hulls = []
+        for body in self.bodies:
+            for link in [-1] + pybullet_utils.get_links(
+                body, physicsClientId=physicsClientId
+            ):
+                T_link = geometry.transformation_matrix(
+                    *pybullet_utils.get_link_pose(
+                        body, link, physicsClientId=physicsClientId
+                    )
+                )
+                for shape_type, dimensions, filename, T in get_body_shapes(
+                    body, link, physicsClientId=physicsClientId
+                ):
+                    T = T_link @ T
+                    if shape_type == p.GEOM_BOX:
+                        boxes.append(
+                            (np.linalg.inv(T), np.array(dimensions[:3]) / 2)
+                        )
+                        continue
+                    hull = _get_convex_hull(shape_type, dimensions, filename)
+                    normals = hull.face_normals @ T[:3, :3].T
+                    origins = hull.triangles[:, 0] @ T[:3, :3].T + T[:3, 3]
+                    hulls.append((normals, np.sum(normals * origins, axis=1)))
+
+        # computed in chunks of z slices to bound the memory
+        axes = [
+            self.lower[i] + np.arange(self.shape[i]) * resolution
+            for i in range(3)
+        ]
+        self.distances = np.full(self.shape, max_distance, dtype=np.float32)
+        chunk_size = max(1, 2**20 // (self.shape[0] * self.shape[1]))
+        for k in range(0, self.shape[2], chunk_size):
+            points = np.stack(
+                np.meshgrid(
+                    axes[0],
+                    axes[1],
+                    axes[2][k : k + chunk_size],
+                    indexing="ij",
+                ),
+                axis=3,
+            ).astype(np.float32)
+            distances = self.distances[:, :, k : k + chunk_size]
+            for T_inv, half_extents in boxes:
+                np.minimum(
+                    distances,
+                    _get_box_distance(points, T_inv, half_extents),
+                    out=distances,
+                )
+            for normals, offsets in hulls:
+                np.minimum(
+                    distances,
+                    _get_hull_distance(points, normals, offsets),
+                    out=distances,
+                )
+
+        self._corners = np.array(list(itertools.product([0, 1], repeat=3)))
+        # the error of the interpolation of 1-lipschitz distances, which is
+        # at most the one at the center of the voxels
+        self._error = np.sqrt(3) / 2 * resolution
+
+    def get_distances(self, points):
+        # lower bounds of the signed distances (...) of the points (..., 3),
+        # where the ones outside the grid are bounded with the distances to
+        # it
+        points = np.asarray(points, dtype=float)
+        clipped = np.clip(points, self.lower, self.upper)
+        indices = (clipped - self.lower) / self.resolution
+        indices_0 = np.minimum(indices.astype(int), self.shape - 2)
+        t = indices - indices_0
+
+        # values (..., 2, 2, 2) of the corners, which are interpolated
+        # along z, y and x
+        strides = np.array([self.shape[1] * self.shape[2], self.shape[2], 1])
+        distances = self.distances.ravel()[
+            (indices_0 @ strides)[..., None] + self._corners @ strides
+        ].reshape(t.shape[:-1] + (2, 2, 2))
+        t_x, t_y, t_z = np.moveaxis(t, -1, 0)
+        distances = (
+            distances[..., 0] * (1 - t_z[..., None, None])
+            + distances[..., 1] * t_z[..., None, None]
+        )
+        distances = (
+            distances[..., 0] * (1 - t_y[..., None])
+            + distances[..., 1] * t_y[..., None]
+        )
+        distances = distances[..., 0] * (1 - t_x) + distances[..., 1] * t_x
+        return (
+            distances - self._error - np.linalg.norm(points - clipped, axis=-1)
+        )
+
+
+def get_signed_distance_field(
+    bodies, lower, upper, resolution=0.02, physicsClientId=0
+):
+    # SignedDistanceField of the bodies in the workspace [lower, upper],
+    # which is reused until the bodies or their base poses are changed,
+    # where restoring them (e.g., WorldSaver) slightly changes the poses
+    bodies = list(bodies)
+    poses = np.array(
+        [
+            np.hstack(
+                pybullet_utils.get_pose(body, physicsClientId=physicsClientId)
+            )
+            for body in bodies
+        ]
+    ).reshape(-1, 7)
+
+    key = (physicsClientId, tuple(lower), tuple(upper), resolution)
+    if key in _sdf_registry:
+        bodies_cached, poses_cached, sdf = _sdf_registry[key]
+        if bodies == bodies_cached and np.allclose(
+            poses, poses_cached, atol=1e-6
+        ):
+            return sdf
+
+    sdf = SignedDistanceField(
+        bodies,
+        lower,
+        upper,
+        resolution=resolution,
+        physicsClientId=physicsClientId,
+    )
+    _sdf_registry[key] = (bodies, poses, sdf)
+    return sdf
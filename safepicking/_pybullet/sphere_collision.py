@@ -0,0 +1,644 @@
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import path
+import pybullet as p
+import sklearn.neighbors
+import trimesh
+
+from .. import geometry
+from . import utils as pybullet_utils
+from .kinematic_chain import _get_origin
+
+
+# convex hulls and points of the shapes, and spheres of the robot models,
+# which don't depend on the physics client
+_hull_registry = {}
+_points_registry = {}
+_spheres_registry = {}
+
+
+def _get_convex_hull(shape_type, dimensions, filename):
+    # convex hull of a collision shape in its local frame, which contains
+    # all the pieces of the shape
+    key = (shape_type, tuple(dimensions), filename)
+    if key in _hull_registry:
+        return _hull_registry[key]
+
+    if shape_type == p.GEOM_BOX:
+        mesh = trimesh.creation.box(extents=dimensions[:3])
+    elif shape_type == p.GEOM_SPHERE:
+        mesh = trimesh.creation.icosphere(subdivisions=2, radius=dimensions[0])
+    elif shape_type == p.GEOM_CYLINDER:
+        mesh = trimesh.creation.cylinder(
+            radius=dimensions[1], height=dimensions[0]
+        )
+    elif shape_type == p.GEOM_CAPSULE:
+        mesh = trimesh.creation.capsule(
+            radius=dimensions[1], height=dimensions[0]
+        )
+    elif shape_type == p.GEOM_MESH:
+        mesh = trimesh.load(filename, force="mesh", process=False)
+        mesh = trimesh.Trimesh(vertices=mesh.vertices * dimensions[:3])
+    else:
+        raise ValueError(f"unsupported shape type: {shape_type}")
+
+    _hull_registry[key] = mesh.convex_hull
+    return _hull_registry[key]
+
+
+def _get_shape_points(shape, spacing, volume=False):
+    # points (N, 3) on the surface of a shape (shape_type, dimensions,
+    # filename, transform) with the spacing, and inside it if volume=True
+    shape_type, dimensions, filename, T = shape
+    key = (shape_type, tuple(dimensions), filename, spacing, volume)
+    if key not in _points_registry:
+        hull = _get_convex_hull(shape_type, dimensions, filename)
+        count = int(np.ceil(2 * hull.area / spacing**2))
+        points = [
+            hull.vertices,
+            trimesh.sample.sample_surface(hull, count, seed=0)[0],
+        ]
+        if volume:
+            grid = np.mgrid[
+                tuple(
+                    slice(lower, upper, spacing)
+                    for lower, upper in zip(*hull.bounds)
+                )
+            ]
+            grid = grid.reshape(3, -1).T
+            is_inside = (
+                np.einsum("nk,fk->nf", grid, hull.face_normals)
+                - np.sum(hull.face_normals * hull.triangles[:, 0], axis=1)
+                <= 0
+            ).all(axis=1)
+            points.append(grid[is_inside])
+        _points_registry[key] = np.vstack(points)
+    points = _points_registry[key]
+    return points @ T[:3, :3].T + T[:3, 3]
+
+
+def fit_spheres(points, max_radius, max_elongation=1.5, min_points=8):
+    # spheres (centers (S, 3) and radii (S,)) which cover the points, where
+    # the points are split in half along their longest principal axis until
+    # each sphere is smaller than max_radius and not elongated
+    centers = []
+    radii = []
+    clusters = [points]
+    while clusters:
+        points_i = clusters.pop()
+        mean = points_i.mean(axis=0)
+        _, _, Vt = np.linalg.svd(points_i - mean, full_matrices=False)
+        local = (points_i - mean) @ Vt.T
+        lower = local.min(axis=0)
+        upper = local.max(axis=0)
+        center = mean + (lower + upper) / 2 @ Vt
+        radius = np.linalg.norm(points_i - center, axis=1).max()
+        extents = upper - lower
+        if len(points_i) > min_points and (
+            radius > max_radius or extents[0] > max_elongation * extents[1]
+        ):
+            middle = (lower[0] + upper[0]) / 2
+            clusters.append(points_i[local[:, 0] < middle])
+            clusters.append(points_i[local[:, 0] >= middle])
+        else:
+            centers.append(center)
+            radii.append(radius)
+    return np.array(centers), np.array(radii)
+
+
+def _get_urdf_shapes(urdf_file):
+    # collision shapes (shape_type, dimensions, filename, transform) of each
+    # link in the link frames
+    urdf_file = path.Path(urdf_file)
+    root = ET.parse(urdf_file).getroot()
+
+    shapes = {}
+    for link in root.findall("link"):
+        shapes[link.get("name")] = []
+        for collision in link.findall("collision"):
+            T = _get_origin(collision)
+            geom = collision.find("geometry")
+            if geom.find("mesh") is not None:
+                mesh = geom.find("mesh")
+                filename = mesh.get("filename")
+                if filename.startswith("package://"):
+                    filename = filename[len("package://") :]
+                filename = str(urdf_file.parent / filename)
+                scale = [float(x) for x in mesh.get("scale", "1 1 1").split()]
+                shape = (p.GEOM_MESH, scale, filename, T)
+            elif geom.find("box") is not None:
+                size = [float(x) for x in geom.find("box").get("size").split()]
+                shape = (p.GEOM_BOX, size, None, T)
+            elif geom.find("cylinder") is not None:
+                cylinder = geom.find("cylinder")
+                shape = (
+                    p.GEOM_CYLINDER,
+                    [
+                        float(cylinder.get("length")),
+                        float(cylinder.get("radius")),
+                    ],
+                    None,
+                    T,
+                )
+            elif geom.find("sphere") is not None:
+                radius = float(geom.find("sphere").get("radius"))
+                shape = (p.GEOM_SPHERE, [radius], None, T)
+            else:
+                raise ValueError(
+                    f"unsupported geometry of link: {link.get('name')}"
+                )
+            shapes[link.get("name")].append(shape)
+    return shapes
+
+
+def get_body_shapes(body, link=-1, physicsClientId=0):
+    # collision shapes (shape_type, dimensions, filename, transform) of the
+    # link in the frame of get_link_pose()
+    # the shapes are relative to the inertial frame of the link, which is
+    # the one of get_link_pose() for the base
+    if link == -1:
+        T_com = np.eye(4)
+    else:
+        T_com = geometry.transformation_matrix(
+            *p.getDynamicsInfo(body, link, physicsClientId=physicsClientId)[
+                3:5
+            ]
+        )
+
+    shapes = []
+    for shape_data in p.getCollisionShapeData(
+        body, link, physicsClientId=physicsClientId
+    ):
+        shape_type, dimensions, filename = shape_data[2:5]
+        filename = filename.decode()
+        T = T_com @ geometry.transformation_matrix(*shape_data[5:7])
+        if shape_type == p.GEOM_MESH and filename == "unknown_file":
+            # the ones of create_mesh_body()
+            user_data_id = p.getUserDataId(
+                body, "collision_file", physicsClientId=physicsClientId
+            )
+            if link != -1 or user_data_id == -1:
+                raise ValueError(
+                    f"unknown mesh file of body={body}, link={link}"
+                )
+            filename = p.getUserData(
+                user_data_id, physicsClientId=physicsClientId
+            ).decode()
+        shapes.append((shape_type, list(dimensions), filename, T))
+    return shapes
+
+
+def _get_overlapping_rates(centers_a, radii_a, centers_b, radii_b):
+    # rates (A, B) of the configurations where the spheres overlap, for the
+    # sphere centers (N, A, 3) and (N, B, 3)
+    distances = np.linalg.norm(
+        centers_a[:, :, None] - centers_b[:, None, :], axis=3
+    )
+    return (distances < radii_a[:, None] + radii_b).mean(axis=0)
+
+
+def _get_box_distances(points, boxes, half_extents):
+    # signed distances (..., B) of the points (..., 3) to the boxes given as
+    # the inverse transformations (B, 4, 4) and half extents (B, 3)
+    local = (
+        np.einsum("bij,...j->...bi", boxes[:, :3, :3], points)
+        + boxes[:, :3, 3]
+    )
+    q = np.abs(local) - half_extents
+    return np.linalg.norm(np.maximum(q, 0), axis=-1) + np.minimum(
+        q.max(axis=-1), 0
+    )
+
+
+def _get_aabb_distances(points, lower, upper):
+    # distances (...) of the points (..., 3) to the aabb
+    return np.linalg.norm(
+        np.maximum(np.maximum(lower - points, points - upper), 0), axis=-1
+    )
+
+
+class SphereCollisionModel:
+    # conservative approximation of the robot links and attachments as
+    # spheres, and obstacles as boxes and points on their surfaces, to check
+    # many joint positions at once with numpy, where the spheres of each
+    # link are culled with their bounding sphere first
+    # max_radius: max radius of the spheres
+    # spacing: distance between the sampled points
+    # padding: margin added to the spheres to cover the gaps of the points
+    # num_samples: joint positions to find the link pairs whose spheres
+    # overlap in most of them, which are left to get_exact_pairs(), and the
+    # workspace of the spheres
+
+    def __init__(
+        self,
+        ri,
+        max_radius=0.06,
+        spacing=0.005,
+        padding=0.005,
+        num_samples=1000,
+    ):
+        self.ri = ri
+        self.physicsClientId = ri.physicsClientId
+        self.max_radius = max_radius
+        self.spacing = spacing
+        self.padding = padding
+
+        key = (ri.urdf_file, max_radius, spacing, padding)
+        if key not in _spheres_registry:
+            _spheres_registry[key] = self._fit_link_spheres()
+        (
+            self._link_names,
+            self._links,
+            self._centers,
+            self._radii,
+            self._groups,
+            self._bounding_centers,
+            self._offsets,
+        ) = _spheres_registry[key]
+        self._bounding_radii = np.zeros((len(self._links),))
+        np.maximum.at(
+            self._bounding_radii, self._groups, self._offsets + self._radii
+        )
+
+        lower, upper = ri.get_bounds()
+        random_state = np.random.RandomState(0)
+        self._samples = lower + random_state.uniform(
+            size=(num_samples, len(lower))
+        ) * (np.asarray(upper) - lower)
+
+        key += (num_samples,)
+        if key not in _spheres_registry:
+            _spheres_registry[key] = self._get_pairs()
+        self._pairs, self.exact_pairs = _spheres_registry[key]
+
+        # bounds of the spheres in the world with a margin for attachments,
+        # rounded to be reused as the workspace of SignedDistanceField
+        samples_centers, _, _ = self.get_spheres(self._samples)
+        self.workspace = (
+            np.floor(samples_centers.min(axis=(0, 1)) * 10 - 3) / 10,
+            np.ceil(samples_centers.max(axis=(0, 1)) * 10 + 3) / 10,
+        )
+
+        self._attachment_spheres = {}
+        self._obstacles_key = None
+        self._obstacles = None
+
+    def _fit_link_spheres(self):
+        urdf_shapes = _get_urdf_shapes(self.ri.urdf_file)
+        link_names = []
+        links = []
+        centers = []
+        radii = []
+        bounding_centers = []
+        for link in pybullet_utils.get_links(
+            self.ri.robot, physicsClientId=self.physicsClientId
+        ):
+            link_name = pybullet_utils.get_link_name(
+                self.ri.robot, link, physicsClientId=self.physicsClientId
+            )
+            if not urdf_shapes[link_name]:
+                continue
+            points = np.vstack(
+                [
+                    _get_shape_points(shape, self.spacing, volume=True)
+                    for shape in urdf_shapes[link_name]
+                ]
+            )
+            centers_i, radii_i = fit_spheres(points, self.max_radius)
+            link_names.append(link_name)
+            links.append(link)
+            centers.append(centers_i)
+            radii.append(radii_i + self.padding)
+            bounding_centers.append(
+                (centers_i.min(axis=0) + centers_i.max(axis=0)) / 2
+            )
+        groups = np.hstack([np.full(len(r), i) for i, r in enumerate(radii)])
+        centers = np.vstack(centers)
+        bounding_centers = np.array(bounding_centers)
+        return (
+            link_names,
+            np.array(links),
+            centers,
+            np.hstack(radii),
+            groups,
+            bounding_centers,
+            np.linalg.norm(centers - bounding_centers[groups], axis=1),
+        )
+
+    def _get_pairs(self):
+        # sphere pairs of the self-collision link pairs as (group_a,
+        # group_b, pairs), where the link pairs whose spheres overlap in most
+        # of the samples are left to get_exact_pairs()
+        samples_centers, _, _ = self.get_spheres(self._samples)
+        pairs = []
+        exact_pairs = []
+        for link_a, link_b in self.ri.get_self_collision_pairs():
+            if link_a not in self._links or link_b not in self._links:
+                continue
+            group_a = np.where(self._links == link_a)[0][0]
+            group_b = np.where(self._links == link_b)[0][0]
+            a = np.where(self._groups == group_a)[0]
+            b = np.where(self._groups == group_b)[0]
+            rates = _get_overlapping_rates(
+                samples_centers[:, a],
+                self._radii[a],
+                samples_centers[:, b],
+                self._radii[b],
+            )
+            if (rates > 0.5).any():
+                exact_pairs.append((link_a, link_b))
+            else:
+                pairs.append(
+                    (
+                        group_a,
+                        group_b,
+                        np.stack(np.meshgrid(a, b), axis=2).reshape(-1, 2),
+                    )
+                )
+        return pairs, exact_pairs
+
+    def _get_attachment_spheres(self, attachment):
+        # spheres of the attachment in the frame of the parent link, and the
+        # link groups to check with them and the links to check exactly
+        cached = self._attachment_spheres.get(attachment.child)
+        if cached is not None and cached[0] is attachment:
+            return cached[1]
+
+        points = np.vstack(
+            [
+                _get_shape_points(shape, self.spacing, volume=True)
+                for shape in get_body_shapes(
+                    attachment.child, physicsClientId=self.physicsClientId
+                )
+            ]
+        )
+        centers, radii = fit_spheres(points, self.max_radius)
+        T = geometry.transformation_matrix(*attachment.grasp_pose)
+        centers = centers @ T[:3, :3].T + T[:3, 3]
+        radii = radii + self.padding
+        bounding_center = (centers.min(axis=0) + centers.max(axis=0)) / 2
+        offsets = np.linalg.norm(centers - bounding_center, axis=1)
+
+        samples_centers, _, Ts = self.get_spheres(self._samples)
+        T = Ts[self._get_parent_group(attachment)]
+        samples_centers_a = (
+            np.einsum("nij,sj->nsi", T[:, :3, :3], centers) + T[:, None, :3, 3]
+        )
+        rates = _get_overlapping_rates(
+            samples_centers_a, radii, samples_centers, self._radii
+        ).max(axis=0)
+        is_checked = self._links != attachment.parent_link
+        exact_links = []
+        for group in np.where(is_checked)[0]:
+            if (rates[self._groups == group] > 0.5).any():
+                is_checked[group] = False
+                exact_links.append(int(self._links[group]))
+
+        spheres = (
+            centers,
+            radii,
+            bounding_center,
+            offsets,
+            is_checked,
+            exact_links,
+        )
+        self._attachment_spheres[attachment.child] = (attachment, spheres)
+        return spheres
+
+    def _get_parent_group(self, attachment):
+        is_parent = self._links == attachment.parent_link
+        if not is_parent.any():
+            raise ValueError(
+                f"parent link without spheres: {attachment.parent_link}"
+            )
+        return np.where(is_parent)[0][0]
+
+    def get_exact_pairs(self):
+        # (body_a, link_a, body_b, link_b) which are not checked with the
+        # spheres and should be checked exactly
+        pairs = [
+            (self.ri.robot, link_a, self.ri.robot, link_b)
+            for link_a, link_b in self.exact_pairs
+        ]
+        for attachment in self.ri.attachments:
+            exact_links = self._get_attachment_spheres(attachment)[-1]
+            pairs += [
+                (attachment.child, -1, self.ri.robot, link)
+                for link in exact_links
+            ]
+        return pairs
+
+    def _get_obstacles(self, obstacles):
+        # points (with their aabb and kdtree) and boxes of the obstacles in
+        # the world, which are recomputed only when the base poses of the
+        # obstacles are changed, where restoring them (e.g., WorldSaver)
+        # slightly changes them
+        key = (
+            list(obstacles),
+            np.array(
+                [
+                    np.hstack(
+                        pybullet_utils.get_pose(
+                            body, physicsClientId=self.physicsClientId
+                        )
+                    )
+                    for body in obstacles
+                ]
+            ).reshape(-1, 7),
+        )
+        if (
+            self._obstacles_key is not None
+            and key[0] == self._obstacles_key[0]
+            and np.allclose(key[1], self._obstacles_key[1], atol=1e-6)
+        ):
+            return self._obstacles
+
+        points = []
+        boxes = [np.zeros((0, 4, 4))]
+        half_extents = [np.zeros((0, 3))]
+        for body in obstacles:
+            for link in [-1] + pybullet_utils.get_links(
+                body, physicsClientId=self.physicsClientId
+            ):
+                T_link = geometry.transformation_matrix(
+                    *pybullet_utils.get_link_pose(
+                        body, link, physicsClientId=self.physicsClientId
+                    )
+                )
+                for shape in get_body_shapes(
+                    body, link, physicsClientId=self.physicsClientId
+                ):
+                    shape_type, dimensions, _, T = shape
+                    if shape_type == p.GEOM_BOX:
+                        boxes.append(np.linalg.inv(T_link @ T)[None])
+                        half_extents.append(np.array(dimensions[:3])[None] / 2)
+                        continue
+                    points_i = _get_shape_points(shape, self.spacing)
+                    points_i = points_i @ T_link[:3, :3].T + T_link[:3, 3]
+                    points.append(
+                        (
+                            points_i.min(axis=0),
+                            points_i.max(axis=0),
+                            sklearn.neighbors.KDTree(points_i),
+                        )
+                    )
+        self._obstacles = points, np.vstack(boxes), np.vstack(half_extents)
+        self._obstacles_key = key
+        return self._obstacles
+
+    def get_spheres(self, js):
+        # centers (N, S, 3) of the spheres and (N, L, 3) of the bounding
+        # spheres of the links in the world, and the link transformations
+        # (L, N, 4, 4) for joint positions (N, ndof)
+        js = np.asarray(js, dtype=float).reshape(-1, len(self.ri.joints))
+        Ts = self.ri.kinematic_chain.fk_links(js, self._link_names)
+        if self.ri.pose is not None:
+            Ts = geometry.transformation_matrix(*self.ri.pose) @ Ts
+        centers = np.einsum(
+            "snij,sj->nsi", Ts[self._groups, :, :3, :3], self._centers
+        )
+        centers += Ts[self._groups, :, :3, 3].transpose(1, 0, 2)
+        bounding_centers = np.einsum(
+            "lnij,lj->nli", Ts[:, :, :3, :3], self._bounding_centers
+        )
+        bounding_centers += Ts[:, :, :3, 3].transpose(1, 0, 2)
+        return centers, bounding_centers, Ts
+
+    def check_collision(self, js, obstacles, min_distances=None, sdf=None):
+        # whether the joint positions (N, ndof) may be in collision with the
+        # robot itself or the obstacles, where the ones of False are free
+        # except for get_exact_pairs()
+        # sdf: SignedDistanceField of other obstacles, which are checked with
+        # its distances at the centers of the spheres
+        min_distances = min_distances or {}
+        centers, bounding_centers, Ts = self.get_spheres(js)
+        radii = self._radii
+        is_colliding = np.zeros((centers.shape[0],), dtype=bool)
+
+        # robot vs robot
+        for group_a, group_b, pairs in self._pairs:
+            is_close = ~is_colliding & (
+                np.linalg.norm(
+                    bounding_centers[:, group_a]
+                    - bounding_centers[:, group_b],
+                    axis=1,
+                )
+                < self._bounding_radii[group_a] + self._bounding_radii[group_b]
+            )
+            if not is_close.any():
+                continue
+            n = np.where(is_close)[0]
+            distances = np.linalg.norm(
+                centers[n][:, pairs[:, 0]] - centers[n][:, pairs[:, 1]], axis=2
+            )
+            is_colliding[
+                n[(distances < radii[pairs[:, 0]] + radii[pairs[:, 1]]).any(1)]
+            ] = True
+
+        margins = (
+            radii
+            + np.array(
+                [
+                    min_distances.get((self.ri.robot, link), 0)
+                    for link in self._links
+                ]
+            )[self._groups]
+        )
+        groups = self._groups
+        offsets = self._offsets
+        for attachment in self.ri.attachments:
+            assert attachment.parent == self.ri.robot
+            (
+                centers_a,
+                radii_a,
+                bounding_center_a,
+                offsets_a,
+                is_checked,
+                _,
+            ) = self._get_attachment_spheres(attachment)
+            T = Ts[self._get_parent_group(attachment)]
+            centers_a = (
+                np.einsum("nij,sj->nsi", T[:, :3, :3], centers_a)
+                + T[:, None, :3, 3]
+            )
+            bounding_center_a = T[:, :3, :3] @ bounding_center_a + T[:, :3, 3]
+            min_distance = min_distances.get((attachment.child, -1), 0)
+
+            # attachment vs robot
+            for group in np.where(is_checked)[0]:
+                is_close = ~is_colliding & (
+                    np.linalg.norm(
+                        bounding_center_a - bounding_centers[:, group], axis=1
+                    )
+                    < (offsets_a + radii_a).max()
+                    + self._bounding_radii[group]
+                    + min_distance
+                )
+                if not is_close.any():
+                    continue
+                n = np.where(is_close)[0]
+                s = np.where(self._groups == group)[0]
+                distances = np.linalg.norm(
+                    centers_a[n][:, :, None] - centers[n][:, None, s], axis=3
+                )
+                is_colliding[
+                    n[
+                        (
+                            distances
+                            < radii_a[:, None] + radii[s] + min_distance
+                        ).any(axis=(1, 2))
+                    ]
+                ] = True
+
+            groups = np.hstack(
+                [groups, np.full(len(radii_a), groups.max() + 1)]
+            )
+            centers = np.concatenate([centers, centers_a], axis=1)
+            bounding_centers = np.concatenate(
+                [bounding_centers, bounding_center_a[:, None]], axis=1
+            )
+            margins = np.hstack([margins, radii_a + min_distance])
+            offsets = np.hstack([offsets, offsets_a])
+
+        bounding_margins = np.zeros((bounding_centers.shape[1],))
+        np.maximum.at(bounding_margins, groups, offsets + margins)
+
+        # robot and attachments vs obstacles
+        if sdf is not None:
+            is_close = ~is_colliding[:, None] & (
+                sdf.get_distances(bounding_centers) < bounding_margins
+            )
+            n = np.where(is_close.any(axis=1))[0]
+            i, s = np.where(is_close[n][:, groups])
+            distances = sdf.get_distances(centers[n[i], s])
+            is_colliding[n[i][distances < margins[s]]] = True
+        points, boxes, half_extents = self._get_obstacles(obstacles)
+        for lower, upper, kdtree in points:
+            is_close = ~is_colliding[:, None] & (
+                _get_aabb_distances(bounding_centers, lower, upper)
+                < bounding_margins
+            )
+            n = np.where(is_close.any(axis=1))[0]
+            if n.size == 0:
+                continue
+            is_close = is_close[n][:, groups] & (
+                _get_aabb_distances(centers[n], lower, upper) < margins
+            )
+            i, s = np.where(is_close)
+            if i.size == 0:
+                continue
+            distances, _ = kdtree.query(centers[n[i], s])
+            is_colliding[n[i][distances[:, 0] < margins[s]]] = True
+        if len(boxes):
+            is_close = ~is_colliding[:, None] & (
+                _get_box_distances(bounding_centers, boxes, half_extents)
+                < bounding_margins[:, None]
+            ).any(axis=2)
+            n = np.where(is_close.any(axis=1))[0]
+            if n.size > 0:
+                distances = _get_box_distances(centers[n], boxes, half_extents)
+                is_colliding[
+                    n[(distances < margins[:, None]).any(axis=(1, 2))]
+                ] = True
+        return is_colliding
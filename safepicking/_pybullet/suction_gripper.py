@@ -4,6 +4,7 @@ import pybullet as p
 import pybullet_planning
 
 from .. import geometry
+from . import utils as pybullet_utils
 
 
 class SuctionGripper:
@@ -14,7 +15,9 @@ class SuctionGripper:
         max_force=10,
         surface_threshold=np.deg2rad(10),
         surface_alignment=True,
+        physicsClientId=0,
     ):
+        self.physicsClientId = physicsClientId
         self.body = body
         self.link = link
         self.max_force = max_force
@@ -33,7 +36,11 @@ class SuctionGripper:
 
         self.activated = True
 
-        points = p.getContactPoints(bodyA=self.body, linkIndexA=self.link)
+        points = p.getContactPoints(
+            bodyA=self.body,
+            linkIndexA=self.link,
+            physicsClientId=self.physicsClientId,
+        )
         if not points:
             logger.warning("suction gripper didn't contact any surface")
             return
@@ -50,7 +57,9 @@ class SuctionGripper:
         point_on_obj = point[6]
 
         # in obj coordinates
-        obj_to_world = pybullet_planning.get_pose(point[2])
+        obj_to_world = pybullet_utils.get_pose(
+            point[2], physicsClientId=self.physicsClientId
+        )
         T_world_to_obj = geometry.transformation_matrix(
             *pybullet_planning.invert(obj_to_world)
         )
@@ -59,7 +68,9 @@ class SuctionGripper:
         )[0]
 
         # in ee coordinates
-        ee_to_world = pybullet_planning.get_link_pose(self.body, self.link)
+        ee_to_world = pybullet_utils.get_link_pose(
+            self.body, self.link, physicsClientId=self.physicsClientId
+        )
         world_to_ee = pybullet_planning.invert(ee_to_world)
         T_world_to_ee = geometry.transformation_matrix(*world_to_ee)
         point_on_ee = geometry.transform_points([point_on_ee], T_world_to_ee)[
@@ -75,7 +86,9 @@ class SuctionGripper:
 
         angle = np.abs(np.arccos(np.dot(v_ee_to_obj, [0, 0, 1])))
 
-        mass = p.getDynamicsInfo(obj_id, -1)[0]
+        mass = p.getDynamicsInfo(
+            obj_id, -1, physicsClientId=self.physicsClientId
+        )[0]
         if mass == 0:
             logger.warning("object in contact is not dynamic")
             return
@@ -98,17 +111,23 @@ class SuctionGripper:
             T_obj_to_obj_af_in_ee, point_on_obj
         )
         T_obj_to_world = geometry.transformation_matrix(
-            *pybullet_planning.get_pose(obj_id)
+            *pybullet_utils.get_pose(
+                obj_id, physicsClientId=self.physicsClientId
+            )
         )
         T_obj_to_ee = T_world_to_ee @ T_obj_to_world
         T_obj_af_to_ee = T_obj_to_obj_af_in_ee @ T_obj_to_ee
         T_obj_af_to_world = np.linalg.inv(T_world_to_ee) @ T_obj_af_to_ee
 
-        ee_to_world = p.getLinkState(self.body, self.link)[:2]
+        ee_to_world = p.getLinkState(
+            self.body, self.link, physicsClientId=self.physicsClientId
+        )[:2]
         if self._surface_alignment:  # w/ compliance
             obj_to_world = geometry.pose_from_matrix(T_obj_af_to_world)
         else:  # w/o compliance
-            obj_to_world = p.getBasePositionAndOrientation(obj_id)
+            obj_to_world = p.getBasePositionAndOrientation(
+                obj_id, physicsClientId=self.physicsClientId
+            )
         world_to_ee = pybullet_planning.invert(ee_to_world)
         obj_to_ee = pybullet_planning.multiply(world_to_ee, obj_to_world)
         self.add_constraint(
@@ -140,10 +159,13 @@ class SuctionGripper:
             parentFrameOrientation=obj_to_ee[1],
             childFramePosition=(0, 0, 0),
             childFrameOrientation=(0, 0, 0),
+            physicsClientId=self.physicsClientId,
         )
         if self.max_force is not None:
             p.changeConstraint(
-                self.contact_constraint, maxForce=self.max_force
+                self.contact_constraint,
+                maxForce=self.max_force,
+                physicsClientId=self.physicsClientId,
             )
 
     def step_simulation(self):
@@ -158,12 +180,16 @@ class SuctionGripper:
                     "is not set"
                 )
                 return
-            obj_to_world = pybullet_planning.get_pose(self.grasped_object)
+            obj_to_world = pybullet_utils.get_pose(
+                self.grasped_object, physicsClientId=self.physicsClientId
+            )
             grasp_point_on_obj = geometry.transform_points(
                 [self.grasp_point_on_obj],
                 geometry.transformation_matrix(*obj_to_world),
             )[0]
-            ee_to_world = pybullet_planning.get_link_pose(self.body, self.link)
+            ee_to_world = pybullet_utils.get_link_pose(
+                self.body, self.link, physicsClientId=self.physicsClientId
+            )
             grasp_point_on_ee = geometry.transform_points(
                 [self.grasp_point_on_ee],
                 geometry.transformation_matrix(*ee_to_world),
@@ -175,7 +201,10 @@ class SuctionGripper:
                 logger.warning("dropping grasped object as surfaces are apart")
                 if self.contact_constraint is not None:
                     try:
-                        p.removeConstraint(self.contact_constraint)
+                        p.removeConstraint(
+                            self.contact_constraint,
+                            physicsClientId=self.physicsClientId,
+                        )
                         self.contact_constraint = None
                     except Exception:
                         pass
@@ -189,7 +218,10 @@ class SuctionGripper:
         # Release gripped rigid object (if any).
         if self.contact_constraint is not None:
             try:
-                p.removeConstraint(self.contact_constraint)
+                p.removeConstraint(
+                    self.contact_constraint,
+                    physicsClientId=self.physicsClientId,
+                )
                 self.contact_constraint = None
             except Exception:
                 pass
@@ -198,14 +230,19 @@ class SuctionGripper:
         body, link = self.body, self.link
         if self.activated and self.contact_constraint is not None:
             try:
-                info = p.getConstraintInfo(self.contact_constraint)
+                info = p.getConstraintInfo(
+                    self.contact_constraint,
+                    physicsClientId=self.physicsClientId,
+                )
                 body, link = info[2], info[3]
             except Exception:
                 self.contact_constraint = None
                 pass
 
         # Get all contact points between the suction and a rigid body.
-        points = p.getContactPoints(bodyA=body, linkIndexA=link)
+        points = p.getContactPoints(
+            bodyA=body, linkIndexA=link, physicsClientId=self.physicsClientId
+        )
         if self.activated:
             points = [point for point in points if point[2] != self.body]
 
@@ -222,5 +259,7 @@ class SuctionGripper:
     def grasped_object(self):
         grasped_object = None
         if self.contact_constraint is not None:
-            grasped_object = p.getConstraintInfo(self.contact_constraint)[2]
+            grasped_object = p.getConstraintInfo(
+                self.contact_constraint, physicsClientId=self.physicsClientId
+            )[2]
         return grasped_object
@@ -7,24 +7,288 @@ import time
 import numpy as np
 import path
 import pybullet as p
+import pybullet_data
 import pybullet_planning as pp
 
 from .. import geometry
 
 
 def init_world(*args, **kwargs):
-    p.connect(p.GUI)
-    pp.add_data_path()
-    p.loadURDF("plane.urdf")
-    p.setGravity(0, 0, -9.8)
+    physicsClientId = p.connect(p.GUI)
+    p.setAdditionalSearchPath(
+        pybullet_data.getDataPath(), physicsClientId=physicsClientId
+    )
+    p.loadURDF("plane.urdf", physicsClientId=physicsClientId)
+    p.setGravity(0, 0, -9.8, physicsClientId=physicsClientId)
+    return physicsClientId
 
 
-def get_body_unique_ids():
-    num_bodies = p.getNumBodies()
-    unique_ids = [p.getBodyUniqueId(i) for i in range(num_bodies)]
+def get_body_unique_ids(physicsClientId=0):
+    num_bodies = p.getNumBodies(physicsClientId=physicsClientId)
+    unique_ids = [
+        p.getBodyUniqueId(i, physicsClientId=physicsClientId)
+        for i in range(num_bodies)
+    ]
     return unique_ids
 
 
+# -----------------------------------------------------------------------------
+# pybullet_planning binds its client at import, so the functions of it that
+# access the simulation are reimplemented here with physicsClientId
+
+
+def has_gui(physicsClientId=0):
+    connection_info = p.getConnectionInfo(physicsClientId=physicsClientId)
+    return connection_info["connectionMethod"] == p.GUI
+
+
+# clients whose rendering is disabled by LockRenderer
+_locked_renderers = set()
+
+
+class LockRenderer:
+    def __init__(self, lock=True, physicsClientId=0):
+        self.physicsClientId = physicsClientId
+        self._locked = (
+            lock
+            and physicsClientId not in _locked_renderers
+            and has_gui(physicsClientId=physicsClientId)
+        )
+        if self._locked:
+            p.configureDebugVisualizer(
+                p.COV_ENABLE_RENDERING, 0, physicsClientId=physicsClientId
+            )
+            _locked_renderers.add(physicsClientId)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.restore()
+
+    def restore(self):
+        if not self._locked:
+            return
+        self._locked = False
+        _locked_renderers.discard(self.physicsClientId)
+        p.configureDebugVisualizer(
+            p.COV_ENABLE_RENDERING, 1, physicsClientId=self.physicsClientId
+        )
+
+
+class WorldSaver:
+    # poses, velocities and joint positions of all bodies as pp.WorldSaver
+    def __init__(self, physicsClientId=0):
+        self.physicsClientId = physicsClientId
+        self._body_states = []
+        for body in get_body_unique_ids(physicsClientId=physicsClientId):
+            joints = get_movable_joints(body, physicsClientId=physicsClientId)
+            joint_states = p.getJointStates(
+                body, joints, physicsClientId=physicsClientId
+            )
+            self._body_states.append(
+                (
+                    body,
+                    p.getBasePositionAndOrientation(
+                        body, physicsClientId=physicsClientId
+                    ),
+                    p.getBaseVelocity(body, physicsClientId=physicsClientId),
+                    joints,
+                    [state[0] for state in joint_states or []],
+                )
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.restore()
+
+    def restore(self):
+        for body, pose, velocity, joints, positions in self._body_states:
+            p.resetBasePositionAndOrientation(
+                body, *pose, physicsClientId=self.physicsClientId
+            )
+            p.resetBaseVelocity(
+                body, *velocity, physicsClientId=self.physicsClientId
+            )
+            for joint, position in zip(joints, positions):
+                p.resetJointState(
+                    body,
+                    joint,
+                    position,
+                    targetVelocity=0,
+                    physicsClientId=self.physicsClientId,
+                )
+
+
+class Attachment(pp.Attachment):
+    def __init__(
+        self, parent, parent_link, grasp_pose, child, physicsClientId=0
+    ):
+        super().__init__(parent, parent_link, grasp_pose, child)
+        self.physicsClientId = physicsClientId
+
+    def assign(self):
+        parent_link_pose = get_link_pose(
+            self.parent, self.parent_link, physicsClientId=self.physicsClientId
+        )
+        child_pose = pp.multiply(parent_link_pose, self.grasp_pose)
+        set_pose(self.child, child_pose, physicsClientId=self.physicsClientId)
+        return child_pose
+
+
+def get_movable_joints(body, physicsClientId=0):
+    joints = []
+    for joint in range(p.getNumJoints(body, physicsClientId=physicsClientId)):
+        joint_info = p.getJointInfo(
+            body, joint, physicsClientId=physicsClientId
+        )
+        if joint_info[2] != p.JOINT_FIXED:
+            joints.append(joint)
+    return joints
+
+
+def get_links(body, physicsClientId=0):
+    return list(range(p.getNumJoints(body, physicsClientId=physicsClientId)))
+
+
+def get_joint_name(body, joint, physicsClientId=0):
+    return p.getJointInfo(body, joint, physicsClientId=physicsClientId)[1]
+
+
+def get_link_name(body, link, physicsClientId=0):
+    if link == -1:
+        body_info = p.getBodyInfo(body, physicsClientId=physicsClientId)
+        return body_info[0].decode()
+    joint_info = p.getJointInfo(body, link, physicsClientId=physicsClientId)
+    return joint_info[12].decode()
+
+
+def link_from_name(body, name, physicsClientId=0):
+    for link in [-1] + get_links(body, physicsClientId=physicsClientId):
+        if get_link_name(body, link, physicsClientId=physicsClientId) == name:
+            return link
+    raise ValueError(body, name)
+
+
+def get_link_pose(body, link, physicsClientId=0):
+    if link == -1:
+        return p.getBasePositionAndOrientation(
+            body, physicsClientId=physicsClientId
+        )
+    link_state = p.getLinkState(body, link, physicsClientId=physicsClientId)
+    return link_state[4], link_state[5]
+
+
+def get_time_step(physicsClientId=0):
+    return p.getPhysicsEngineParameters(physicsClientId=physicsClientId)[
+        "fixedTimeStep"
+    ]
+
+
+def add_line(
+    start,
+    end,
+    color=(0, 0, 0),
+    width=1,
+    lifetime=None,
+    parent=-1,
+    parent_link=-1,
+    physicsClientId=0,
+):
+    return p.addUserDebugLine(
+        start,
+        end,
+        lineColorRGB=color[:3],
+        lineWidth=width,
+        lifeTime=0 if lifetime is None else lifetime,
+        parentObjectUniqueId=parent,
+        parentLinkIndex=parent_link,
+        physicsClientId=physicsClientId,
+    )
+
+
+def draw_aabb(aabb, **kwargs):
+    lines = []
+    vertices = list(itertools.product(range(2), repeat=3))
+    for i1, i2 in itertools.combinations(vertices, 2):
+        if sum(i1[k] != i2[k] for k in range(3)) == 1:
+            p1 = [aabb[i1[k]][k] for k in range(3)]
+            p2 = [aabb[i2[k]][k] for k in range(3)]
+            lines.append(add_line(p1, p2, **kwargs))
+    return lines
+
+
+# -----------------------------------------------------------------------------
+
+
+# shape ids created with reuse=True, which are invalidated by
+# p.resetSimulation(), so use reset_simulation() instead of it
+_shape_registry = {}
+
+
+def reset_simulation(physicsClientId=0):
+    p.resetSimulation(physicsClientId=physicsClientId)
+    for key in list(_shape_registry):
+        if key[0] == physicsClientId:
+            del _shape_registry[key]
+
+
+def create_visual_shape(
+    visual_file,
+    mesh_scale=(1, 1, 1),
+    rgba_color=None,
+    reuse=False,
+    physicsClientId=0,
+):
+    key = (
+        physicsClientId,
+        "visual",
+        str(visual_file),
+        tuple(mesh_scale),
+        None if rgba_color is None else tuple(rgba_color),
+    )
+    if reuse and key in _shape_registry:
+        return _shape_registry[key]
+
+    visual_shape_id = p.createVisualShape(
+        shapeType=p.GEOM_MESH,
+        fileName=visual_file,
+        visualFramePosition=[0, 0, 0],
+        meshScale=mesh_scale,
+        rgbaColor=rgba_color,
+        physicsClientId=physicsClientId,
+    )
+    if reuse:
+        _shape_registry[key] = visual_shape_id
+    return visual_shape_id
+
+
+def create_collision_shape(
+    collision_file, mesh_scale=(1, 1, 1), reuse=False, physicsClientId=0
+):
+    key = (
+        physicsClientId,
+        "collision",
+        str(collision_file),
+        tuple(mesh_scale),
+    )
+    if reuse and key in _shape_registry:
+        return _shape_registry[key]
+
+    collision_shape_id = p.createCollisionShape(
+        shapeType=p.GEOM_MESH,
+        fileName=collision_file,
+        collisionFramePosition=[0, 0, 0],
+        meshScale=mesh_scale,
+        physicsClientId=physicsClientId,
+    )
+    if reuse:
+        _shape_registry[key] = collision_shape_id
+    return collision_shape_id
+
+
 def create_mesh_body(
     visual_file=None,
     collision_file=None,
@@ -34,6 +298,8 @@ def create_mesh_body(
     rgba_color=None,
     texture=True,
     mesh_scale=(1, 1, 1),
+    reuse_shapes=False,
+    physicsClientId=0,
 ):
     assert position is None or len(position) == 3
     assert quaternion is None or len(quaternion) == 4
@@ -45,12 +311,12 @@ def create_mesh_body(
         if visual_file is True:
             # visual_file from collision_file
             visual_file = collision_file
-        visual_shape_id = p.createVisualShape(
-            shapeType=p.GEOM_MESH,
-            fileName=visual_file,
-            visualFramePosition=[0, 0, 0],
-            meshScale=mesh_scale,
-            rgbaColor=rgba_color,
+        visual_shape_id = create_visual_shape(
+            visual_file,
+            mesh_scale=mesh_scale,
+            rgba_color=rgba_color,
+            reuse=reuse_shapes,
+            physicsClientId=physicsClientId,
         )
     if collision_file is None:
         collision_shape_id = -1
@@ -58,11 +324,11 @@ def create_mesh_body(
         if collision_file is True:
             # collision_file from visual_file
             collision_file = get_collision_file(visual_file)
-        collision_shape_id = p.createCollisionShape(
-            shapeType=p.GEOM_MESH,
-            fileName=collision_file,
-            collisionFramePosition=[0, 0, 0],
-            meshScale=mesh_scale,
+        collision_shape_id = create_collision_shape(
+            collision_file,
+            mesh_scale=mesh_scale,
+            reuse=reuse_shapes,
+            physicsClientId=physicsClientId,
         )
     unique_id = p.createMultiBody(
         baseMass=mass,
@@ -72,11 +338,19 @@ def create_mesh_body(
         basePosition=position,
         baseOrientation=quaternion,
         useMaximalCoordinates=False,
+        physicsClientId=physicsClientId,
     )
     if not texture:
-        p.changeVisualShape(unique_id, -1, textureUniqueId=-1)
+        p.changeVisualShape(
+            unique_id, -1, textureUniqueId=-1, physicsClientId=physicsClientId
+        )
     if collision_file:
-        p.addUserData(unique_id, "collision_file", collision_file)
+        p.addUserData(
+            unique_id,
+            "collision_file",
+            collision_file,
+            physicsClientId=physicsClientId,
+        )
     return unique_id
 
 
@@ -92,64 +366,99 @@ def get_collision_file(visual_file, resolution=200000):
     return collision_file
 
 
-def get_debug_visualizer_image():
-    width, height, *_ = p.getDebugVisualizerCamera()
+def get_debug_visualizer_image(physicsClientId=0):
+    width, height, *_ = p.getDebugVisualizerCamera(
+        physicsClientId=physicsClientId
+    )
     _, _, rgba, depth, segm = p.getCameraImage(
         width=width,
         height=height,
         renderer=p.ER_BULLET_HARDWARE_OPENGL,
+        physicsClientId=physicsClientId,
     )
     rgb = rgba[:, :, :3]
     depth[segm == -1] = np.nan
     return rgb, depth, segm
 
 
-def get_aabb(unique_id):
-    aabb_min, aabb_max = p.getAABB(unique_id)
+def get_aabb(unique_id, physicsClientId=0):
+    aabb_min, aabb_max = p.getAABB(unique_id, physicsClientId=physicsClientId)
     return np.array(aabb_min), np.array(aabb_max)
 
 
-def is_colliding(id1, ids2=None, distance=0):
+def get_overlapping_bodies(body, link=-1, margin=0, physicsClientId=0):
+    # bodies whose AABBs overlap with the one of the link expanded by margin,
+    # which is the broadphase before getClosestPoints
+    aabb_min, aabb_max = p.getAABB(body, link, physicsClientId=physicsClientId)
+    overlapping = p.getOverlappingObjects(
+        np.asarray(aabb_min) - max(margin, 0),
+        np.asarray(aabb_max) + max(margin, 0),
+        physicsClientId=physicsClientId,
+    )
+    if overlapping is None:
+        return set()
+    return {unique_id for unique_id, _ in overlapping}
+
+
+def is_colliding(id1, ids2=None, distance=0, physicsClientId=0):
     if ids2 is None:
-        ids2 = np.array(get_body_unique_ids())
+        ids2 = np.array(get_body_unique_ids(physicsClientId=physicsClientId))
         ids2 = ids2[ids2 != id1]
-    is_colliding = False
+
+    candidates = set()
+    for link in [-1] + get_links(id1, physicsClientId=physicsClientId):
+        candidates |= get_overlapping_bodies(
+            id1, link, margin=distance, physicsClientId=physicsClientId
+        )
+
     for id2 in ids2:
-        points = p.getClosestPoints(id1, id2, distance=distance)
+        if id2 not in candidates:
+            continue
+        points = p.getClosestPoints(
+            id1, id2, distance=distance, physicsClientId=physicsClientId
+        )
         if points:
-            is_colliding = True
-            break
-    return is_colliding
+            return True
+    return False
 
 
-def get_pose(obj, parent=None):
-    obj_to_world = pp.get_pose(obj)
+def get_pose(obj, parent=None, physicsClientId=0):
+    obj_to_world = p.getBasePositionAndOrientation(
+        obj, physicsClientId=physicsClientId
+    )
 
     if parent is None:
         obj_to_parent = obj_to_world
     else:
-        parent_to_world = pp.get_pose(parent)
+        parent_to_world = p.getBasePositionAndOrientation(
+            parent, physicsClientId=physicsClientId
+        )
         world_to_parent = pp.invert(parent_to_world)
         obj_to_parent = pp.multiply(world_to_parent, obj_to_world)
     return obj_to_parent
 
 
-def set_pose(obj, pose, parent=None):
+def set_pose(obj, pose, parent=None, physicsClientId=0):
     obj_to_parent = pose
 
     if parent is None:
         obj_to_world = obj_to_parent
     else:
-        parent_to_world = pp.get_pose(parent)
+        parent_to_world = p.getBasePositionAndOrientation(
+            parent, physicsClientId=physicsClientId
+        )
         obj_to_world = pp.multiply(parent_to_world, obj_to_parent)
-    pp.set_pose(obj, obj_to_world)
+    p.resetBasePositionAndOrientation(
+        obj, *obj_to_world, physicsClientId=physicsClientId
+    )
 
 
-def step_and_sleep(seconds=np.inf):
+def step_and_sleep(seconds=np.inf, physicsClientId=0):
+    time_step = get_time_step(physicsClientId=physicsClientId)
     for i in itertools.count():
-        p.stepSimulation()
-        time.sleep(pp.get_time_step())
-        if int(round(i * pp.get_time_step())) >= seconds:
+        p.stepSimulation(physicsClientId=physicsClientId)
+        time.sleep(time_step)
+        if int(round(i * time_step)) >= seconds:
             break
 
 
@@ -160,6 +469,7 @@ def get_camera_image(
     width,
     far=1000,
     near=0.01,
+    physicsClientId=0,
 ):
     # T_cam2world -> view_matrix
     view_matrix = T_cam2world.copy()
@@ -181,6 +491,7 @@ def get_camera_image(
         viewMatrix=view_matrix,
         projectionMatrix=projection_matrix,
         renderer=p.ER_TINY_RENDERER,
+        physicsClientId=physicsClientId,
     )
     rgb = rgba[:, :, :3]
     depth = np.asarray(depth, dtype=np.float32).reshape(height, width)
@@ -197,6 +508,7 @@ def draw_camera(
     marker_height=0.1,
     marker_color=(0, 0.9, 0.9),
     marker_width=2,
+    physicsClientId=0,
     **kwargs,
 ):
     aspect_ratio = width / height
@@ -234,11 +546,12 @@ def draw_camera(
     lines = []
     for segment in segments:
         lines.append(
-            pp.add_line(
+            add_line(
                 segment[0],
                 segment[1],
                 color=marker_color,
                 width=marker_width,
+                physicsClientId=physicsClientId,
                 **kwargs,
             )
         )
@@ -252,10 +565,13 @@ def duplicate(
     position=None,
     quaternion=None,
     mass=None,
+    physicsClientId=0,
     **kwargs,
 ):
     if visual:
-        visual_data = p.getVisualShapeData(body_id)
+        visual_data = p.getVisualShapeData(
+            body_id, physicsClientId=physicsClientId
+        )
         assert len(visual_data) == 1
         visual_file = visual_data[0][4].decode()
     else:
@@ -263,19 +579,25 @@ def duplicate(
 
     if collision:
         collision_file = p.getUserData(
-            p.getUserDataId(body_id, "collision_file")
+            p.getUserDataId(
+                body_id, "collision_file", physicsClientId=physicsClientId
+            ),
+            physicsClientId=physicsClientId,
         ).decode()
     else:
         collision_file = None
 
     if position is None:
-        position = pp.get_pose(body_id)[0]
+        position = get_pose(body_id, physicsClientId=physicsClientId)[0]
 
     if quaternion is None:
-        quaternion = pp.get_pose(body_id)[1]
+        quaternion = get_pose(body_id, physicsClientId=physicsClientId)[1]
 
     if mass is None:
-        mass = pp.get_dynamics_info(body_id).mass
+        dynamics_info = p.getDynamicsInfo(
+            body_id, -1, physicsClientId=physicsClientId
+        )
+        mass = dynamics_info[0]
 
     return create_mesh_body(
         visual_file=visual_file,
@@ -283,22 +605,29 @@ def duplicate(
         position=position,
         quaternion=quaternion,
         mass=mass,
+        physicsClientId=physicsClientId,
         **kwargs,
     )
 
 
 @contextlib.contextmanager
-def stash_objects(object_ids):
+def stash_objects(object_ids, physicsClientId=0):
     try:
-        with pp.LockRenderer(), pp.WorldSaver():
+        with LockRenderer(physicsClientId=physicsClientId), WorldSaver(
+            physicsClientId=physicsClientId
+        ):
             for obj in object_ids:
-                pp.set_pose(obj, ((0, 0, 1000), (0, 0, 0, 1)))
+                set_pose(
+                    obj,
+                    ((0, 0, 1000), (0, 0, 0, 1)),
+                    physicsClientId=physicsClientId,
+                )
             yield
     finally:
         pass
 
 
-def pause():
+def pause(physicsClientId=0):
     print(
         """
 Usage:
@@ -307,11 +636,13 @@ Usage:
 """
     )
     while True:
-        events = p.getKeyboardEvents()
+        events = p.getKeyboardEvents(physicsClientId=physicsClientId)
         if events.get(ord("n")) == p.KEY_WAS_RELEASED:
             break
         elif events.get(ord("c")) == p.KEY_WAS_RELEASED:
-            camera = pp.get_camera()
+            camera = pp.CameraInfo(
+                *p.getDebugVisualizerCamera(physicsClientId=physicsClientId)
+            )
             print(
                 f"""
 p.resetDebugVisualizerCamera(
@@ -324,10 +655,10 @@ p.resetDebugVisualizerCamera(
             )
 
 
-def annotate_pose(obj, parent=None):
+def annotate_pose(obj, parent=None, physicsClientId=0):
     print("Press keys to annotate pose of an object.")
     while True:
-        events = p.getKeyboardEvents()
+        events = p.getKeyboardEvents(physicsClientId=physicsClientId)
 
         dp = 0.0001
         dr = 0.001
@@ -339,7 +670,9 @@ def annotate_pose(obj, parent=None):
             dp *= 10
             dr *= 10
 
-        c = geometry.Coordinate(*pp.get_pose(obj))
+        c = geometry.Coordinate(
+            *get_pose(obj, physicsClientId=physicsClientId)
+        )
         if events.get(ord("k")) == p.KEY_IS_DOWN:
             c.translate([dp, 0, 0], wrt="world")
         elif events.get(ord("j")) == p.KEY_IS_DOWN:
@@ -359,7 +692,9 @@ def annotate_pose(obj, parent=None):
         elif events.get(ord("3")) == p.KEY_IS_DOWN:
             c.rotate([0, 0, dr * sign], wrt="world")
         elif events.get(ord("c")) == p.KEY_WAS_RELEASED:
-            camera = pp.get_camera()
+            camera = pp.CameraInfo(
+                *p.getDebugVisualizerCamera(physicsClientId=physicsClientId)
+            )
             print(
                 f"""
 p.resetDebugVisualizerCamera(
@@ -371,7 +706,9 @@ p.resetDebugVisualizerCamera(
 """
             )
         elif events.get(ord("p")) == p.KEY_WAS_RELEASED:
-            pose = get_pose(obj, parent=parent)
+            pose = get_pose(
+                obj, parent=parent, physicsClientId=physicsClientId
+            )
             if parent is None:
                 print(f"safepicking.pybullet.set_pose(obj, {pose})")
             else:
@@ -381,12 +718,12 @@ p.resetDebugVisualizerCamera(
                 )
         elif events.get(ord("q")) == p.KEY_WAS_RELEASED:
             break
-        pp.set_pose(obj, c.pose)
+        set_pose(obj, c.pose, physicsClientId=physicsClientId)
 
         time.sleep(1 / 240)
 
 
-def draw_points(points, colors=None, size=1):
+def draw_points(points, colors=None, size=1, physicsClientId=0):
     points = np.asarray(points)
 
     if colors is None:
@@ -418,4 +755,9 @@ def draw_points(points, colors=None, size=1):
         i = np.random.permutation(N)[:MAX_NUM_POINTS]
     else:
         i = Ellipsis
-    return p.addUserDebugPoints(points[i], colors[i], pointSize=size)
+    return p.addUserDebugPoints(
+        points[i],
+        colors[i],
+        pointSize=size,
+        physicsClientId=physicsClientId,
+    )
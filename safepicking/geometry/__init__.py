@@ -4,6 +4,8 @@ from .average_distance_auc import average_distance_auc
 
 from .coordinate import Coordinate
 
+from .depth_from_pointcloud import depth_from_pointcloud
+
 from .look_at import look_at
 
 from .normalize_vec import normalize_vec
@@ -0,0 +1,52 @@
+import numpy as np
+
+
+def depth_from_pointcloud(
+    points: np.ndarray,
+    fx: float,
+    fy: float,
+    cx: float,
+    cy: float,
+    height: int,
+    width: int,
+    labels: np.ndarray = None,
+    splat: int = 1,
+) -> tuple:
+    # z-buffer of points in camera coordinates, where each point covers
+    # (2 * splat + 1) ** 2 pixels to fill the gaps between the samples
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    if labels is None:
+        labels = np.zeros(points.shape[0], dtype=int)
+    labels = np.asarray(labels)
+
+    keep = points[:, 2] > 0
+    points = points[keep]
+    labels = labels[keep]
+
+    x, y, z = points.T
+    u = np.round(fx * x / z + cx).astype(int)
+    v = np.round(fy * y / z + cy).astype(int)
+
+    offsets = np.arange(-splat, splat + 1)
+    du, dv = np.meshgrid(offsets, offsets)
+    u = (u[:, None] + du.ravel()[None, :]).ravel()
+    v = (v[:, None] + dv.ravel()[None, :]).ravel()
+    z = np.repeat(z, du.size)
+    labels = np.repeat(labels, du.size)
+
+    inside = (0 <= u) & (u < width) & (0 <= v) & (v < height)
+    index = v[inside] * width + u[inside]
+    z = z[inside]
+    labels = labels[inside]
+
+    # the nearest point of each pixel, which is the first one sorted by
+    # pixel and then depth
+    order = np.lexsort((z, index))
+    index, first = np.unique(index[order], return_index=True)
+    nearest = order[first]
+
+    depth = np.full(height * width, np.nan, dtype=np.float32)
+    depth[index] = z[nearest]
+    segm = np.full(height * width, -1, dtype=labels.dtype)
+    segm[index] = labels[nearest]
+    return depth.reshape(height, width), segm.reshape(height, width)
@@ -2,4 +2,7 @@
 
 from .git_hash import git_hash
 
+from .profiler import Profiler
+from .profiler import profiler
+
 from .static_dict import StaticDict
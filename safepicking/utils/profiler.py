@@ -0,0 +1,104 @@
+import collections
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.trace = False
+        self._stats = collections.defaultdict(lambda: [0, 0.0, 0.0])
+        self._events = []
+
+    @contextlib.contextmanager
+    def section(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        t_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            t_end = time.perf_counter()
+            duration = t_end - t_start
+
+            stats = self._stats[name]
+            stats[0] += 1
+            stats[1] += duration
+            stats[2] = max(stats[2], duration)
+
+            if self.trace:
+                self._events.append(
+                    (name, t_start, duration, threading.get_ident())
+                )
+
+    def profile(self, func):
+        name = func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            # without the context manager, which is most of the overhead
+            if not self.enabled:
+                return func(*args, **kwargs)
+            with self.section(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    def get_stats(self):
+        stats = {}
+        for name, (count, total, max_) in self._stats.items():
+            stats[name] = dict(
+                count=count, total=total, mean=total / count, max=max_
+            )
+        return stats
+
+    def summary(self):
+        stats = sorted(
+            self.get_stats().items(),
+            key=lambda item: item[1]["total"],
+            reverse=True,
+        )
+        width = max([len("section")] + [len(name) for name, _ in stats])
+        lines = [
+            f"{'section':<{width}} {'count':>8} {'total':>10} "
+            f"{'mean':>10} {'max':>10}"
+        ]
+        for name, stats_i in stats:
+            lines.append(
+                f"{name:<{width}} {stats_i['count']:>8d} "
+                f"{stats_i['total']:>9.3f}s {stats_i['mean']:>9.4f}s "
+                f"{stats_i['max']:>9.4f}s"
+            )
+        return "\n".join(lines)
+
+    def save_trace(self, trace_file):
+        # https://docs.google.com/document/d/1CvAClvFfyA5R-PhYUmn5OOQtYMH4h6I0nSsKchNAySU  # NOQA
+        pid = os.getpid()
+        events = []
+        for name, t_start, duration, tid in self._events:
+            events.append(
+                dict(
+                    name=name,
+                    ph="X",
+                    ts=t_start * 1e6,
+                    dur=duration * 1e6,
+                    pid=pid,
+                    tid=tid,
+                )
+            )
+        with open(trace_file, "w") as f:
+            json.dump(dict(traceEvents=events), f)
+        self._events = []
+
+    def clear(self):
+        self._stats.clear()
+        self._events = []
+
+
+profiler = Profiler()